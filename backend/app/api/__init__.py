@@ -1,3 +1,3 @@
-from . import auth, chat, upload
+from . import admin, auth, chat, chat_ws, jobs, upload
 
-__all__ = ["auth", "chat", "upload"]
+__all__ = ["admin", "auth", "chat", "chat_ws", "jobs", "upload"]
@@ -0,0 +1,65 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+from typing import Literal
+from ..core.deps import get_current_admin_user, require_internal
+from ..db.database import engine, replica_router
+from ..services.diagnostics import (
+    DIAGNOSTICS_MAX_PROFILE_SECONDS, DiagnosticsBusy, memory_diagnostics, profiler, runtime_stats
+)
+
+# 只在 DIAGNOSTICS_ENABLED 时注册（见 main.py），所有接口仅限内部访问的管理员
+router = APIRouter(dependencies=[Depends(require_internal), Depends(get_current_admin_user)])
+
+GroupBy = Literal["lineno", "filename", "traceback"]
+
+@router.post("/profile", response_class=PlainTextResponse)
+async def cpu_profile(
+    seconds: float = Query(10, gt=0, le=DIAGNOSTICS_MAX_PROFILE_SECONDS),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    main_only: bool = Query(False, description="只采样事件循环所在的主线程"),
+    include_idle: bool = Query(False, description="包含空闲等待中的线程栈")
+):
+    """采样CPU profile，返回 collapsed 格式（可用 flamegraph.pl 或 speedscope 打开）
+
+    采样在后台线程进行，期间本进程照常处理请求。
+    """
+    try:
+        collapsed = await profiler.profile(seconds, interval_ms / 1000, main_only, not include_idle)
+    except DiagnosticsBusy as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return PlainTextResponse(collapsed)
+
+@router.post("/memory/start")
+async def memory_start(frames: int = Query(10, ge=1, le=100)):
+    """开始记录内存分配（tracemalloc），frames 为每次分配保留的调用栈深度"""
+    memory_diagnostics.start(frames)
+    return {"tracing": True, "frames": frames}
+
+@router.post("/memory/stop")
+async def memory_stop():
+    """停止记录内存分配并丢弃基线"""
+    memory_diagnostics.stop()
+    return {"tracing": False}
+
+@router.post("/memory/snapshot")
+async def memory_snapshot(limit: int = Query(30, ge=1, le=500), group_by: GroupBy = "lineno"):
+    """记下基线快照，返回当前占用最多的分配位置"""
+    if not memory_diagnostics.tracing:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="请先调用 /memory/start")
+    return await memory_diagnostics.snapshot(limit, group_by)
+
+@router.get("/memory/diff")
+async def memory_diff(
+    limit: int = Query(30, ge=1, le=500),
+    group_by: GroupBy = "lineno",
+    reset: bool = Query(False, description="把本次快照作为新的基线")
+):
+    """与基线快照相比增长最多的分配位置"""
+    if not memory_diagnostics.tracing or not memory_diagnostics.has_baseline:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="请先调用 /memory/start 和 /memory/snapshot")
+    return await memory_diagnostics.diff(limit, group_by, reset)
+
+@router.get("/runtime")
+async def runtime():
+    """事件循环延迟、运行中的任务、进行中的流式对话、数据库连接池和内存等实时状态"""
+    return await runtime_stats([engine, *replica_router.engines])
@@ -1,10 +1,11 @@
+import asyncio
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from ..db.database import get_db
 from ..services.auth import authenticate_user, create_access_token, create_user, get_user_by_username, get_user_by_email
 from ..schemas.user import UserCreate, UserLogin, UserResponse, Token
-from ..core.deps import get_current_active_user
+from ..core.deps import get_current_active_read_user
 from ..models.user import User
 
 router = APIRouter()
@@ -26,8 +27,11 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
             detail="邮箱已被注册"
         )
     
-    # 创建新用户
-    user = create_user(
+    # 注册后紧接着的登录和 /auth/me 在 read-your-writes 窗口内走主库，不受副本复制延迟影响
+    db.info["routing_key"] = user_data.username
+    # 创建新用户（bcrypt 哈希耗时较长，在线程池中执行）
+    user = await asyncio.to_thread(
+        create_user,
         db=db,
         username=user_data.username,
         email=user_data.email,
@@ -39,7 +43,8 @@ async def register(user_data: UserCreate, db: Session = Depends(get_db)):
 @router.post("/login", response_model=Token)
 async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)):
     """用户登录"""
-    user = authenticate_user(db, form_data.username, form_data.password)
+    # bcrypt 校验耗时较长，在线程池中执行
+    user = await asyncio.to_thread(authenticate_user, db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -57,11 +62,11 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), db: Session =
     }
 
 @router.get("/me", response_model=UserResponse)
-async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_info(current_user: User = Depends(get_current_active_read_user)):
     """获取当前用户信息"""
     return current_user
 
 @router.post("/verify")
-async def verify_token_endpoint(current_user: User = Depends(get_current_active_user)):
+async def verify_token_endpoint(current_user: User = Depends(get_current_active_read_user)):
     """验证令牌有效性"""
     return {"valid": True, "user": current_user}
@@ -1,491 +1,360 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 from fastapi.responses import StreamingResponse
-from sqlalchemy.orm import Session
-from typing import List
-from ..db.database import get_db
-from ..core.deps import get_current_active_user
+from sqlalchemy.orm import Session, defer
+from typing import AsyncIterator, List, Optional
+from ..db.database import get_db, get_read_db, mark_write
+from ..core.deps import get_current_active_user, get_current_active_read_user
 from ..models.user import User
 from ..models.chat_session import ChatSession
 from ..models.message import Message, MessageType
-from ..schemas.chat import ChatRequest, ChatResponse, ChatSessionResponse
-from ..services.qwen_vl import qwen_vl_service
-import uuid
+from ..models.archived_session import ArchivedSession
+from ..schemas.chat import ChatRequest, ChatResponse, SearchResult, SearchResponse
+from ..services.qwen_vl import (
+    qwen_vl_service, CompletionChunk, CompletionRequest, QwenAPIError,
+    build_text_request, build_image_request
+)
+from ..services.thumbnails import variant_widths
+from ..services.image_fetch import ImageFetchError
+from ..services.preprocess import load_image, speculative_preprocessor
+from ..services.prompt_cache import prompt_cache
+from ..services.model_router import ModelTier, model_router
+from ..services.diagnostics import OPEN_STREAMS
+from ..core.ids import new_id, is_valid_id
+from ..core.deadline import (
+    Deadline, DeadlineExceeded, DEADLINE_CHAT_SECONDS, deadline_scope, iterate_within, request_deadline
+)
+from ..core.metrics import Histogram
+from ..core.tracing import current_trace, span
+from ..services import storage
+from ..services.persistence import write_behind
+from ..services.retention import (
+    delete_sessions, session_upload_filenames, archived_upload_filenames, schedule_release, user_owns_upload
+)
+from ..services.archive import cached_archived_messages, rehydrate_session
+from ..services.search import parse_terms, search_messages, highlight
+from ..services.session_sync import (
+    sync_state, changes_token, decode_token, token_expired,
+    changed_sessions, deleted_sessions, record_tombstones
+)
 from datetime import datetime
+import asyncio
 import httpx
-import os
 import logging
 import json
+import time
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+CHAT_TTFT = Histogram(
+    "chat_ttft_seconds",
+    "流式对话从收到请求到第一个回复片段的时间",
+    labels=("kind", "image_source", "tier"),
+)
+
+# 回放缓存回答时每个片段的字符数
+REPLAY_CHUNK_CHARS = 16
+
+def _local_image_path(image_url):
+    """图片来自本服务上传时返回本地路径，用于图片访问的归属校验"""
+    filename = storage.resolve_upload_filename(image_url)
+    return storage.upload_path(filename) if filename else None
+
+def _authorize_image(image_url: Optional[str], current_user: User, db: Session) -> Optional[str]:
+    """本服务上传的图片须属于当前用户：带签发给该用户的签名（上传接口返回的 image_src），
+    或在该用户的会话中发送过；返回去掉签名参数的图片URL，外部图片原样返回"""
+    filename = storage.upload_filename_from_url(image_url)
+    if not filename:
+        return image_url
+    if storage.signed_media_user(image_url) != current_user.id and not user_owns_upload(db, current_user.id, filename):
+        raise HTTPException(status_code=403, detail="无权使用该图片")
+    return storage.upload_url(filename)
+
+def _authorize_request(request: ChatRequest, current_user: User, db: Session) -> ChatRequest:
+    """校验请求中的图片，返回使用规范图片URL的请求"""
+    if not request.image_url:
+        return request
+    return request.model_copy(update={"image_url": _authorize_image(request.image_url, current_user, db)})
+
+def _get_or_create_session(request: ChatRequest, current_user: User, db: Session) -> ChatSession:
+    """获取或创建会话，会话不存在时抛出404"""
+    if request.session_id:
+        if not is_valid_id(request.session_id):
+            raise HTTPException(status_code=404, detail="会话不存在")
+        session = db.query(ChatSession).filter(
+            ChatSession.id == request.session_id,
+            ChatSession.user_id == current_user.id
+        ).first()
+        if not session:
+            # 继续已归档的会话时先恢复到热表
+            session = rehydrate_session(db, request.session_id, current_user.id)
+        if not session:
+            raise HTTPException(status_code=404, detail="会话不存在")
+        return session
+    
+    # 创建新会话：即使启用了写回队列也同步提交，其他工作进程随后的请求能找到该会话
+    title = request.message[:50] + "..." if len(request.message) > 50 else request.message
+    session = ChatSession(
+        id=new_id(),
+        user_id=current_user.id,
+        title=title
+    )
+    db.add(session)
+    db.commit()
+    db.refresh(session)
+    return session
+
+def _add_user_message(request: ChatRequest, session: ChatSession, db: Session) -> Message:
+    """保存用户消息并更新会话时间"""
+    return _persist_message(session, db, {
+        "id": new_id(),
+        "chat_session_id": session.id,
+        "content": request.message,
+        "type": MessageType.user,
+        "image_url": request.image_url,
+        "image_path": _local_image_path(request.image_url)
+    })
+
+def _save_bot_message(session: ChatSession, ai_response: str, db: Session) -> Message:
+    """保存AI回复并更新会话时间"""
+    return _persist_message(session, db, {
+        "id": new_id(),
+        "chat_session_id": session.id,
+        "content": ai_response,
+        "type": MessageType.bot
+    })
+
+def _persist_message(session: ChatSession, db: Session, row: dict) -> Message:
+    """写入一条消息（或加入写回队列）并立即提交"""
+    with span("persist", type=row["type"].value):
+        now = datetime.utcnow()
+        if write_behind.enabled:
+            row["timestamp"] = now
+            write_behind.add_message(row)
+            write_behind.touch_session(session.id, now)
+            mark_write(db)
+            return Message(**row)
+        
+        message = Message(**row)
+        db.add(message)
+        # 会话有新消息即视为更新，增量同步依赖 updated_at
+        session.updated_at = now
+        db.commit()
+        return message
+
+async def _build_completion(
+    request: ChatRequest,
+    session: ChatSession,
+    user_message: Message,
+    db: Session,
+    tier: ModelTier
+) -> CompletionRequest:
+    """构建补全请求：有图片时获取并压缩图片，否则附带最近的对话历史"""
+    if request.image_url:
+        # 上传时已开始预处理的图片直接复用编码结果
+        image = await load_image(request.image_url, tier.model)
+        return build_image_request(image, request.message, tier)
+    
+    recent_messages = db.query(Message).filter(
+        Message.chat_session_id == session.id,
+        Message.id != user_message.id
+    ).order_by(Message.timestamp.desc()).limit(10).all()
+    history = [(msg.timestamp, msg.type, msg.content) for msg in reversed(recent_messages)]
+    if write_behind.enabled:
+        # 合并写回队列中尚未落库的消息
+        history.extend(
+            (row["timestamp"], row["type"], row["content"])
+            for row in write_behind.pending_messages(session.id)
+            if row["id"] != user_message.id
+        )
+        history.sort(key=lambda item: item[0])
+    history = [
+        {
+            "role": "user" if msg_type == MessageType.user else "assistant",
+            "content": content
+        }
+        for _, msg_type, content in history[-10:]
+    ]
+    return build_text_request(history, request.message, tier)
+
+async def _ttft_labels(request: ChatRequest, tier: ModelTier) -> dict:
+    if not request.image_url:
+        return {"kind": "text", "image_source": "none", "tier": tier.name}
+    # 上传时预处理过的图片（speculative）与现场下载编码（inline）分开统计
+    preprocessed = await speculative_preprocessor.has(request.image_url, tier.model)
+    return {"kind": "image", "image_source": "speculative" if preprocessed else "inline", "tier": tier.name}
+
+def timing_event(trace) -> dict:
+    """流结束时的各阶段耗时（毫秒）"""
+    return {"type": "timing", "trace_id": trace.trace_id, "total": round(trace.elapsed() * 1000, 1), "spans": trace.summary()}
+
+def _is_first_text_turn(request: ChatRequest) -> bool:
+    """新会话的纯文本首轮：没有历史和图片，回答只取决于问题本身，可以使用提示缓存"""
+    return not request.session_id and not request.image_url
+
+async def _replay_answer(answer: str) -> AsyncIterator[CompletionChunk]:
+    """把缓存的回答切成小段，按流式回复的格式发送"""
+    for start in range(0, len(answer), REPLAY_CHUNK_CHARS):
+        yield CompletionChunk(content=answer[start:start + REPLAY_CHUNK_CHARS])
+        await asyncio.sleep(0)
+
+def _error_reply(request: ChatRequest, error: Exception) -> str:
+    """把生成过程中的异常转换为展示给用户的回复"""
+    if isinstance(error, ImageFetchError):
+        return str(error)
+    if isinstance(error, QwenAPIError):
+        if request.image_url:
+            return f"图片分析失败，错误代码：{error.status_code}"
+        return f"抱歉，AI服务暂时不可用。错误代码：{error.status_code}"
+    if isinstance(error, httpx.ConnectError):
+        return f"网络连接失败：{str(error)}"
+    if isinstance(error, (httpx.TimeoutException, DeadlineExceeded)):
+        return f"请求超时：{str(error)}"
+    logger.exception("AI服务调用失败")
+    if request.image_url:
+        return f"图片处理出错：{str(error)}"
+    return f"AI服务调用失败：{str(error)}"
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat_with_ai(
     request: ChatRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    deadline: Deadline = Depends(request_deadline("chat", DEADLINE_CHAT_SECONDS))
 ):
-    """与AI进行对话"""
+    """与AI进行对话，完整回复须在请求时限内生成"""
     try:
-        # 获取或创建会话
-        if request.session_id:
-            session = db.query(ChatSession).filter(
-                ChatSession.id == request.session_id,
-                ChatSession.user_id == current_user.id
-            ).first()
-            if not session:
-                raise HTTPException(status_code=404, detail="会话不存在")
-        else:
-            # 创建新会话
-            session = ChatSession(
-                id=str(uuid.uuid4()),
-                user_id=current_user.id,
-                title=request.message[:50] + "..." if len(request.message) > 50 else request.message
-            )
-            db.add(session)
-            db.commit()
-            db.refresh(session)
-        
-        # 添加用户消息
-        user_message = Message(
-            id=str(uuid.uuid4()),
-            chat_session_id=session.id,
-            content=request.message,
-            type=MessageType.user,
-            image_url=request.image_url
-        )
-        db.add(user_message)
-        db.commit()  # 立即提交用户消息
+        request = _authorize_request(request, current_user, db)
+        session = _get_or_create_session(request, current_user, db)
+        user_message = _add_user_message(request, session, db)
         
         # 调用AI服务
-        if request.image_url:
-            # 处理图片URL - 下载并分析图片
-            try:
-                # 配置HTTP客户端，禁用SSL验证以避免证书问题
-                async with httpx.AsyncClient(
-                    timeout=30.0,
-                    verify=False,  # 禁用SSL验证
-                    follow_redirects=True
-                ) as client:
-                    # 下载图片
-                    logger.info(f"正在下载图片: {request.image_url}")
-                    image_response = await client.get(request.image_url)
-                    
-                    if image_response.status_code == 200:
-                        image_data = image_response.content
-                        logger.info(f"图片下载成功，大小: {len(image_data)} bytes")
-                        
-                        # 调用Qwen-VL进行图片分析
-                        result = await qwen_vl_service.analyze_image(
-                            image_data=image_data,
-                            prompt=request.message or "请分析这张图片的内容，用中文详细描述你看到了什么。"
-                        )
-                        
-                        if result["success"]:
-                            ai_response = result["content"]
-                        else:
-                            ai_response = f"图片分析失败：{result['error']}"
-                    else:
-                        ai_response = f"无法下载图片，状态码：{image_response.status_code}"
-                        
-            except httpx.ConnectError as e:
-                ai_response = f"网络连接失败，无法下载图片：{str(e)}"
-                logger.error(f"网络连接错误: {str(e)}")
-            except httpx.TimeoutException as e:
-                ai_response = f"下载图片超时：{str(e)}"
-                logger.error(f"超时错误: {str(e)}")
-            except Exception as e:
-                import traceback
-                error_details = traceback.format_exc()
-                logger.error(f"图片处理错误详情: {error_details}")
-                ai_response = f"图片处理出错：{str(e)}"
-        else:
-            # 调用Qwen-VL进行文本对话
-            try:
-                # 构建对话历史
-                conversation_history = []
-                recent_messages = db.query(Message).filter(
-                    Message.chat_session_id == session.id
-                ).order_by(Message.timestamp.desc()).limit(10).all()
-                
-                for msg in reversed(recent_messages):
-                    role = "user" if msg.type == MessageType.user else "assistant"
-                    conversation_history.append({
-                        "role": role,
-                        "content": msg.content
-                    })
-                
-                # 调用Qwen API进行文本对话
-                headers = {
-                    "Authorization": f"Bearer {os.getenv('QWEN_API_KEY')}",
-                    "Content-Type": "application/json"
-                }
-                
-                messages = [
-                    {"role": "system", "content": "你是一个有帮助的AI助手，请用中文回答用户的问题，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"}
-                ]
-                
-                # 添加对话历史
-                messages.extend(conversation_history[-5:])  # 只保留最近5条消息
-                
-                # 添加当前用户消息
-                messages.append({"role": "user", "content": request.message})
-                
-                data = {
-                    "model": "qwen-plus",  # 使用文本模型
-                    "messages": messages,
-                    "max_tokens": 1000,
-                    "temperature": 0.7
-                }
-                
-                async with httpx.AsyncClient(timeout=30.0) as client:
-                    response = await client.post(
-                        f"{os.getenv('QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')}/chat/completions",
-                        headers=headers,
-                        json=data
-                    )
-                    
-                    if response.status_code == 200:
-                        result = response.json()
-                        ai_response = result["choices"][0]["message"]["content"]
-                    else:
-                        ai_response = f"抱歉，AI服务暂时不可用。错误代码：{response.status_code}"
-                        
-            except Exception as e:
-                ai_response = f"AI服务调用失败：{str(e)}"
-        
-        # 添加AI回复
-        ai_message = Message(
-            id=str(uuid.uuid4()),
-            chat_session_id=session.id,
-            content=ai_response,
-            type=MessageType.bot
-        )
-        db.add(ai_message)
-        
-        # 更新会话时间
-        session.updated_at = datetime.utcnow()
+        usage = None
+        cached = prompt_cache.lookup(request.message) if _is_first_text_turn(request) else None
+        try:
+            if cached is not None:
+                ai_response = cached.answer
+            else:
+                decision = model_router.route(request.message, bool(request.image_url), current_user.tier)
+                with deadline_scope(deadline):
+                    completion = await _build_completion(request, session, user_message, db, decision.tier)
+                    result = await qwen_vl_service.complete(completion)
+                ai_response = result.content
+                usage = result.usage
+                if _is_first_text_turn(request):
+                    prompt_cache.store(request.message, ai_response)
+        except Exception as e:
+            ai_response = _error_reply(request, e)
         
-        db.commit()
+        _save_bot_message(session, ai_response, db)
         
         return ChatResponse(
             message=ai_response,
-            session_id=session.id
+            session_id=session.id,
+            usage=usage
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(status_code=500, detail=f"聊天失败: {str(e)}")
 
+async def chat_events(
+    request: ChatRequest,
+    current_user: User,
+    db: Session,
+    deadline: Optional[Deadline] = None
+) -> AsyncIterator[dict]:
+    """一轮流式对话的事件序列，SSE和WebSocket共用
+
+    依次产出 session_id、若干 chunk（或一个 error）、done；会话不存在等错误只产出 error。
+    生成中途被取消或关闭时保存已生成的部分回复。
+    请求时限（deadline）约束图片获取、预处理和上游首个片段之前的各阶段；
+    只在每次等待期间设置时限上下文，不跨越 yield（生成器可能在其他上下文中被关闭）。
+    """
+    started = time.perf_counter()
+    try:
+        try:
+            request = _authorize_request(request, current_user, db)
+            session = _get_or_create_session(request, current_user, db)
+        except HTTPException as e:
+            yield {"error": e.detail}
+            return
+        
+        # 发送会话ID
+        yield {"session_id": session.id}
+        
+        user_message = _add_user_message(request, session, db)
+        
+        # 调用AI服务；近似重复的首轮问题直接回放缓存的回答
+        ai_response = ""
+        cached = prompt_cache.lookup(request.message) if _is_first_text_turn(request) else None
+        decision = None
+        try:
+            if cached is not None:
+                ttft_labels = {"kind": "cached", "image_source": "none", "tier": "none"}
+                chunks = _replay_answer(cached.answer)
+            else:
+                decision = model_router.route(request.message, bool(request.image_url), current_user.tier)
+                ttft_labels = await _ttft_labels(request, decision.tier)
+                with deadline_scope(deadline):
+                    completion = await _build_completion(request, session, user_message, db, decision.tier)
+                # 路由只看上游首字延迟：会话写入、图片获取和预处理、排队等本地耗时不影响档位的SLO
+                tier = decision.tier
+                chunks = iterate_within(deadline, qwen_vl_service.stream_completion(
+                    completion, on_ttft=lambda ttft: model_router.observe(tier, ttft)
+                ))
+            async for chunk in chunks:
+                if chunk.content:
+                    if not ai_response:
+                        CHAT_TTFT.observe(time.perf_counter() - started, **ttft_labels)
+                    ai_response += chunk.content
+                    yield {"content": chunk.content, "type": "chunk"}
+            if cached is None and _is_first_text_turn(request):
+                prompt_cache.store(request.message, ai_response)
+        except (asyncio.CancelledError, GeneratorExit):
+            # 客户端断开或取消：保存已生成的部分
+            if ai_response:
+                _save_bot_message(session, ai_response, db)
+            raise
+        except Exception as e:
+            ai_response = _error_reply(request, e)
+            yield {"content": ai_response, "type": "error"}
+        
+        # 保存完整的AI回复到数据库
+        ai_message = _save_bot_message(session, ai_response, db)
+        
+        # 发送完成信号
+        done = {"type": "done", "message_id": ai_message.id}
+        if cached is not None:
+            done["cached"] = True
+        yield done
+        
+    except Exception as e:
+        yield {"error": f"聊天失败: {str(e)}"}
+
 @router.post("/chat/stream")
 async def chat_with_ai_stream(
     request: ChatRequest,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_db),
+    deadline: Deadline = Depends(request_deadline("chat_stream", DEADLINE_CHAT_SECONDS))
 ):
-    """与AI进行流式对话"""
+    """与AI进行流式对话，首个回复片段须在请求时限内产生"""
     
     async def generate_stream():
+        OPEN_STREAMS.inc(transport="sse")
         try:
-            # 获取或创建会话
-            if request.session_id:
-                session = db.query(ChatSession).filter(
-                    ChatSession.id == request.session_id,
-                    ChatSession.user_id == current_user.id
-                ).first()
-                if not session:
-                    yield f"data: {json.dumps({'error': '会话不存在'})}\n\n"
-                    return
-            else:
-                # 创建新会话
-                session = ChatSession(
-                    id=str(uuid.uuid4()),
-                    user_id=current_user.id,
-                    title=request.message[:50] + "..." if len(request.message) > 50 else request.message
-                )
-                db.add(session)
-                db.commit()
-                db.refresh(session)
-            
-            # 发送会话ID
-            yield f"data: {json.dumps({'session_id': session.id})}\n\n"
-            
-            # 添加用户消息
-            user_message = Message(
-                id=str(uuid.uuid4()),
-                chat_session_id=session.id,
-                content=request.message,
-                type=MessageType.user,
-                image_url=request.image_url
-            )
-            db.add(user_message)
-            db.commit()
-            
-            # 调用AI服务
-            if request.image_url:
-                # 处理图片URL - 下载并分析图片
-                try:
-                    async with httpx.AsyncClient(
-                        timeout=30.0,
-                        verify=False,
-                        follow_redirects=True
-                    ) as client:
-                        logger.info(f"正在下载图片: {request.image_url}")
-                        image_response = await client.get(request.image_url)
-                        
-                        if image_response.status_code == 200:
-                            image_data = image_response.content
-                            logger.info(f"图片下载成功，大小: {len(image_data)} bytes")
-                            
-                            # 将图片转换为base64
-                            import base64
-                            import mimetypes
-                            from PIL import Image
-                            import io
-                            
-                            # 检查图片大小，如果太大则压缩
-                            image_size_mb = len(image_data) / (1024 * 1024)
-                            print(f"原始图片大小: {image_size_mb:.2f} MB")
-                            
-                            if image_size_mb > 5:  # 如果大于5MB，进行压缩
-                                try:
-                                    # 使用PIL压缩图片
-                                    image = Image.open(io.BytesIO(image_data))
-                                    
-                                    # 计算新的尺寸，保持宽高比
-                                    max_size = 1920  # 最大尺寸
-                                    if image.width > max_size or image.height > max_size:
-                                        ratio = min(max_size / image.width, max_size / image.height)
-                                        new_width = int(image.width * ratio)
-                                        new_height = int(image.height * ratio)
-                                        image = image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                                    
-                                    # 转换为JPEG格式并压缩
-                                    output = io.BytesIO()
-                                    image.save(output, format='JPEG', quality=85, optimize=True)
-                                    image_data = output.getvalue()
-                                    output.close()
-                                    
-                                    compressed_size_mb = len(image_data) / (1024 * 1024)
-                                    print(f"压缩后图片大小: {compressed_size_mb:.2f} MB")
-                                    
-                                    # 更新MIME类型为JPEG
-                                    mime_type = 'image/jpeg'
-                                except Exception as e:
-                                    print(f"图片压缩失败: {str(e)}")
-                                    # 如果压缩失败，继续使用原始图片
-                            
-                            image_base64 = base64.b64encode(image_data).decode('utf-8')
-                            
-                            # 根据图片URL或内容检测MIME类型
-                            if request.image_url:
-                                # 从URL中检测文件扩展名
-                                if request.image_url.lower().endswith('.png'):
-                                    mime_type = 'image/png'
-                                elif request.image_url.lower().endswith('.jpg') or request.image_url.lower().endswith('.jpeg'):
-                                    mime_type = 'image/jpeg'
-                                elif request.image_url.lower().endswith('.gif'):
-                                    mime_type = 'image/gif'
-                                elif request.image_url.lower().endswith('.webp'):
-                                    mime_type = 'image/webp'
-                                else:
-                                    # 默认使用jpeg
-                                    mime_type = 'image/jpeg'
-                            else:
-                                mime_type = 'image/jpeg'
-                            
-                            print(f"=== 图片处理调试信息 ===")
-                            print(f"图片URL: {request.image_url}")
-                            print(f"检测到的MIME类型: {mime_type}")
-                            print(f"图片大小: {len(image_data)} bytes")
-                            print(f"Base64长度: {len(image_base64)}")
-                            logger.info(f"图片URL: {request.image_url}")
-                            logger.info(f"检测到的MIME类型: {mime_type}")
-                            logger.info(f"图片大小: {len(image_data)} bytes")
-                            
-                            # 构建带图片的流式请求
-                            headers = {
-                                "Authorization": f"Bearer {os.getenv('QWEN_API_KEY')}",
-                                "Content-Type": "application/json"
-                            }
-                            
-                            messages = [
-                                {
-                                    "role": "system",
-                                    "content": "你是一个专业的图像分析助手，能够准确分析图片内容并回答用户问题。请用中文回答，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"
-                                },
-                                {
-                                    "role": "user",
-                                    "content": [
-                                        {
-                                            "type": "text",
-                                            "text": request.message or "请分析这张图片的内容，用中文详细描述你看到了什么。"
-                                        },
-                                        {
-                                            "type": "image_url",
-                                            "image_url": {
-                                                "url": f"data:{mime_type};base64,{image_base64}"
-                                            }
-                                        }
-                                    ]
-                                }
-                            ]
-                            
-                            data = {
-                                "model": "qwen-vl-plus",
-                                "messages": messages,
-                                "max_tokens": 1500,
-                                "temperature": 0.7,
-                                "stream": True  # 启用流式输出
-                            }
-                            
-                            async with httpx.AsyncClient(timeout=60.0) as client:
-                                async with client.stream(
-                                    "POST",
-                                    f"{os.getenv('QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')}/chat/completions",
-                                    headers=headers,
-                                    json=data
-                                ) as response:
-                                    if response.status_code == 200:
-                                        ai_response = ""
-                                        async for line in response.aiter_lines():
-                                            if line.startswith("data: "):
-                                                data_str = line[6:]  # 移除 "data: " 前缀
-                                                if data_str.strip() == "[DONE]":
-                                                    break
-                                                try:
-                                                    chunk = json.loads(data_str)
-                                                    if "choices" in chunk and len(chunk["choices"]) > 0:
-                                                        delta = chunk["choices"][0].get("delta", {})
-                                                        if "content" in delta:
-                                                            content = delta["content"]
-                                                            ai_response += content
-                                                            yield f"data: {json.dumps({'content': content, 'type': 'chunk'})}\n\n"
-                                                except json.JSONDecodeError:
-                                                    continue
-                                    else:
-                                        # 获取详细的错误信息
-                                        try:
-                                            # 对于流式响应，我们需要先检查状态码
-                                            print(f"=== Qwen API错误详情 ===")
-                                            print(f"状态码: {response.status_code}")
-                                            print(f"响应头: {dict(response.headers)}")
-                                            
-                                            # 尝试读取响应内容
-                                            if response.status_code != 200:
-                                                try:
-                                                    error_text = await response.text()
-                                                    print(f"错误响应: {error_text}")
-                                                    logger.error(f"Qwen API错误详情: {error_text}")
-                                                    ai_response = f"图片分析失败，错误代码：{response.status_code}，详情：{error_text}"
-                                                except Exception as read_error:
-                                                    print(f"读取错误响应失败: {str(read_error)}")
-                                                    ai_response = f"图片分析失败，错误代码：{response.status_code}，无法读取详细错误信息"
-                                            else:
-                                                ai_response = f"图片分析失败，错误代码：{response.status_code}"
-                                        except Exception as e:
-                                            print(f"=== 获取错误信息失败 ===")
-                                            print(f"异常: {str(e)}")
-                                            ai_response = f"图片分析失败，错误代码：{response.status_code}"
-                                        yield f"data: {json.dumps({'content': ai_response, 'type': 'error'})}\n\n"
-                        else:
-                            ai_response = f"无法下载图片，状态码：{image_response.status_code}"
-                            yield f"data: {json.dumps({'content': ai_response, 'type': 'error'})}\n\n"
-                            
-                except Exception as e:
-                    ai_response = f"图片处理出错：{str(e)}"
-                    yield f"data: {json.dumps({'content': ai_response, 'type': 'error'})}\n\n"
-            else:
-                # 调用Qwen-VL进行文本对话
-                try:
-                    # 构建对话历史
-                    conversation_history = []
-                    recent_messages = db.query(Message).filter(
-                        Message.chat_session_id == session.id
-                    ).order_by(Message.timestamp.desc()).limit(10).all()
-                    
-                    for msg in reversed(recent_messages):
-                        role = "user" if msg.type == MessageType.user else "assistant"
-                        conversation_history.append({
-                            "role": role,
-                            "content": msg.content
-                        })
-                    
-                    # 调用Qwen API进行文本对话
-                    headers = {
-                        "Authorization": f"Bearer {os.getenv('QWEN_API_KEY')}",
-                        "Content-Type": "application/json"
-                    }
-                    
-                    messages = [
-                        {"role": "system", "content": "你是一个有帮助的AI助手，请用中文回答用户的问题，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"}
-                    ]
-                    
-                    # 添加对话历史
-                    messages.extend(conversation_history[-5:])
-                    
-                    # 添加当前用户消息
-                    messages.append({"role": "user", "content": request.message})
-                    
-                    data = {
-                        "model": "qwen-plus",
-                        "messages": messages,
-                        "max_tokens": 1000,
-                        "temperature": 0.7,
-                        "stream": True  # 启用流式输出
-                    }
-                    
-                    async with httpx.AsyncClient(timeout=60.0) as client:
-                        async with client.stream(
-                            "POST",
-                            f"{os.getenv('QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')}/chat/completions",
-                            headers=headers,
-                            json=data
-                        ) as response:
-                            if response.status_code == 200:
-                                ai_response = ""
-                                async for line in response.aiter_lines():
-                                    if line.startswith("data: "):
-                                        data_str = line[6:]  # 移除 "data: " 前缀
-                                        if data_str.strip() == "[DONE]":
-                                            break
-                                        try:
-                                            chunk = json.loads(data_str)
-                                            if "choices" in chunk and len(chunk["choices"]) > 0:
-                                                delta = chunk["choices"][0].get("delta", {})
-                                                if "content" in delta:
-                                                    content = delta["content"]
-                                                    ai_response += content
-                                                    yield f"data: {json.dumps({'content': content, 'type': 'chunk'})}\n\n"
-                                        except json.JSONDecodeError:
-                                            continue
-                            else:
-                                ai_response = f"抱歉，AI服务暂时不可用。错误代码：{response.status_code}"
-                                yield f"data: {json.dumps({'content': ai_response, 'type': 'error'})}\n\n"
-                                
-                except Exception as e:
-                    ai_response = f"AI服务调用失败：{str(e)}"
-                    yield f"data: {json.dumps({'content': ai_response, 'type': 'error'})}\n\n"
-            
-            # 保存完整的AI回复到数据库
-            ai_message = Message(
-                id=str(uuid.uuid4()),
-                chat_session_id=session.id,
-                content=ai_response,
-                type=MessageType.bot
-            )
-            db.add(ai_message)
-            
-            # 更新会话时间
-            session.updated_at = datetime.utcnow()
-            db.commit()
-            
-            # 发送完成信号
-            yield f"data: {json.dumps({'type': 'done', 'message_id': ai_message.id})}\n\n"
-            
-        except Exception as e:
-            yield f"data: {json.dumps({'error': f'聊天失败: {str(e)}'})}\n\n"
+            async for event in chat_events(request, current_user, db, deadline):
+                yield f"data: {json.dumps(event)}\n\n"
+            # 响应头中的 Server-Timing 只含生成之前的阶段，完整耗时在流末尾发送
+            trace = current_trace()
+            if trace is not None:
+                yield f"data: {json.dumps(timing_event(trace))}\n\n"
+        finally:
+            OPEN_STREAMS.dec(transport="sse")
     
     return StreamingResponse(
         generate_stream(),
@@ -499,46 +368,166 @@ async def chat_with_ai_stream(
 
 @router.get("/sessions")
 async def get_chat_sessions(
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    response: Response,
+    if_none_match: Optional[str] = Header(None),
+    current_user: User = Depends(get_current_active_read_user),
+    db: Session = Depends(get_read_db)
 ):
-    """获取用户的聊天会话列表"""
+    """获取用户的聊天会话列表
+
+    响应带ETag和同步令牌（X-Sync-Token）；列表未变化时返回304，
+    之后可用 /sessions/changes 增量获取变化。
+    """
+    etag, token = sync_state(db, current_user.id)
+    if etag:
+        headers = {"ETag": etag, "Cache-Control": "private, no-cache", "X-Sync-Token": token}
+        if if_none_match and etag in if_none_match:
+            return Response(status_code=304, headers=headers)
+        response.headers.update(headers)
+    else:
+        response.headers["X-Sync-Token"] = token
+    
     sessions = db.query(ChatSession).filter(
         ChatSession.user_id == current_user.id
     ).order_by(ChatSession.updated_at.desc()).all()
+    result = _sessions_with_messages(db, sessions)
     
-    result = []
-    for session in sessions:
-        session_data = {
-            "id": session.id,
-            "user_id": session.user_id,
-            "title": session.title,
-            "created_at": session.created_at,
-            "updated_at": session.updated_at,
-            "messages": []
-        }
-        
-        # 添加消息 - 按时间戳升序排列
-        messages = db.query(Message).filter(
-            Message.chat_session_id == session.id
-        ).order_by(Message.timestamp.asc()).all()
-        
-        for message in messages:
-            message_data = {
-                "id": message.id,
-                "chat_session_id": message.chat_session_id,
-                "content": message.content,
-                "type": message.type,
-                "image_url": message.image_url,
-                "image_path": message.image_path,
-                "timestamp": message.timestamp
-            }
-            session_data["messages"].append(message_data)
-        
+    # 已归档的会话直接展示，只有继续对话时才恢复到热表；
+    # 压缩数据延迟加载，解压结果在进程内缓存，不必每次列表请求都读取和解压
+    archived_sessions = db.query(ArchivedSession).options(
+        defer(ArchivedSession.payload)
+    ).filter(
+        ArchivedSession.user_id == current_user.id
+    ).order_by(ArchivedSession.updated_at.desc()).all()
+    for archived in archived_sessions:
+        session_data = _session_data(archived)
+        session_data["messages"] = [
+            _message_data(Message(**row), archived.user_id) for row in cached_archived_messages(archived)
+        ]
         result.append(session_data)
     
+    if write_behind.enabled:
+        _merge_pending_writes(result, current_user.id)
+    elif archived_sessions:
+        _sort_sessions(result)
+    
     return result
 
+@router.get("/sessions/changes")
+async def get_chat_session_changes(
+    since: str = Query(..., description="上次响应中的同步令牌"),
+    current_user: User = Depends(get_current_active_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """增量获取会话列表的变化：新建或更新的会话（含全部消息）和已删除会话的ID"""
+    since_time = decode_token(since)
+    if since_time is None:
+        raise HTTPException(status_code=400, detail="无效的同步令牌")
+    if token_expired(since_time):
+        # 删除记录已清理，客户端需要全量刷新
+        raise HTTPException(status_code=410, detail="同步令牌已过期，请重新加载会话列表")
+    
+    sessions = changed_sessions(db, current_user.id, since_time)
+    deleted = deleted_sessions(db, current_user.id, since_time)
+    # 令牌取自读到的数据，从落后的副本读取时下次仍会从副本已有的位置继续
+    token = changes_token(sessions, deleted)
+    result = _sessions_with_messages(db, sessions)
+    if write_behind.enabled:
+        _merge_pending_writes(result, current_user.id)
+    
+    return {
+        "token": token,
+        "sessions": result,
+        "deleted": [session_id for session_id, _ in deleted]
+    }
+
+def _sessions_with_messages(db: Session, sessions: List[ChatSession]) -> List[dict]:
+    """会话及其消息（按时间戳升序），一次查询取出全部消息"""
+    result = {session.id: _session_data(session) for session in sessions}
+    if result:
+        messages = db.query(Message).filter(
+            Message.chat_session_id.in_(list(result))
+        ).order_by(Message.chat_session_id, Message.timestamp.asc()).all()
+        for message in messages:
+            session_data = result[message.chat_session_id]
+            session_data["messages"].append(_message_data(message, session_data["user_id"]))
+    return list(result.values())
+
+def _session_data(session) -> dict:
+    return {
+        "id": session.id,
+        "user_id": session.user_id,
+        "title": session.title,
+        "created_at": session.created_at,
+        "updated_at": session.updated_at,
+        "messages": []
+    }
+
+def _message_data(message, user_id: int) -> dict:
+    return {
+        "id": message.id,
+        "chat_session_id": message.chat_session_id,
+        "content": message.content,
+        "type": message.type,
+        "image_url": message.image_url,
+        "image_path": message.image_path,
+        "image_src": storage.image_src(message.image_url, user_id),
+        "image_variants": storage.image_variants(message.image_url, variant_widths(message.image_url), user_id),
+        "timestamp": message.timestamp
+    }
+
+def _merge_pending_writes(result: List[dict], user_id: int):
+    """把写回队列中尚未落库的消息和会话更新时间合并进会话列表"""
+    for session_data in result:
+        pending_messages = write_behind.pending_messages(session_data["id"])
+        session_data["messages"].extend(
+            _message_data(Message(**row), user_id) for row in pending_messages
+        )
+        touched = write_behind.pending_touch(session_data["id"])
+        if touched:
+            session_data["updated_at"] = touched
+    _sort_sessions(result)
+
+def _sort_sessions(result: List[dict]):
+    result.sort(
+        key=lambda item: item["updated_at"] or item["created_at"] or datetime.min,
+        reverse=True
+    )
+
+@router.get("/search", response_model=SearchResponse)
+async def search_chat_messages(
+    q: str = Query(..., min_length=1, max_length=100, description="搜索关键词，空格分隔"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=50),
+    current_user: User = Depends(get_current_active_read_user),
+    db: Session = Depends(get_read_db)
+):
+    """搜索当前用户的历史消息（不包括已归档的会话）"""
+    terms = parse_terms(q)
+    if not terms:
+        raise HTTPException(status_code=400, detail="搜索关键词无效")
+    
+    # 多取一条判断是否还有下一页，避免代价较高的 COUNT
+    hits = search_messages(db, current_user.id, terms, page_size + 1, (page - 1) * page_size)
+    return SearchResponse(
+        query=q,
+        page=page,
+        page_size=page_size,
+        has_more=len(hits) > page_size,
+        results=[
+            SearchResult(
+                message_id=hit.message_id,
+                session_id=hit.session_id,
+                session_title=hit.session_title,
+                type=hit.type,
+                snippet=highlight(hit.content, terms),
+                timestamp=hit.timestamp,
+                score=hit.score
+            )
+            for hit in hits[:page_size]
+        ]
+    )
+
 @router.post("/sessions")
 async def create_chat_session(
     current_user: User = Depends(get_current_active_user),
@@ -546,7 +535,7 @@ async def create_chat_session(
 ):
     """创建新的聊天会话"""
     session = ChatSession(
-        id=str(uuid.uuid4()),
+        id=new_id(),
         user_id=current_user.id,
         title="新对话"
     )
@@ -570,15 +559,35 @@ async def delete_chat_session(
     db: Session = Depends(get_db)
 ):
     """删除聊天会话"""
-    session = db.query(ChatSession).filter(
-        ChatSession.id == session_id,
-        ChatSession.user_id == current_user.id
-    ).first()
-    
-    if not session:
+    if not is_valid_id(session_id):
         raise HTTPException(status_code=404, detail="会话不存在")
     
-    db.delete(session)
+    # 先写完队列中的数据，未落库的会话也能删除，且删除后不会再插入孤立消息
+    if write_behind.enabled:
+        await write_behind.flush()
+    
+    # 集合式删除：消息由数据库的 ON DELETE CASCADE 删除，不再逐条加载到内存
+    filenames = session_upload_filenames(db, [session_id])
+    deleted = delete_sessions(
+        db,
+        ChatSession.id == session_id,
+        ChatSession.user_id == current_user.id
+    )
+    if not deleted:
+        archived = db.query(ArchivedSession).filter(
+            ArchivedSession.id == session_id,
+            ArchivedSession.user_id == current_user.id
+        ).first()
+        if not archived:
+            db.rollback()
+            raise HTTPException(status_code=404, detail="会话不存在")
+        filenames = archived_upload_filenames([archived])
+        db.delete(archived)
+    # 记录删除，供其他客户端增量同步
+    record_tombstones(db, [(session_id, current_user.id)])
     db.commit()
     
+    # 后台释放不再被引用的图片文件
+    schedule_release(filenames)
+    
     return {"message": "会话删除成功"}
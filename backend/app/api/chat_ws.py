@@ -0,0 +1,269 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from .chat import chat_events, timing_event
+from ..core.deadline import Deadline, DEADLINE_CHAT_SECONDS, parse_timeout
+from ..core.deps import _get_user_from_token
+from ..core.tracing import TRACING_ENABLED, Trace, finish_trace, trace_scope
+from ..db.database import SessionLocal
+from ..models.user import User
+from ..schemas.chat import ChatRequest
+from ..services.diagnostics import OPEN_STREAMS
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+# 心跳间隔，连续这么多次没有收到pong则认为连接已失效
+WS_HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "15"))
+WS_MAX_MISSED_PONGS = int(os.getenv("WS_MAX_MISSED_PONGS", "2"))
+# 每个连接同时进行的对话流数量上限
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "4"))
+# 发送队列长度：客户端读得慢时队列写满，各对话流暂停读取上游
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "64"))
+# 控制消息（ready、ping/pong、cancelled、错误）的队列长度，优先于对话流事件发送；
+# 写满说明客户端只发不收，关闭连接
+WS_CONTROL_QUEUE = int(os.getenv("WS_CONTROL_QUEUE", "64"))
+WS_AUTH_TIMEOUT_SECONDS = float(os.getenv("WS_AUTH_TIMEOUT_SECONDS", "10"))
+
+# 认证失败时的关闭码（RFC 6455 策略违规）
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_HEARTBEAT_TIMEOUT = 1011
+
+
+class ControlQueueFull(Exception):
+    """控制消息队列已满"""
+
+
+class ChatConnection:
+    """一个已认证的WebSocket连接，复用同一条连接承载多个并发的对话流
+
+    客户端消息:
+      {"type": "chat", "stream_id": "...", "message": "...", "session_id": ..., "image_url": ..., "timeout": 秒}
+      {"type": "cancel", "stream_id": "..."}
+      {"type": "pong"} / {"type": "ping"}
+    服务端消息与SSE接口的事件相同（包括末尾的 timing），并带上所属的 stream_id；另有 ready、ping、pong、cancelled。
+
+    接收循环从不等待发送：对话流事件进入有界队列（背压只作用于对话流），控制消息不等待地进入
+    单独的队列并优先发送，客户端读得慢时 cancel 和心跳仍能及时处理。cancelled 可能先于
+    该流此前已排队的事件到达，客户端收到后应忽略该流的后续事件。
+    """
+
+    def __init__(self, websocket: WebSocket, user: User):
+        self.websocket = websocket
+        self.user = user
+        self.streams: Dict[str, asyncio.Task] = {}
+        self.send_queue: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE)
+        self.control_queue: asyncio.Queue = asyncio.Queue(maxsize=WS_CONTROL_QUEUE)
+        self._wakeup = asyncio.Event()
+        self.missed_pongs = 0
+
+    async def send(self, message: dict):
+        """对话流事件排队发送；队列写满时等待，从而把客户端的消费速度传递给生成端"""
+        await self.send_queue.put(message)
+        self._wakeup.set()
+
+    def control(self, message: dict):
+        """控制消息排队发送，不等待；队列已满时抛出 ControlQueueFull"""
+        try:
+            self.control_queue.put_nowait(message)
+        except asyncio.QueueFull:
+            raise ControlQueueFull() from None
+        self._wakeup.set()
+
+    async def serve(self):
+        self.control({"type": "ready", "max_streams": WS_MAX_STREAMS})
+        tasks = [
+            asyncio.create_task(self._sender()),
+            asyncio.create_task(self._receiver()),
+            asyncio.create_task(self._heartbeat()),
+        ]
+        try:
+            await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+            # 断开时取消所有进行中的对话流，已生成的部分回复会被保存
+            streams = list(self.streams.values())
+            for task in streams:
+                task.cancel()
+            await asyncio.gather(*tasks, *streams, return_exceptions=True)
+
+    async def _sender(self):
+        try:
+            while True:
+                if not self.control_queue.empty():
+                    message = self.control_queue.get_nowait()
+                elif not self.send_queue.empty():
+                    message = self.send_queue.get_nowait()
+                else:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                await self.websocket.send_json(message)
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(WS_HEARTBEAT_SECONDS)
+            if self.missed_pongs >= WS_MAX_MISSED_PONGS:
+                logger.info("WebSocket心跳超时，关闭连接: user_id=%s", self.user.id)
+                try:
+                    await self.websocket.close(code=CLOSE_HEARTBEAT_TIMEOUT)
+                except RuntimeError:
+                    pass
+                return
+            self.missed_pongs += 1
+            try:
+                self.control({"type": "ping"})
+            except ControlQueueFull:
+                return
+
+    async def _receiver(self):
+        try:
+            while True:
+                try:
+                    data = await self.websocket.receive_json()
+                except ValueError:
+                    self.control({"type": "error", "error": "消息格式错误"})
+                    continue
+                self._handle(data)
+        except WebSocketDisconnect:
+            pass
+        except ControlQueueFull:
+            logger.info("WebSocket客户端未读取控制消息，关闭连接: user_id=%s", self.user.id)
+            try:
+                await self.websocket.close(code=CLOSE_POLICY_VIOLATION)
+            except RuntimeError:
+                pass
+
+    def _handle(self, data):
+        if not isinstance(data, dict):
+            self.control({"type": "error", "error": "消息格式错误"})
+            return
+        kind = data.get("type")
+        # 客户端的任何消息都说明连接仍然存活
+        self.missed_pongs = 0
+        if kind == "pong":
+            return
+        if kind == "ping":
+            self.control({"type": "pong"})
+        elif kind == "chat":
+            self._start_stream(data)
+        elif kind == "cancel":
+            self._cancel_stream(data.get("stream_id"))
+        else:
+            self.control({"type": "error", "error": f"未知的消息类型: {kind}"})
+
+    def _start_stream(self, data: dict):
+        stream_id = data.get("stream_id")
+        if not isinstance(stream_id, str) or not stream_id:
+            self.control({"type": "error", "error": "缺少stream_id"})
+            return
+        if stream_id in self.streams:
+            self.control({"type": "error", "stream_id": stream_id, "error": "stream_id已在使用"})
+            return
+        if len(self.streams) >= WS_MAX_STREAMS:
+            self.control({
+                "type": "error", "stream_id": stream_id,
+                "error": f"同时进行的对话不能超过{WS_MAX_STREAMS}个"
+            })
+            return
+        try:
+            request = ChatRequest(**{
+                key: data.get(key) for key in ("message", "image_url", "session_id")
+                if data.get(key) is not None
+            })
+        except ValidationError:
+            self.control({"type": "error", "stream_id": stream_id, "error": "请求参数无效"})
+            return
+        deadline = Deadline.after("chat_ws", parse_timeout(data.get("timeout"), DEADLINE_CHAT_SECONDS))
+        self.streams[stream_id] = asyncio.create_task(self._run_stream(stream_id, request, deadline))
+
+    async def _run_stream(self, stream_id: str, request: ChatRequest, deadline: Deadline):
+        # 每个对话流使用独立的数据库会话，互不影响
+        db = SessionLocal()
+        db.info["routing_key"] = self.user.username
+        events = chat_events(request, self.user, db, deadline)
+        # 每个对话流单独追踪，与HTTP请求的追踪格式相同
+        trace = Trace(route="/api/chat/ws", attrs={"method": "WS"}) if TRACING_ENABLED else None
+        OPEN_STREAMS.inc(transport="ws")
+        try:
+            with trace_scope(trace):
+                async for event in events:
+                    await self.send({"stream_id": stream_id, **event})
+                if trace is not None:
+                    await self.send({"stream_id": stream_id, **timing_event(trace)})
+        finally:
+            OPEN_STREAMS.dec(transport="ws")
+            if trace is not None:
+                finish_trace(trace)
+            # 在发送时被取消的话生成器停在yield处，显式关闭以保存部分回复
+            await events.aclose()
+            db.close()
+            self.streams.pop(stream_id, None)
+
+    def _cancel_stream(self, stream_id: Optional[str]):
+        task = self.streams.get(stream_id)
+        if task is None:
+            self.control({"type": "error", "stream_id": stream_id, "error": "对话流不存在或已结束"})
+            return
+        task.cancel()
+        # 不等待对话流结束（保存部分回复），结束后再确认
+        task.add_done_callback(lambda _: self._confirm_cancelled(stream_id))
+
+    def _confirm_cancelled(self, stream_id: str):
+        try:
+            self.control({"type": "cancelled", "stream_id": stream_id})
+        except ControlQueueFull:
+            pass
+
+
+async def _authenticate(websocket: WebSocket) -> Optional[User]:
+    """连接建立时认证一次：令牌来自第一条 {"type": "auth", "token": ...} 消息
+
+    不接受查询参数中的令牌，URL会被代理和访问日志记录。
+    """
+    try:
+        data = await asyncio.wait_for(websocket.receive_json(), WS_AUTH_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, ValueError):
+        return None
+    token = data.get("token") if isinstance(data, dict) and data.get("type") == "auth" else None
+    if not isinstance(token, str) or not token:
+        return None
+
+    db = SessionLocal()
+    try:
+        user = _get_user_from_token(token, db)
+    except HTTPException:
+        return None
+    finally:
+        db.close()
+    return user if user.is_active else None
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket):
+    """多路复用的流式对话：一次认证，多个对话流并发，支持取消、心跳和背压"""
+    await websocket.accept()
+    try:
+        user = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    if user is None:
+        await websocket.send_json({"type": "error", "error": "无效的认证凭据"})
+        await websocket.close(code=CLOSE_POLICY_VIOLATION)
+        return
+
+    connection = ChatConnection(websocket, user)
+    await connection.serve()
+    try:
+        await websocket.close()
+    except RuntimeError:
+        pass
@@ -0,0 +1,108 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Any, Dict
+from ..db.database import get_db
+from ..core.deps import get_current_active_user
+from ..models.user import User
+from ..schemas.chat import ChatRequest
+from ..schemas.job import JobCreate, JobResponse
+from ..services.jobs import job_service, job_status, job_finished, ITEM_FINISHED, JOB_MAX_ITEMS
+from .chat import _authorize_image, _get_or_create_session
+import asyncio
+import json
+
+router = APIRouter()
+
+# SSE 连接空闲时发送注释行保活，避免被代理的读超时断开
+EVENTS_KEEPALIVE_SECONDS = 15
+
+def _job_response(job: Dict[str, Any]) -> JobResponse:
+    return JobResponse(
+        id=job["id"],
+        session_id=job["session_id"],
+        status=job_status(job),
+        prompt=job["prompt"],
+        created_at=job["created_at"],
+        total=len(job["items"]),
+        finished=sum(item["status"] in ITEM_FINISHED for item in job["items"]),
+        items=job["items"]
+    )
+
+def _authorize_images(image_urls, current_user: User, db: Session):
+    """每张图片都须可由当前用户使用（见 chat._authorize_image），返回去掉签名参数的图片URL"""
+    return [_authorize_image(image_url, current_user, db) for image_url in image_urls]
+
+async def _get_job(job_id: str, current_user: User) -> Dict[str, Any]:
+    job = await job_service.get(job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="任务不存在或已过期")
+    return job
+
+@router.post("", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_job(
+    request: JobCreate,
+    current_user: User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """提交图片分析任务，立即返回任务ID；每张图片的结果作为一条消息写入会话"""
+    image_urls = [url.strip() for url in request.image_urls if url.strip()]
+    if not image_urls:
+        raise HTTPException(status_code=400, detail="至少需要一张图片")
+    if len(image_urls) > JOB_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"每个任务最多{JOB_MAX_ITEMS}张图片")
+    image_urls = _authorize_images(image_urls, current_user, db)
+
+    title = request.prompt or f"图片分析（{len(image_urls)}张）"
+    session = _get_or_create_session(
+        ChatRequest(message=title, session_id=request.session_id), current_user, db
+    )
+    job = await job_service.submit(
+        current_user.id, current_user.username, current_user.tier, session.id, request.prompt, image_urls
+    )
+    return _job_response(job)
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """查询任务进度"""
+    return _job_response(await _get_job(job_id, current_user))
+
+@router.delete("/{job_id}", response_model=JobResponse)
+async def cancel_job(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """取消任务：尚未开始的图片不再处理，正在处理的图片会完成"""
+    await _get_job(job_id, current_user)
+    await job_service.cancel(job_id)
+    return _job_response(await _get_job(job_id, current_user))
+
+@router.get("/{job_id}/events")
+async def job_events(job_id: str, current_user: User = Depends(get_current_active_user)):
+    """订阅任务进度（SSE）：先发送当前状态，之后每张图片状态变化时发送一次，任务结束时发送done"""
+    await _get_job(job_id, current_user)
+
+    async def generate():
+        # 先订阅再读取快照，避免错过两者之间的事件
+        async with job_service.subscribe(job_id) as events:
+            job = await job_service.get(job_id, current_user.id)
+            if job is None:
+                return
+            yield f"data: {json.dumps({'type': 'snapshot', 'job': _job_response(job).model_dump()})}\n\n"
+            while not job_finished(job):
+                try:
+                    event = await asyncio.wait_for(events.get(), EVENTS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"data: {json.dumps(event)}\n\n"
+                job = await job_service.get(job_id, current_user.id)
+                if job is None:
+                    return
+            yield f"data: {json.dumps({'type': 'done', 'status': job_status(job)})}\n\n"
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",  # nginx 不缓冲进度事件
+        }
+    )
@@ -1,14 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
-from ..core.deps import get_current_active_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, UploadFile, File
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+from typing import Optional
+from ..db.database import get_db
+from ..core.deps import get_current_active_user, get_media_user_id
 from ..models.user import User
 from ..schemas.upload import ImageUploadResponse
+from ..services import storage
+from ..services.image_processing import VARIANT_WIDTHS
+from ..services.thumbnails import ensure_variant, schedule_variants
+from ..services.preprocess import schedule_preprocess
+from ..services.model_router import model_router
+from ..services.retention import user_owns_upload
+import asyncio
+import mimetypes
 import os
-import uuid
 from PIL import Image
 import io
 
 router = APIRouter()
 
+# 上传文件访问路由，挂载在 /uploads 下
+files_router = APIRouter()
+
+# 内容寻址文件内容永不改变，可长期缓存；需要认证，所以只允许浏览器私有缓存
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+def _verify_and_save(content: bytes) -> str:
+    """校验图片并保存，返回文件名；解码和写文件较慢，在线程池中执行"""
+    try:
+        image = Image.open(io.BytesIO(content))
+        image_format = image.format
+        image.verify()
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的图片文件")
+    # 按内容哈希保存文件，扩展名取自实际图片格式
+    return storage.save_upload(content, image_format)
+
 @router.post("/image", response_model=ImageUploadResponse)
 async def upload_image(
     file: UploadFile = File(...),
@@ -27,33 +55,18 @@ async def upload_image(
         # 读取文件内容
         content = await file.read()
         
-        # 验证图片格式
-        try:
-            image = Image.open(io.BytesIO(content))
-            image.verify()
-        except Exception:
-            raise HTTPException(status_code=400, detail="无效的图片文件")
-        
-        # 生成唯一文件名
-        file_extension = os.path.splitext(file.filename)[1] if file.filename else '.jpg'
-        filename = f"{uuid.uuid4()}{file_extension}"
-        
-        # 确保上传目录存在
-        upload_dir = "uploads"
-        os.makedirs(upload_dir, exist_ok=True)
-        
-        # 保存文件
-        file_path = os.path.join(upload_dir, filename)
-        with open(file_path, "wb") as f:
-            f.write(content)
-        
-        # 返回文件URL - 使用完整URL
-        image_url = f"http://localhost:8000/uploads/{filename}"
+        # 验证图片格式并保存
+        filename = await asyncio.to_thread(_verify_and_save, content)
+        # 后台预生成聊天记录使用的缩略图
+        schedule_variants(filename)
+        # 用户通常几秒后才发送消息，提前把图片编码为模型输入
+        schedule_preprocess(filename, content, model_router.predict("", True, current_user.tier).model)
         
         return ImageUploadResponse(
             success=True,
-            image_url=image_url,
-            image_path=file_path
+            image_url=storage.upload_url(filename),
+            image_src=storage.media_url(filename, current_user.id),
+            image_path=storage.upload_path(filename)
         )
         
     except HTTPException:
@@ -85,3 +98,50 @@ async def process_image_url(
             "success": False,
             "error": f"处理失败: {str(e)}"
         }
+
+
+@files_router.get("/{filename}")
+async def serve_upload(
+    filename: str,
+    request: Request,
+    w: Optional[int] = Query(None, description="缩略图宽度（像素）"),
+    user_id: int = Depends(get_media_user_id),
+    db: Session = Depends(get_db)
+):
+    """访问上传的图片或其缩略图：校验归属后交给nginx发送文件
+
+    访问URL由会话列表签发（storage.media_url），到期时间按时段取整，同一时段内保持不变，浏览器可长期缓存。
+    """
+    if not storage.is_safe_filename(filename):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    # 只有在自己的会话中发送过该图片的用户才能访问（按文件名的等值索引查询）
+    owned = user_owns_upload(db, user_id, filename)
+    file_path = storage.upload_path(filename)
+    if not owned or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="文件不存在")
+    
+    if w is not None and w not in VARIANT_WIDTHS:
+        raise HTTPException(status_code=400, detail=f"不支持的缩略图尺寸，可选: {list(VARIANT_WIDTHS)}")
+    
+    headers = {}
+    digest = storage.content_hash(filename)
+    if digest:
+        etag = f'"{digest}_w{w}"' if w else f'"{digest}"'
+        headers = {"ETag": etag, "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers=headers)
+    
+    if w:
+        # 缩略图按需生成并缓存
+        file_path = await ensure_variant(filename, w)
+        relative_path = f"variants/{storage.variant_filename(filename, w)}"
+    else:
+        relative_path = filename
+    
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    if storage.X_ACCEL_ENABLED:
+        # 由nginx通过sendfile发送文件内容
+        headers["X-Accel-Redirect"] = f"{storage.X_ACCEL_PREFIX}{relative_path}"
+        return Response(media_type=media_type, headers=headers)
+    return FileResponse(file_path, media_type=media_type, headers=headers)
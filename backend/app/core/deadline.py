@@ -0,0 +1,146 @@
+import asyncio
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import AsyncIterable, AsyncIterator, Awaitable, Optional, TypeVar
+
+from fastapi import Request
+
+from .metrics import Counter, Histogram
+from .tracing import record_span
+
+T = TypeVar("T")
+
+# 客户端用此请求头（秒）缩短时限，不能超过路由的默认时限
+DEADLINE_HEADER = "X-Request-Timeout"
+# 对话到首个回复片段的默认时限，需小于 nginx 的 proxy_read_timeout（60s）
+DEADLINE_CHAT_SECONDS = float(os.getenv("DEADLINE_CHAT_SECONDS", "55"))
+
+DEADLINE_EXCEEDED = Counter(
+    "deadline_exceeded_total",
+    "请求时限在各阶段耗尽的次数（stage: image_fetch, preprocess, upstream_queue, upstream_connect, first_token, generation）",
+    labels=("route", "stage"),
+)
+DEADLINE_STAGE_SECONDS = Histogram(
+    "deadline_stage_seconds",
+    "有时限的请求在各阶段消耗的时间",
+    labels=("route", "stage"),
+)
+
+
+class DeadlineExceeded(Exception):
+    """请求时限在某个阶段耗尽，剩余的工作不再执行"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        super().__init__(f"{stage} 阶段超出请求时限")
+
+
+@dataclass(frozen=True)
+class Deadline:
+    route: str
+    expires_at: float  # time.monotonic()
+
+    @classmethod
+    def after(cls, route: str, seconds: float) -> "Deadline":
+        return cls(route=route, expires_at=time.monotonic() + seconds)
+
+    def remaining(self) -> float:
+        return self.expires_at - time.monotonic()
+
+
+_current: contextvars.ContextVar[Optional[Deadline]] = contextvars.ContextVar("deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]):
+    """在当前上下文（及其创建的任务）中生效的请求时限"""
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+async def iterate_within(deadline: Optional[Deadline], iterable: AsyncIterable[T]) -> AsyncIterator[T]:
+    """逐个取出异步迭代器的元素，取值期间在时限上下文中
+
+    在异步生成器中不能用 deadline_scope 包住 yield：客户端断开时生成器在另一个上下文中被关闭，
+    ContextVar.reset 会失败。这里每次取值时设置、取到后即恢复，不跨越 yield。
+    """
+    iterator = aiter(iterable)
+    try:
+        while True:
+            with deadline_scope(deadline):
+                try:
+                    item = await anext(iterator)
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        if hasattr(iterator, "aclose"):
+            await iterator.aclose()
+
+
+def parse_timeout(value, default: float) -> float:
+    """客户端请求的时限，无效或超过默认值时取默认值"""
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return default
+    return min(seconds, default) if seconds > 0 else default
+
+
+def request_deadline(route: str, default: float):
+    """FastAPI依赖：按请求头和路由默认值计算本次请求的时限"""
+
+    async def dependency(request: Request) -> Deadline:
+        return Deadline.after(route, parse_timeout(request.headers.get(DEADLINE_HEADER), default))
+
+    return dependency
+
+
+def stage_timeout(stage: str, cap: Optional[float] = None) -> Optional[float]:
+    """阶段可用的时间：剩余时限与阶段自身上限中较小者；时限已耗尽时直接失败"""
+    deadline = current_deadline()
+    if deadline is None:
+        return cap
+    remaining = deadline.remaining()
+    if remaining <= 0:
+        DEADLINE_EXCEEDED.inc(route=deadline.route, stage=stage)
+        raise DeadlineExceeded(stage)
+    return remaining if cap is None else min(cap, remaining)
+
+
+async def within(stage: str, awaitable: Awaitable[T], cap: Optional[float] = None) -> T:
+    """在剩余时限内等待一个阶段完成，超出时限抛出DeadlineExceeded
+
+    只超出阶段自身上限（cap）时仍抛出 asyncio.TimeoutError，与原先的行为一致。
+    阶段耗时同时记入当前请求的追踪。
+    """
+    deadline = current_deadline()
+    try:
+        timeout = stage_timeout(stage, cap)
+    except DeadlineExceeded:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+    started = time.perf_counter()
+    try:
+        return await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        if deadline is not None and deadline.remaining() <= 0:
+            DEADLINE_EXCEEDED.inc(route=deadline.route, stage=stage)
+            raise DeadlineExceeded(stage) from None
+        raise
+    finally:
+        elapsed = time.perf_counter() - started
+        record_span(stage, started, elapsed)
+        if deadline is not None:
+            DEADLINE_STAGE_SECONDS.observe(elapsed, route=deadline.route, stage=stage)
@@ -1,19 +1,31 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, Query, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from typing import Optional
+import hmac
+import ipaddress
+import os
 from sqlalchemy.orm import Session
-from ..db.database import get_db
+from ..db.database import SessionLocal, get_db, get_read_db, is_replica_session
+from ..services import storage
 from ..services.auth import verify_token, get_user_by_username
 from ..models.user import User
+from .tracing import span
+
+# 可访问诊断接口的管理员用户名，逗号分隔
+ADMIN_USERNAMES = {
+    name.strip() for name in os.getenv("ADMIN_USERNAMES", "admin").split(",") if name.strip()
+}
+
+# 运维接口（/metrics、诊断）的访问令牌；未配置时只允许内网直接访问
+INTERNAL_API_TOKEN = os.getenv("INTERNAL_API_TOKEN", "")
 
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """获取当前认证用户"""
-    token = credentials.credentials
-    payload = verify_token(token)
+def _get_user_from_token(token: str, db: Session) -> User:
+    """根据令牌获取用户"""
+    with span("jwt_verify"):
+        payload = verify_token(token)
     
     if payload is None:
         raise HTTPException(
@@ -30,7 +42,8 @@ def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    user = get_user_by_username(db, username=username)
+    with span("user_lookup"):
+        user = get_user_by_username(db, username=username)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -40,8 +53,95 @@ def get_current_user(
     
     return user
 
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    """获取当前认证用户"""
+    return _get_user_from_token(credentials.credentials, db)
+
 def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
     """获取当前活跃用户"""
     if not current_user.is_active:
         raise HTTPException(status_code=400, detail="用户已被禁用")
     return current_user
+
+def get_current_admin_user(current_user: User = Depends(get_current_active_user)) -> User:
+    """获取当前管理员用户"""
+    if current_user.username not in ADMIN_USERNAMES:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="需要管理员权限")
+    return current_user
+
+def _is_internal_address(host: Optional[str]) -> bool:
+    try:
+        address = ipaddress.ip_address(host or "")
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+def require_internal(
+    request: Request,
+    x_internal_token: Optional[str] = Header(None, description="运维接口访问令牌（INTERNAL_API_TOKEN）")
+):
+    """运维接口只允许内部访问
+
+    配置了 INTERNAL_API_TOKEN 时须带 X-Internal-Token 头；未配置时只接受来自本机或内网、
+    且未经 nginx 转发（没有 X-Forwarded-For）的请求，经 nginx 到达的外部请求一律拒绝。
+    """
+    if INTERNAL_API_TOKEN:
+        if x_internal_token and hmac.compare_digest(x_internal_token, INTERNAL_API_TOKEN):
+            return
+    elif "x-forwarded-for" not in request.headers and _is_internal_address(request.client and request.client.host):
+        return
+    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="仅限内部访问")
+
+def get_current_read_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_read_db)
+) -> User:
+    """获取当前认证用户（只读请求，可能从只读副本查询）"""
+    try:
+        return _get_user_from_token(credentials.credentials, db)
+    except HTTPException as e:
+        if e.status_code != status.HTTP_401_UNAUTHORIZED or not is_replica_session(db):
+            raise
+    # 副本上还没有复制到的新用户（如其他进程刚注册的）回退主库再查一次
+    primary = SessionLocal()
+    try:
+        return _get_user_from_token(credentials.credentials, primary)
+    finally:
+        primary.close()
+
+def get_current_active_read_user(current_user: User = Depends(get_current_read_user)) -> User:
+    """获取当前活跃用户（只读请求）"""
+    if not current_user.is_active:
+        raise HTTPException(status_code=400, detail="用户已被禁用")
+    return current_user
+
+def get_media_user_id(
+    filename: str,
+    u: Optional[int] = Query(None, description="签名对应的用户ID"),
+    e: Optional[int] = Query(None, description="签名的到期时间（Unix时间戳）"),
+    sig: Optional[str] = Query(None, description="访问签名"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> int:
+    """获取媒体请求的用户ID
+
+    <img> 标签无法携带 Authorization 头，使用会话列表返回的带签名URL（u、e、sig，见 storage.media_url），
+    URL 中不出现访问令牌；API 客户端也可以用 Authorization 头认证。
+    """
+    if u is not None and sig:
+        if e is None or not storage.verify_media_signature(filename, u, e, sig):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="访问签名无效或已过期")
+        return u
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="未提供认证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user = _get_user_from_token(credentials.credentials, db)
+    if not user.is_active:
+        raise HTTPException(status_code=400, detail="用户已被禁用")
+    return user.id
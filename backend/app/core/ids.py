@@ -0,0 +1,46 @@
+import os
+import threading
+import time
+import uuid
+
+# 同一毫秒内生成多个ID时递增的12位计数器，保证单进程内ID单调递增
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """生成按时间排序的UUIDv7（RFC 9562）：48位毫秒时间戳 + 随机数"""
+    global _last_ms, _counter
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF  # 留出递增空间
+        else:
+            _counter += 1
+            if _counter > 0xFFF:
+                # 计数器溢出时借用下一毫秒
+                _last_ms += 1
+                _counter = 0
+        timestamp_ms, counter = _last_ms, _counter
+
+    value = (timestamp_ms & 0xFFFFFFFFFFFF) << 80
+    value |= 0x7 << 76  # 版本号
+    value |= counter << 64
+    value |= 0b10 << 62  # RFC 4122 变体
+    value |= int.from_bytes(os.urandom(8), "big") & 0x3FFFFFFFFFFFFFFF
+    return uuid.UUID(int=value)
+
+
+def new_id() -> str:
+    """生成会话/消息ID，对外仍是标准UUID字符串"""
+    return str(uuid7())
+
+
+def is_valid_id(value: str) -> bool:
+    try:
+        uuid.UUID(value)
+    except (ValueError, TypeError, AttributeError):
+        return False
+    return True
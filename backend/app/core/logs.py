@@ -0,0 +1,218 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, List, Optional, Tuple
+
+from .metrics import Counter
+from .tracing import current_trace
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# text: 便于本地阅读；json: 每行一个JSON对象，便于日志系统解析
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+# 队列写满时丢弃新日志而不是阻塞请求
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# 按logger抽样（保留比例）和限速（每秒条数），如 "app.services.image_fetch=0.1,uvicorn.access=0.5"；
+# 子logger继承最近的上级配置，WARNING及以上的日志不受影响
+LOG_SAMPLING = os.getenv("LOG_SAMPLING", "")
+LOG_RATE_LIMIT = os.getenv("LOG_RATE_LIMIT", "sqlalchemy.engine=50")
+# 输出每条SQL（经由日志队列和限速，而不是引擎 echo 的同步输出）
+SQL_ECHO = os.getenv("SQL_ECHO", "False").lower() == "true"
+
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "未输出的日志（reason: sampled 抽样丢弃, rate_limited 超出限速, queue_full 队列已满）",
+    labels=("logger", "reason"),
+)
+
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(trace_id)s] %(message)s"
+
+
+def parse_logger_config(raw: str) -> Dict[str, float]:
+    """解析 "logger=数值,..." 格式的配置，忽略无效项"""
+    result = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        try:
+            result[name.strip()] = float(value)
+        except ValueError:
+            continue
+    return result
+
+
+class _TokenBucket:
+    def __init__(self, rate: float):
+        self.rate = rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class SamplingFilter(logging.Filter):
+    """按logger名称抽样和限速，只作用于 WARNING 以下的日志
+
+    抽样按记录序号确定性地保留（比例0.1即每10条保留1条），不使用随机数。
+    """
+
+    def __init__(self, sampling: Dict[str, float], rate_limits: Dict[str, float]):
+        super().__init__()
+        self.sampling = sampling
+        self.rate_limits = rate_limits
+        self._resolved: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._counters: Dict[str, float] = {}
+        self._buckets = {name: _TokenBucket(rate) for name, rate in rate_limits.items()}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _match(name: str, config: Dict[str, float]) -> Optional[str]:
+        """最近的上级logger配置"""
+        while name:
+            if name in config:
+                return name
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        resolved = self._resolved.get(record.name)
+        if resolved is None:
+            resolved = self._resolved[record.name] = (
+                self._match(record.name, self.sampling), self._match(record.name, self.rate_limits)
+            )
+        sample_key, rate_key = resolved
+        with self._lock:
+            if sample_key is not None:
+                # 累加保留比例，跨过整数时保留本条
+                before = self._counters.get(sample_key, 0.0)
+                after = self._counters[sample_key] = before + self.sampling[sample_key]
+                if int(after) == int(before):
+                    LOG_RECORDS_DROPPED.inc(logger=sample_key, reason="sampled")
+                    return False
+            if rate_key is not None and not self._buckets[rate_key].take():
+                LOG_RECORDS_DROPPED.inc(logger=rate_key, reason="rate_limited")
+                return False
+        return True
+
+
+class ContextFilter(logging.Filter):
+    """在调用线程中记下请求上下文（trace_id），格式化在后台线程进行时上下文已不可用"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = current_trace()
+        record.trace_id = trace.trace_id if trace is not None else "-"
+        return True
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """把日志记录放入内存队列，由后台线程格式化和输出
+
+    与标准 QueueHandler 不同，不在调用线程中格式化消息（同进程内的队列无需序列化），
+    队列写满时丢弃并计数，不阻塞也不向stderr输出错误。
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            LOG_RECORDS_DROPPED.inc(logger=record.name, reason="queue_full")
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        trace_id = getattr(record, "trace_id", "-")
+        if trace_id != "-":
+            data["trace_id"] = trace_id
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class _TextFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        if not hasattr(record, "trace_id"):
+            record.trace_id = "-"
+        return super().format(record)
+
+
+_listeners: List[Tuple[NonBlockingQueueHandler, QueueListener]] = []
+
+
+def async_handler(target: logging.Handler, filters: Tuple[logging.Filter, ...] = ()) -> QueueHandler:
+    """把一个（可能阻塞的）handler 放到后台线程中执行，返回供logger使用的非阻塞handler"""
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    for log_filter in filters:
+        handler.addFilter(log_filter)
+    listener = QueueListener(handler.queue, target, respect_handler_level=True)
+    listener.start()
+    _listeners.append((handler, listener))
+    return handler
+
+
+def configure_logging():
+    """应用的日志配置：根logger经内存队列异步输出到stdout，按配置抽样和限速
+
+    uvicorn 的日志也改为经由根logger输出。可重复调用，只生效一次。
+    """
+    root = logging.getLogger()
+    if any(isinstance(handler, NonBlockingQueueHandler) for handler in root.handlers):
+        return
+    console = logging.StreamHandler(sys.stdout)
+    console.setFormatter(JSONFormatter() if LOG_FORMAT == "json" else _TextFormatter(TEXT_FORMAT))
+    handler = async_handler(console, (
+        SamplingFilter(parse_logger_config(LOG_SAMPLING), parse_logger_config(LOG_RATE_LIMIT)),
+        ContextFilter(),
+    ))
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+
+    for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+        uvicorn_logger = logging.getLogger(name)
+        uvicorn_logger.handlers.clear()
+        uvicorn_logger.propagate = True
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO if SQL_ECHO else logging.WARNING)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """输出队列中剩余的日志并停止后台线程"""
+    while _listeners:
+        _, listener = _listeners.pop()
+        listener.stop()
+
+
+def reinit_after_fork():
+    """预加载（gunicorn preload_app）的应用 fork 出工作进程后调用
+
+    fork 不复制后台线程：为每个队列换上新的队列（丢弃父进程中尚未输出的记录，避免每个进程各输出一遍）
+    并重新启动输出线程。
+    """
+    for handler, listener in _listeners:
+        handler.queue = listener.queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        listener._thread = None
+        listener.start()
@@ -0,0 +1,289 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from .workers import worker_id
+
+logger = logging.getLogger(__name__)
+
+# 延迟类指标的默认分桶（秒）
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 0.75, 1.0, 1.5, 2.0, 3.0, 5.0, 8.0, 13.0, 20.0, 30.0)
+
+# 多个工作进程时，各进程定期把指标写入此目录，/metrics 输出所有进程的汇总（由 gunicorn.conf.py 设置）
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR", "")
+METRICS_SNAPSHOT_INTERVAL = float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "5"))
+
+_registry: List["_Metric"] = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.label_names):
+            raise ValueError(f"{self.name} 需要标签 {self.label_names}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.label_names)
+
+    def render(self, others: Sequence[List[Any]] = ()) -> List[str]:
+        """输出本进程的值，others 为其他工作进程导出（export）的值，按指标类型合并"""
+        values = self._snapshot()
+        for exported in others:
+            for key, value in exported:
+                key = tuple(key)
+                values[key] = self._combine(values[key], value) if key in values else value
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples(values))
+        return lines
+
+    def export(self) -> List[Any]:
+        """可序列化为JSON的当前值，供其他工作进程合并"""
+        return [[list(key), value] for key, value in self._snapshot().items()]
+
+    def _snapshot(self) -> Dict[Tuple[str, ...], Any]:
+        raise NotImplementedError
+
+    def _combine(self, left, right):
+        raise NotImplementedError
+
+    def _samples(self, values: Dict[Tuple[str, ...], Any]) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """单调递增的计数"""
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _combine(self, left: float, right: float) -> float:
+        return left + right
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Gauge(_Metric):
+    """可增可减的当前值
+
+    多个工作进程时按 aggregate 合并：sum（进行中的请求数等）或 max（各进程各自估计的同一个量，如延迟p95）。
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (), aggregate: str = "sum"):
+        super().__init__(name, documentation, labels)
+        self.aggregate = aggregate
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _snapshot(self) -> Dict[Tuple[str, ...], float]:
+        with self._lock:
+            return dict(self._values)
+
+    def _combine(self, left: float, right: float) -> float:
+        return max(left, right) if self.aggregate == "max" else left + right
+
+    def _samples(self, values: Dict[Tuple[str, ...], float]) -> List[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {_format_value(value)}"
+            for key, value in sorted(values.items())
+        ]
+
+
+class Histogram(_Metric):
+    """分桶统计，输出累计桶、总和与次数"""
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # 每个标签组合: [各桶计数..., +Inf桶计数], 总和
+        self._counts: Dict[Tuple[str, ...], List[int]] = {}
+        self._sums: Dict[Tuple[str, ...], float] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+            counts[index] += 1
+            self._sums[key] = self._sums.get(key, 0.0) + value
+
+    def count(self, **labels) -> int:
+        return sum(self._counts.get(self._key(labels), ()))
+
+    def sum(self, **labels) -> float:
+        return self._sums.get(self._key(labels), 0.0)
+
+    def _snapshot(self) -> Dict[Tuple[str, ...], List[Any]]:
+        with self._lock:
+            return {key: [list(counts), self._sums[key]] for key, counts in self._counts.items()}
+
+    def _combine(self, left: List[Any], right: List[Any]) -> List[Any]:
+        return [[a + b for a, b in zip(left[0], right[0])], left[1] + right[1]]
+
+    def _samples(self, values: Dict[Tuple[str, ...], List[Any]]) -> List[str]:
+        lines = []
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def _snapshot_path(worker: str) -> str:
+    return os.path.join(METRICS_MULTIPROC_DIR, f"worker-{worker}.json")
+
+
+def write_snapshot():
+    """把本进程的指标写入 METRICS_MULTIPROC_DIR（先写临时文件再原子替换）"""
+    with _registry_lock:
+        metrics = list(_registry)
+    data = {metric.name: metric.export() for metric in metrics}
+    path = _snapshot_path(worker_id())
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def remove_snapshot(worker: str):
+    """工作进程退出后删除它的快照，其进行中的数量等不再计入汇总"""
+    if not METRICS_MULTIPROC_DIR:
+        return
+    try:
+        os.remove(_snapshot_path(worker))
+    except FileNotFoundError:
+        pass
+
+
+def _other_snapshots() -> List[Dict[str, List[Any]]]:
+    own = os.path.basename(_snapshot_path(worker_id()))
+    snapshots = []
+    for name in os.listdir(METRICS_MULTIPROC_DIR):
+        if not name.startswith("worker-") or not name.endswith(".json") or name == own:
+            continue
+        try:
+            with open(os.path.join(METRICS_MULTIPROC_DIR, name), encoding="utf-8") as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def render() -> str:
+    """全部指标的 Prometheus 文本格式；多进程时合并其他工作进程最近一次写入的快照"""
+    with _registry_lock:
+        metrics = list(_registry)
+    others = _other_snapshots() if METRICS_MULTIPROC_DIR else []
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render([snapshot[metric.name] for snapshot in others if metric.name in snapshot]))
+    return "\n".join(lines) + "\n"
+
+
+class SnapshotWriter:
+    """多进程模式下定期写入本进程的指标快照"""
+
+    def __init__(self, directory: str, interval: float = 5.0):
+        self.directory = directory
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self.directory and self._task is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.to_thread(write_snapshot)
+            except Exception:
+                logger.warning("写入指标快照失败", exc_info=True)
+            await asyncio.sleep(self.interval)
+
+
+snapshot_writer = SnapshotWriter(METRICS_MULTIPROC_DIR, METRICS_SNAPSHOT_INTERVAL)
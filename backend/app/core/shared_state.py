@@ -0,0 +1,248 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # 未安装时只能使用进程内实现
+    aioredis = None
+
+from .metrics import Counter
+from .workers import WEB_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+# 工作进程之间共享的状态：配置了 redis:// 地址时使用 Redis，否则为进程内实现（只在单进程时一致）
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", os.getenv("REDIS_URL", ""))
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "chatbot:")
+# 等待发出的广播消息上限，超出时丢弃
+SHARED_STATE_OUTBOX_SIZE = int(os.getenv("SHARED_STATE_OUTBOX_SIZE", "10000"))
+
+BROADCASTS = Counter(
+    "shared_state_broadcasts_total",
+    "工作进程间的广播消息（result: sent 已发出, received 已应用, dropped 队列已满, failed 发送或处理失败）",
+    labels=("channel", "result"),
+)
+
+Handler = Callable[[Any], None]
+
+
+class InMemoryStore:
+    """进程内实现，单进程部署和测试使用；多个工作进程时各自独立"""
+
+    shared = False
+
+    def __init__(self):
+        self._leases: Dict[str, float] = {}
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        now = time.monotonic()
+        if self._leases.get(name, 0.0) > now:
+            return False
+        self._leases[name] = now + ttl
+        return True
+
+    # 没有其他进程需要通知或读取，不提供 publish / subscribe / get / set
+
+    async def close(self):
+        pass
+
+
+class RedisStore:
+    """基于 Redis 的实现：租约用带过期时间的 SET NX，广播用 pub/sub，共享的值用带过期时间的 SET"""
+
+    shared = True
+
+    def __init__(self, url: str, prefix: str):
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        # 共享的值是二进制数据，不解码
+        self.values = aioredis.from_url(url)
+        self.prefix = prefix
+
+    async def acquire(self, name: str, owner: str, ttl: float) -> bool:
+        return bool(await self.redis.set(f"{self.prefix}lease:{name}", owner, nx=True, px=int(ttl * 1000)))
+
+    async def publish(self, channel: str, payload: str):
+        await self.redis.publish(f"{self.prefix}{channel}", payload)
+
+    async def subscribe(self, channels: Sequence[str]) -> AsyncIterator[Tuple[str, str]]:
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(*(f"{self.prefix}{channel}" for channel in channels))
+        try:
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    yield message["channel"][len(self.prefix):], message["data"]
+        finally:
+            await pubsub.aclose()
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.values.get(f"{self.prefix}value:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        await self.values.set(f"{self.prefix}value:{key}", value, px=int(ttl * 1000))
+
+    async def close(self):
+        await self.redis.aclose()
+        await self.values.aclose()
+
+
+def create_store(url: str):
+    if url.startswith(("redis://", "rediss://")):
+        if aioredis is None:
+            logger.warning("未安装redis，共享状态退回进程内实现")
+            return InMemoryStore()
+        return RedisStore(url, SHARED_STATE_PREFIX)
+    return InMemoryStore()
+
+
+class SharedState:
+    """多个工作进程之间需要保持一致的状态
+
+    - acquire: 租约，ttl 内只有一个进程能取得，用于每个周期只应执行一次的后台任务
+    - broadcast / listen: 把进程内缓存的变化（新的缓存条目、用户的写入等）通知其他工作进程，
+      各进程仍从本地内存读取，读路径不增加网络往返
+    - get_value / set_value: 体积较大、不适合广播给所有进程的结果（如预处理后的图片），
+      由用到的进程按需读取；进程内实现时不保存，读取总是返回 None
+
+    广播不等待发送完成，可在任意线程中调用；消息按尽力而为投递，Redis 不可用时丢弃。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        # 区分自己发出的消息；在 start() 中生成，预加载模式下 fork 出的各进程不能相同
+        self.origin = ""
+        self._handlers: Dict[str, Handler] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._outbox: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def shared(self) -> bool:
+        return self.store.shared
+
+    def listen(self, channel: str, handler: Handler):
+        """注册处理其他工作进程广播消息的函数（在事件循环中调用）；须在 start() 之前，通常在模块导入时"""
+        if self._loop is not None:
+            raise RuntimeError("共享状态已启动，不能再注册广播处理函数")
+        self._handlers[channel] = handler
+
+    def broadcast(self, channel: str, message: Any):
+        """通知其他工作进程，message 须可序列化为JSON；未启动或进程内实现时忽略"""
+        loop = self._loop
+        if self._outbox is None or loop is None:
+            return
+        loop.call_soon_threadsafe(self._enqueue, channel, message)
+
+    def _enqueue(self, channel: str, message: Any):
+        if self._outbox is None:
+            return
+        try:
+            self._outbox.put_nowait((channel, message))
+        except asyncio.QueueFull:
+            BROADCASTS.inc(channel=channel, result="dropped")
+
+    async def acquire(self, name: str, ttl: float) -> bool:
+        """在 ttl 秒内只有一个工作进程能取得 name；出错时返回 False（本周期跳过）"""
+        try:
+            return await self.store.acquire(name, self.origin, ttl)
+        except Exception:
+            logger.warning("获取租约 %s 失败", name, exc_info=True)
+            return False
+
+    async def get_value(self, key: str) -> Optional[bytes]:
+        """读取其他工作进程保存的值；不存在、进程内实现或出错时返回 None"""
+        if not self.store.shared:
+            return None
+        try:
+            return await self.store.get(key)
+        except Exception:
+            logger.warning("读取共享值 %s 失败", key, exc_info=True)
+            return None
+
+    async def set_value(self, key: str, value: bytes, ttl: float):
+        """保存 ttl 秒供其他工作进程读取；进程内实现时忽略，出错时只记录日志"""
+        if not self.store.shared:
+            return
+        try:
+            await self.store.set(key, value, ttl)
+        except Exception:
+            logger.warning("保存共享值 %s 失败", key, exc_info=True)
+
+    async def start(self):
+        if self._loop is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self.origin = uuid.uuid4().hex
+        if not self.store.shared:
+            if WEB_CONCURRENCY > 1:
+                logger.warning(
+                    "%s 个工作进程但未配置共享状态（REDIS_URL）：缓存、read-your-writes 和周期任务在各进程间不一致",
+                    WEB_CONCURRENCY,
+                )
+            return
+        self._outbox = asyncio.Queue(maxsize=SHARED_STATE_OUTBOX_SIZE)
+        self._tasks.append(asyncio.create_task(self._publish()))
+        if self._handlers:
+            self._tasks.append(asyncio.create_task(self._subscribe()))
+        logger.info("共享状态已启动: %s", ", ".join(self._handlers) or "无订阅")
+
+    async def stop(self):
+        if self._outbox is not None:
+            # 尽量发出剩余的广播
+            try:
+                await asyncio.wait_for(self._outbox.join(), timeout=2)
+            except asyncio.TimeoutError:
+                pass
+            self._outbox = None
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks.clear()
+        self._loop = None
+        await self.store.close()
+
+    async def _publish(self):
+        outbox = self._outbox
+        while True:
+            channel, message = await outbox.get()
+            try:
+                await self.store.publish(channel, json.dumps({"origin": self.origin, "data": message}, ensure_ascii=False))
+                BROADCASTS.inc(channel=channel, result="sent")
+            except Exception:
+                BROADCASTS.inc(channel=channel, result="failed")
+                logger.warning("广播 %s 失败", channel, exc_info=True)
+            finally:
+                outbox.task_done()
+
+    async def _subscribe(self):
+        while True:
+            try:
+                async for channel, payload in self.store.subscribe(list(self._handlers)):
+                    self._dispatch(channel, payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("共享状态订阅中断，1 秒后重连", exc_info=True)
+            await asyncio.sleep(1)
+
+    def _dispatch(self, channel: str, payload: str):
+        try:
+            envelope = json.loads(payload)
+            if envelope.get("origin") == self.origin:
+                return
+            self._handlers[channel](envelope["data"])
+            BROADCASTS.inc(channel=channel, result="received")
+        except Exception:
+            BROADCASTS.inc(channel=channel, result="failed")
+            logger.warning("处理广播 %s 失败", channel, exc_info=True)
+
+
+shared_state = SharedState(create_store(SHARED_STATE_URL))
@@ -0,0 +1,208 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from logging.handlers import RotatingFileHandler
+from typing import Any, Dict, List, Optional
+
+from .workers import WEB_CONCURRENCY, worker_id
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "True").lower() == "true"
+# 按比例抽样写入完整追踪；超过慢请求阈值的请求总是写入
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+TRACE_SLOW_SECONDS = float(os.getenv("TRACE_SLOW_SECONDS", "5"))
+TRACE_FILE = os.getenv("TRACE_FILE", "logs/traces.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "5"))
+# 单个请求最多记录的span数量，避免逐行查询的接口产生过大的追踪
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+trace_logger = logging.getLogger("app.traces")
+trace_logger.propagate = False
+
+
+@dataclass
+class Span:
+    name: str
+    start: float  # 相对请求开始的秒数
+    duration: float
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+
+@dataclass
+class Trace:
+    """一个请求（或一个WebSocket对话流）内各阶段的耗时"""
+    route: str
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    started: float = field(default_factory=time.perf_counter)
+    started_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+    spans: List[Span] = field(default_factory=list)
+    dropped: int = 0
+    attrs: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, name: str, start: float, duration: float, **attrs):
+        """记录一个span，start 为 time.perf_counter() 的值"""
+        if len(self.spans) >= TRACE_MAX_SPANS:
+            self.dropped += 1
+            return
+        self.spans.append(Span(name, start - self.started, duration, attrs))
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """按名称汇总的耗时（毫秒），保持各阶段首次出现的顺序"""
+        totals: Dict[str, Dict[str, Any]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, {"name": span.name, "dur": 0.0, "count": 0})
+            entry["dur"] += span.duration * 1000
+            entry["count"] += 1
+        for entry in totals.values():
+            entry["dur"] = round(entry["dur"], 1)
+        return list(totals.values())
+
+    def server_timing(self) -> str:
+        """Server-Timing 响应头，例如 jwt_verify;dur=0.4, db;desc="x3";dur=5.1, total;dur=8.2"""
+        parts = []
+        for entry in self.summary():
+            desc = f';desc="x{entry["count"]}"' if entry["count"] > 1 else ""
+            parts.append(f'{entry["name"]}{desc};dur={entry["dur"]}')
+        parts.append(f"total;dur={self.elapsed() * 1000:.1f}")
+        return ", ".join(parts)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "route": self.route,
+            "start": self.started_at.isoformat(),
+            "duration_ms": round(self.elapsed() * 1000, 1),
+            **self.attrs,
+            "spans": [
+                {"name": s.name, "start_ms": round(s.start * 1000, 1), "duration_ms": round(s.duration * 1000, 1), **s.attrs}
+                for s in self.spans
+            ],
+            "dropped_spans": self.dropped,
+        }
+
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current.get()
+
+
+@contextmanager
+def trace_scope(trace: Optional[Trace]):
+    token = _current.set(trace)
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+def trace_in_context(context: contextvars.Context) -> Optional[Trace]:
+    """另一个任务（其上下文）所属请求的追踪"""
+    return context.get(_current)
+
+
+def record_span(name: str, start: float, duration: float, **attrs):
+    """把一段已测得的耗时记入当前请求的追踪，没有追踪时忽略"""
+    trace = _current.get()
+    if trace is not None:
+        trace.add(name, start, duration, **attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """记录代码块的耗时，同步和异步代码中均可使用"""
+    trace = _current.get()
+    if trace is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, start, time.perf_counter() - start, **attrs)
+
+
+def trace_file_path() -> str:
+    """本进程写入的追踪文件：多个工作进程时各写各的（轮转不能跨进程），如 logs/traces.worker1.jsonl"""
+    if WEB_CONCURRENCY == 1:
+        return TRACE_FILE
+    root, extension = os.path.splitext(TRACE_FILE)
+    return f"{root}.worker{worker_id()}{extension}"
+
+
+def _configure_trace_file():
+    from .logs import async_handler
+
+    path = trace_file_path()
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    handler = RotatingFileHandler(
+        path, maxBytes=TRACE_FILE_MAX_BYTES, backupCount=TRACE_FILE_BACKUPS, encoding="utf-8"
+    )
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    # 文件写入和轮转在后台线程进行
+    trace_logger.addHandler(async_handler(handler))
+    trace_logger.setLevel(logging.INFO)
+
+
+class _JSONLine:
+    """日志参数：在日志后台线程格式化时才序列化为JSON"""
+
+    def __init__(self, data: Dict[str, Any]):
+        self.data = data
+
+    def __str__(self) -> str:
+        return json.dumps(self.data, ensure_ascii=False)
+
+
+def finish_trace(trace: Trace):
+    """请求结束：抽样或慢请求时把完整追踪写入JSONL文件（按大小轮转）"""
+    if random.random() >= TRACE_SAMPLE_RATE and trace.elapsed() < TRACE_SLOW_SECONDS:
+        return
+    if not trace_logger.handlers:
+        _configure_trace_file()
+    trace_logger.info("%s", _JSONLine(trace.to_dict()))
+
+
+class TracingMiddleware:
+    """为每个HTTP请求建立追踪，响应头带上 Server-Timing
+
+    流式响应的响应头先于生成发送，只包含此前的阶段（认证、查询等）；
+    完整的耗时由接口在流的末尾以 timing 事件发送。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(route=scope["path"], attrs={"method": scope["method"]})
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.attrs["status"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        with trace_scope(trace):
+            try:
+                await self.app(scope, receive, send_with_timing)
+            finally:
+                finish_trace(trace)
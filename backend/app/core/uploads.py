@@ -0,0 +1,35 @@
+import os
+import re
+from typing import Optional
+from urllib.parse import urlparse
+
+# 上传文件对外URL前缀
+UPLOAD_URL_PREFIX = "/uploads/"
+
+# 视为本服务的主机名，旧数据中的图片URL是 http://localhost:8000/uploads/...
+LOCAL_UPLOAD_HOSTS = set(
+    os.getenv("UPLOAD_LOCAL_HOSTS", "localhost,localhost:8000,127.0.0.1:8000,backend:8000").split(",")
+)
+
+SAFE_FILENAME_RE = re.compile(r"^[A-Za-z0-9_-]+(\.[A-Za-z0-9]+)?$")
+
+
+def is_safe_filename(filename: str) -> bool:
+    return bool(SAFE_FILENAME_RE.match(filename))
+
+
+def upload_filename_from_url(image_url: Optional[str]) -> Optional[str]:
+    """解析指向本服务上传文件的图片URL，返回文件名（不检查文件是否存在）
+
+    只依赖URL本身，模型层（Message.upload_filename 的默认值）和存储服务共用。
+    """
+    if not image_url:
+        return None
+    parsed = urlparse(image_url)
+    if parsed.netloc and parsed.netloc not in LOCAL_UPLOAD_HOSTS:
+        return None
+    path = parsed.path
+    if not path.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = path[len(UPLOAD_URL_PREFIX):]
+    return filename if is_safe_filename(filename) else None
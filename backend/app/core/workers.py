@@ -0,0 +1,18 @@
+import os
+
+# 工作进程数：生产模式由 gunicorn.conf.py 按CPU核数设置（uvicorn --workers 的默认值也取自此变量）
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY") or "1"))
+
+
+def worker_id() -> str:
+    """当前工作进程的编号
+
+    gunicorn.conf.py 在 fork 后设置 WORKER_ID，替换退出的进程时沿用原编号；未设置时为进程号。
+    须在调用时读取：预加载模式下模块在 fork 之前就已导入。
+    """
+    return os.getenv("WORKER_ID") or str(os.getpid())
+
+
+def per_worker(total: int) -> int:
+    """把全局的并发预算平分给各工作进程（向上取整，至少为1）"""
+    return max(1, -(-total // WEB_CONCURRENCY))
@@ -1,15 +1,28 @@
+import logging
+import os
+from alembic import command
+from alembic.config import Config
 from sqlalchemy.orm import Session
-from .database import engine
-from ..models import Base
 from ..services.auth import get_password_hash
 from ..models.user import User
 
-def init_db():
-    """初始化数据库"""
-    # 创建所有表
-    Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# backend目录下的alembic.ini
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "alembic.ini")
+
+def init_db(connection=None):
+    """初始化数据库：执行Alembic迁移到最新版本（默认连接 DATABASE_URL）
+
+    没有迁移记录的旧库（init.sql 或 create_all 建的表）由 0001 迁移自动识别并接入迁移链。
+    """
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    command.upgrade(config, "head")
     
-    print("数据库表创建完成")
+    logger.info("数据库迁移完成")
 
 def create_initial_data(db: Session):
     """创建初始数据"""
@@ -24,11 +37,12 @@ def create_initial_data(db: Session):
         )
         db.add(admin_user)
         db.commit()
-        print("默认用户创建完成: admin/123456")
+        logger.info("默认用户创建完成: admin/123456")
     else:
-        print("默认用户已存在")
+        logger.info("默认用户已存在")
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     init_db()
     from .database import SessionLocal
     db = SessionLocal()
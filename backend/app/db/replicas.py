@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+
+from ..core.shared_state import shared_state
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaRouter:
+    """只读副本路由：读请求轮询健康的副本，否则回退主库
+
+    同一用户写入后的一段时间内（read-your-writes 窗口）其读请求仍走主库，
+    避免复制延迟导致读不到刚写入的数据；写入会广播给其他工作进程，下一个请求落在哪个进程都生效。副本由后台任务定期检查连通性和复制延迟，
+    查询中出现断连错误时也会立即标记为不健康。
+    """
+
+    def __init__(
+        self,
+        engines: List[Engine],
+        read_your_writes: float = 5.0,
+        health_interval: float = 5.0,
+        max_lag: float = 10.0,
+    ):
+        self.engines = engines
+        self.read_your_writes = read_your_writes
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self._healthy: Dict[Engine, bool] = {engine: True for engine in engines}
+        self._cycle = itertools.cycle(engines)
+        self._recent_writes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+        for engine in engines:
+            event.listen(engine, "handle_error", self._on_error)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.engines)
+
+    # 路由
+    def mark_write(self, key: Optional[str]):
+        """记录用户的写入，窗口内该用户的读请求走主库"""
+        if key and self.enabled:
+            self.record_write(key)
+            shared_state.broadcast("writes", key)
+
+    def record_write(self, key: str):
+        """记录写入（本进程的，或其他工作进程广播来的）"""
+        now = time.monotonic()
+        with self._lock:
+            self._recent_writes[key] = now
+            if len(self._recent_writes) > 10000:
+                self._prune(now)
+
+    def _prune(self, now: float):
+        self._recent_writes = {
+            key: written for key, written in self._recent_writes.items()
+            if now - written < self.read_your_writes
+        }
+
+    def engine_for_read(self, key: Optional[str]) -> Optional[Engine]:
+        """返回处理该读请求的副本，应走主库时返回None"""
+        if not self.enabled:
+            return None
+        if key:
+            written = self._recent_writes.get(key)
+            if written is not None and time.monotonic() - written < self.read_your_writes:
+                return None
+        with self._lock:
+            for _ in range(len(self.engines)):
+                engine = next(self._cycle)
+                if self._healthy[engine]:
+                    return engine
+        return None
+
+    # 健康检查
+    def _on_error(self, context):
+        if context.is_disconnect and context.engine is not None:
+            self._set_healthy(context.engine, False, "连接断开")
+
+    def _set_healthy(self, engine: Engine, healthy: bool, reason: str = ""):
+        if self._healthy.get(engine) != healthy:
+            self._healthy[engine] = healthy
+            if healthy:
+                logger.info("只读副本恢复: %s", engine.url.render_as_string(hide_password=True))
+            else:
+                logger.warning(
+                    "只读副本不可用(%s)，读请求回退: %s",
+                    reason, engine.url.render_as_string(hide_password=True)
+                )
+
+    def check(self, engine: Engine):
+        """检查一个副本：能连接且复制延迟不超过上限"""
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+                lag = self._replication_lag(conn)
+        except Exception as e:
+            self._set_healthy(engine, False, str(e.__class__.__name__))
+            return
+        if lag is not None and lag > self.max_lag:
+            self._set_healthy(engine, False, f"复制延迟 {lag}s")
+        else:
+            self._set_healthy(engine, True)
+
+    @staticmethod
+    def _replication_lag(conn) -> Optional[float]:
+        """MySQL 副本的复制延迟（秒）；不是副本或没有权限时返回None，复制中断返回无穷大"""
+        if conn.dialect.name != "mysql":
+            return None
+        for statement in ("SHOW REPLICA STATUS", "SHOW SLAVE STATUS"):
+            try:
+                row = conn.execute(text(statement)).mappings().first()
+            except Exception:
+                continue
+            if row is None:
+                return None
+            lag = row.get("Seconds_Behind_Source", row.get("Seconds_Behind_Master"))
+            return float("inf") if lag is None else float(lag)
+        return None
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("只读副本路由已启用: %s 个副本", len(self.engines))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            for engine in self.engines:
+                await asyncio.to_thread(self.check, engine)
+            with self._lock:
+                self._prune(time.monotonic())
+            await asyncio.sleep(self.health_interval)
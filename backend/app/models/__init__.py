@@ -2,5 +2,7 @@ from .base import Base
 from .user import User
 from .chat_session import ChatSession
 from .message import Message
+from .archived_session import ArchivedSession, ArchivedSessionUpload
+from .session_tombstone import SessionTombstone
 
-__all__ = ["Base", "User", "ChatSession", "Message"]
+__all__ = ["Base", "User", "ChatSession", "Message", "ArchivedSession", "ArchivedSessionUpload", "SessionTombstone"]
@@ -0,0 +1,42 @@
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, LargeBinary, Index
+from sqlalchemy.dialects.mysql import LONGBLOB
+from sqlalchemy.sql import func
+from .base import Base
+from .types import BinaryUUID
+
+class ArchivedSession(Base):
+    """冷存储中的会话：全部消息序列化后压缩为一个二进制字段"""
+    __tablename__ = "archived_sessions"
+    
+    id = Column(BinaryUUID, primary_key=True)  # 原会话ID
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    title = Column(String(200), nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=True)
+    updated_at = Column(DateTime(timezone=True), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    message_count = Column(Integer, nullable=False, default=0)
+    raw_bytes = Column(Integer, nullable=False, default=0)  # 压缩前的字节数
+    codec = Column(String(10), nullable=False)  # zstd 或 zlib
+    payload = Column(LargeBinary().with_variant(LONGBLOB, "mysql"), nullable=False)
+    image_filenames = Column(Text, nullable=True)  # 消息引用的上传文件，空格分隔
+    
+    __table_args__ = (
+        # 会话列表：WHERE user_id = ? ORDER BY updated_at DESC
+        Index("ix_archived_sessions_user_id_updated_at", "user_id", "updated_at"),
+    )
+    
+    def __repr__(self):
+        return f"<ArchivedSession(id='{self.id}', messages={self.message_count}, codec='{self.codec}')>"
+
+
+class ArchivedSessionUpload(Base):
+    """归档会话引用的上传文件，释放文件和访问授权按文件名等值查询"""
+    __tablename__ = "archived_session_uploads"
+    
+    filename = Column(String(100), primary_key=True)
+    archived_session_id = Column(
+        BinaryUUID, ForeignKey("archived_sessions.id", ondelete="CASCADE"), primary_key=True
+    )
+    
+    def __repr__(self):
+        return f"<ArchivedSessionUpload(filename='{self.filename}', archived_session_id='{self.archived_session_id}')>"
@@ -1,20 +1,28 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Index
+from sqlalchemy.dialects.mysql import DATETIME
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from .base import Base
+from .types import BinaryUUID
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
     
-    id = Column(String(50), primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    id = Column(BinaryUUID, primary_key=True)  # UUIDv7
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     title = Column(String(200), nullable=False, default="新对话")
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # 微秒精度：会话列表的ETag和增量同步依赖它区分同一秒内的多次更新
+    updated_at = Column(DateTime(timezone=True).with_variant(DATETIME(fsp=6), "mysql"), onupdate=func.now())
     
     # 关系
     user = relationship("User", back_populates="chat_sessions")
-    messages = relationship("Message", back_populates="chat_session", cascade="all, delete-orphan")
+    messages = relationship("Message", back_populates="chat_session", cascade="all, delete-orphan", passive_deletes=True)
+    
+    __table_args__ = (
+        # 会话列表：WHERE user_id = ? ORDER BY updated_at DESC
+        Index("ix_chat_sessions_user_id_updated_at", "user_id", "updated_at"),
+    )
     
     def __repr__(self):
         return f"<ChatSession(id='{self.id}', title='{self.title}', user_id={self.user_id})>"
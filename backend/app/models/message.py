@@ -1,26 +1,46 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum
+from sqlalchemy import Column, Integer, String, DateTime, Text, ForeignKey, Enum, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 import enum
 from .base import Base
+from .types import BinaryUUID
+from ..core.uploads import upload_filename_from_url
 
 class MessageType(str, enum.Enum):
     user = "user"
     bot = "bot"
 
+def _upload_filename_default(context):
+    """插入时由 image_url 得出引用的本服务上传文件名（ORM 和批量 insert 都适用）"""
+    return upload_filename_from_url(context.get_current_parameters().get("image_url"))
+
 class Message(Base):
     __tablename__ = "messages"
     
-    id = Column(String(50), primary_key=True, index=True)
-    chat_session_id = Column(String(50), ForeignKey("chat_sessions.id"), nullable=False)
+    id = Column(BinaryUUID, primary_key=True)  # UUIDv7
+    chat_session_id = Column(BinaryUUID, ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False)
     content = Column(Text, nullable=True)  # 文本内容
     type = Column(Enum(MessageType), nullable=False)
     image_url = Column(String(500), nullable=True)  # 图片URL
     image_path = Column(String(500), nullable=True)  # 本地图片路径
+    # 引用的上传文件名，释放文件和访问授权按它等值查询（image_url 可能是带主机名的旧格式）
+    upload_filename = Column(String(100), nullable=True, default=_upload_filename_default)
     timestamp = Column(DateTime(timezone=True), server_default=func.now())
     
     # 关系
     chat_session = relationship("ChatSession", back_populates="messages")
     
+    __table_args__ = (
+        # 会话历史：WHERE chat_session_id = ? ORDER BY timestamp
+        Index("ix_messages_chat_session_id_timestamp", "chat_session_id", "timestamp"),
+        # 上传文件的引用：WHERE upload_filename = ?
+        Index("ix_messages_upload_filename", "upload_filename"),
+        # 消息搜索：中英文混合内容使用 ngram 分词的全文索引，仅 MySQL
+        Index(
+            "ft_messages_content", "content",
+            mysql_prefix="FULLTEXT", mysql_with_parser="ngram"
+        ).ddl_if(dialect="mysql"),
+    )
+    
     def __repr__(self):
         return f"<Message(id='{self.id}', type='{self.type}', content='{self.content[:50]}...')>"
@@ -0,0 +1,20 @@
+from sqlalchemy import Column, Integer, DateTime, ForeignKey, Index
+from sqlalchemy.dialects.mysql import DATETIME
+from .base import Base
+from .types import BinaryUUID
+
+class SessionTombstone(Base):
+    """已删除会话的记录，供客户端增量同步时移除本地会话"""
+    __tablename__ = "session_tombstones"
+    
+    session_id = Column(BinaryUUID, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    deleted_at = Column(DateTime(timezone=True).with_variant(DATETIME(fsp=6), "mysql"), nullable=False)
+    
+    __table_args__ = (
+        # 增量同步：WHERE user_id = ? AND deleted_at > ?
+        Index("ix_session_tombstones_user_id_deleted_at", "user_id", "deleted_at"),
+    )
+    
+    def __repr__(self):
+        return f"<SessionTombstone(session_id='{self.session_id}', user_id={self.user_id})>"
@@ -0,0 +1,21 @@
+import uuid
+
+from sqlalchemy.types import BINARY, TypeDecorator
+
+
+class BinaryUUID(TypeDecorator):
+    """以BINARY(16)存储UUID，应用层读写标准UUID字符串"""
+    impl = BINARY(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+        return uuid.UUID(value).bytes
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return str(uuid.UUID(bytes=bytes(value)))
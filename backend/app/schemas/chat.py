@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 from ..models.message import MessageType
 
@@ -16,6 +16,8 @@ class MessageResponse(MessageBase):
     chat_session_id: str
     timestamp: datetime
     image_path: Optional[str] = None
+    image_src: Optional[str] = None  # 带签名的图片访问URL
+    image_variants: Dict[str, str] = {}  # 缩略图宽度（像素） -> URL
 
     class Config:
         from_attributes = True
@@ -45,3 +47,19 @@ class ChatResponse(BaseModel):
     message: str
     session_id: str
     usage: Optional[dict] = None
+
+class SearchResult(BaseModel):
+    message_id: str
+    session_id: str
+    session_title: str
+    type: MessageType
+    snippet: str  # HTML转义后的片段，关键词用<mark>标出
+    timestamp: Optional[datetime] = None
+    score: float
+
+class SearchResponse(BaseModel):
+    query: str
+    page: int
+    page_size: int
+    has_more: bool
+    results: List[SearchResult] = []
@@ -0,0 +1,23 @@
+from pydantic import BaseModel
+from typing import Optional, List
+
+class JobCreate(BaseModel):
+    image_urls: List[str]
+    prompt: Optional[str] = None
+    session_id: Optional[str] = None  # 结果写入的会话，为空时新建
+
+class JobItemResponse(BaseModel):
+    image_url: str
+    status: str  # queued / running / done / failed / cancelled
+    message_id: Optional[str] = None  # 结果消息的ID
+    error: Optional[str] = None
+
+class JobResponse(BaseModel):
+    id: str
+    session_id: str
+    status: str  # queued / running / completed / failed / cancelling / cancelled
+    prompt: Optional[str] = None
+    created_at: str
+    total: int
+    finished: int
+    items: List[JobItemResponse]
@@ -4,5 +4,7 @@ from typing import Optional
 class ImageUploadResponse(BaseModel):
     success: bool
     image_url: Optional[str] = None
+    # 带签名的访问URL，用于显示图片和提交图片分析任务
+    image_src: Optional[str] = None
     image_path: Optional[str] = None
     error: Optional[str] = None
@@ -16,6 +16,7 @@ class UserLogin(BaseModel):
 class UserResponse(UserBase):
     id: int
     is_active: bool
+    tier: str = "standard"
     created_at: datetime
     updated_at: Optional[datetime] = None
 
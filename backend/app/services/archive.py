@@ -0,0 +1,353 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, sessionmaker
+
+try:
+    import zstandard
+except ImportError:  # 未安装时退回标准库 zlib
+    zstandard = None
+
+from .persistence import write_behind
+from .retention import delete_sessions
+from ..core.shared_state import shared_state
+from ..db.database import SessionLocal
+from ..models.archived_session import ArchivedSession, ArchivedSessionUpload
+from ..models.chat_session import ChatSession
+from ..models.message import Message, MessageType
+
+logger = logging.getLogger(__name__)
+
+ZSTD_LEVEL = int(os.getenv("ARCHIVE_ZSTD_LEVEL", "10"))
+ZLIB_LEVEL = 9
+# 解压后的归档消息在进程内缓存的总大小（按压缩前字节数计），会话列表不必每次都解压
+ARCHIVE_CACHE_MAX_BYTES = int(os.getenv("ARCHIVE_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+
+class StaleArchive(Exception):
+    """归档期间会话被修改（不支持行锁的数据库上），本批回滚，下个周期重试"""
+
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """压缩归档数据，返回 (编码, 压缩后的数据)"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, ZLIB_LEVEL)
+
+
+def decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取zstd归档需要安装zstandard")
+        return zstandard.ZstdDecompressor().decompress(payload)
+    if codec == "zlib":
+        return zlib.decompress(payload)
+    raise ValueError(f"未知的归档编码: {codec}")
+
+
+def _serialize_messages(messages: List[Message]) -> bytes:
+    return json.dumps([
+        {
+            "id": message.id,
+            "content": message.content,
+            "type": message.type.value,
+            "image_url": message.image_url,
+            "image_path": message.image_path,
+            "timestamp": message.timestamp.isoformat() if message.timestamp else None,
+        }
+        for message in messages
+    ], ensure_ascii=False).encode("utf-8")
+
+
+def archived_messages(archived: ArchivedSession) -> List[Dict[str, Any]]:
+    """解压归档会话的消息，返回可直接插入 messages 表的行"""
+    rows = json.loads(decompress(archived.codec, archived.payload))
+    for row in rows:
+        row["chat_session_id"] = archived.id
+        row["type"] = MessageType(row["type"])
+        if row["timestamp"]:
+            row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+    return rows
+
+
+class _ArchiveCache:
+    """归档消息的解压结果，按 (会话ID, 归档时间) 缓存；归档内容不会改变，恢复后再归档时归档时间不同"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, Any], Tuple[int, List[Dict[str, Any]]]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, archived: ArchivedSession) -> List[Dict[str, Any]]:
+        key = (archived.id, archived.archived_at)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry[1]
+        # 未命中时才读取（延迟加载的）payload 并解压
+        rows = archived_messages(archived)
+        size = archived.raw_bytes or 0
+        if size > self.max_bytes:
+            return rows
+        with self._lock:
+            if key not in self._entries:
+                self._entries[key] = (size, rows)
+                self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (evicted, _) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+        return rows
+
+
+_archive_cache = _ArchiveCache(ARCHIVE_CACHE_MAX_BYTES)
+
+
+def cached_archived_messages(archived: ArchivedSession) -> List[Dict[str, Any]]:
+    """会话列表使用的归档消息，解压结果在进程内缓存；返回的行由多个请求共用，不能修改"""
+    return _archive_cache.get(archived)
+
+
+def archive_sessions(
+    db: Session,
+    sessions: List[ChatSession],
+    cutoff: Optional[datetime] = None
+) -> Tuple[int, int]:
+    """把会话连同消息压缩写入归档表并从热表删除（不提交），返回 (压缩前字节数, 压缩后字节数)
+
+    会话行须已用 SELECT ... FOR UPDATE 锁定：新消息的外键检查会等待行锁，读取消息到删除之间不会插入新消息。
+    给出 cutoff 时删除前再确认会话仍未更新，不一致则抛出 StaleArchive。
+    """
+    session_ids = [session.id for session in sessions]
+    by_session: Dict[str, List[Message]] = {session_id: [] for session_id in session_ids}
+    messages = db.scalars(
+        select(Message)
+        .where(Message.chat_session_id.in_(session_ids))
+        .order_by(Message.chat_session_id, Message.timestamp)
+    )
+    for message in messages:
+        by_session[message.chat_session_id].append(message)
+
+    raw_total = compressed_total = 0
+    for session in sessions:
+        session_messages = by_session[session.id]
+        raw = _serialize_messages(session_messages)
+        codec, payload = compress(raw)
+        filenames = {message.upload_filename for message in session_messages}
+        filenames.discard(None)
+        db.add(ArchivedSession(
+            id=session.id,
+            user_id=session.user_id,
+            title=session.title,
+            created_at=session.created_at,
+            updated_at=session.updated_at,
+            message_count=len(session_messages),
+            raw_bytes=len(raw),
+            codec=codec,
+            payload=payload,
+            image_filenames=" ".join(sorted(filenames)) or None,
+        ))
+        db.add_all(
+            ArchivedSessionUpload(filename=filename, archived_session_id=session.id)
+            for filename in filenames
+        )
+        raw_total += len(raw)
+        compressed_total += len(payload)
+    db.flush()
+    # 消息由 ON DELETE CASCADE 删除
+    conditions = [ChatSession.id.in_(session_ids)]
+    if cutoff is not None:
+        conditions.append(func.coalesce(ChatSession.updated_at, ChatSession.created_at) < cutoff)
+    if delete_sessions(db, *conditions) != len(session_ids):
+        raise StaleArchive()
+    return raw_total, compressed_total
+
+
+def rehydrate_session(db: Session, session_id: str, user_id: int) -> Optional[ChatSession]:
+    """把归档会话恢复到热表，返回恢复后的会话；并发恢复时返回其他请求已恢复的会话"""
+    archived = db.query(ArchivedSession).filter(
+        ArchivedSession.id == session_id,
+        ArchivedSession.user_id == user_id
+    ).with_for_update().first()
+    if not archived:
+        db.rollback()
+        return db.query(ChatSession).filter(
+            ChatSession.id == session_id,
+            ChatSession.user_id == user_id
+        ).first()
+
+    rows = archived_messages(archived)
+    try:
+        db.execute(insert(ChatSession), [{
+            "id": archived.id,
+            "user_id": archived.user_id,
+            "title": archived.title,
+            "created_at": archived.created_at,
+            "updated_at": archived.updated_at,
+        }])
+        if rows:
+            db.execute(insert(Message), rows)
+        db.delete(archived)
+        db.commit()
+    except IntegrityError:
+        # 不支持行锁的数据库上，并发请求已先一步恢复
+        db.rollback()
+        return db.query(ChatSession).filter(
+            ChatSession.id == session_id,
+            ChatSession.user_id == user_id
+        ).first()
+    logger.info("归档会话已恢复: %s (%s 条消息)", session_id, len(rows))
+    return db.get(ChatSession, session_id)
+
+
+def archive_stats(db: Session) -> Dict[str, Any]:
+    """归档统计：归档数量、压缩前后大小、节省的空间，以及热表规模"""
+    archived_count, archived_messages_count, raw_bytes, compressed_bytes = db.execute(
+        select(
+            func.count(ArchivedSession.id),
+            func.coalesce(func.sum(ArchivedSession.message_count), 0),
+            func.coalesce(func.sum(ArchivedSession.raw_bytes), 0),
+            func.coalesce(func.sum(func.length(ArchivedSession.payload)), 0),
+        )
+    ).one()
+    stats = {
+        "archived_sessions": archived_count,
+        "archived_messages": int(archived_messages_count),
+        "archived_raw_bytes": int(raw_bytes),
+        "archived_compressed_bytes": int(compressed_bytes),
+        "reclaimed_bytes": int(raw_bytes) - int(compressed_bytes),
+        "hot_sessions": db.scalar(select(func.count()).select_from(ChatSession)),
+        "hot_messages": db.scalar(select(func.count()).select_from(Message)),
+    }
+    if db.get_bind().dialect.name == "mysql":
+        # InnoDB 表空间大小（估算值，ANALYZE TABLE 后更新）
+        rows = db.execute(text(
+            "SELECT table_name, data_length, index_length FROM information_schema.TABLES "
+            "WHERE table_schema = DATABASE() AND table_name IN ('chat_sessions', 'messages', 'archived_sessions')"
+        ))
+        stats["table_bytes"] = {name: {"data": data, "index": index} for name, data, index in rows}
+    return stats
+
+
+class ArchiveMover:
+    """冷存储迁移：定期把超过指定天数未更新的会话移入归档表
+
+    每批只迁移少量会话并单独提交，批次之间短暂停顿，避免长时间持有行锁。
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        archive_after_days: int = 0,
+        batch_size: int = 50,
+        interval: float = 3600,
+        batch_pause: float = 0.1,
+    ):
+        self.session_factory = session_factory
+        self.archive_after_days = archive_after_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self.last_run: Dict[str, Any] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.archive_after_days > 0
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("冷存储迁移已启动: %s 天未更新的会话, 每批 %s 个", self.archive_after_days, self.batch_size)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # 多个工作进程时每个周期只由取得租约的一个进程执行
+                if await shared_state.acquire("archive_move", self.interval):
+                    await self.run_once()
+            except Exception:
+                logger.exception("冷存储迁移失败，将在下个周期重试")
+            await asyncio.sleep(self.interval)
+
+    async def run_once(self) -> Dict[str, Any]:
+        """分批迁移全部符合条件的会话，返回本次迁移的统计"""
+        cutoff = datetime.utcnow() - timedelta(days=self.archive_after_days)
+        sessions = raw_bytes = compressed_bytes = 0
+        while True:
+            moved, raw, compressed = await asyncio.to_thread(self._archive_batch, cutoff)
+            sessions += moved
+            raw_bytes += raw
+            compressed_bytes += compressed
+            if moved < self.batch_size:
+                break
+            await asyncio.sleep(self.batch_pause)
+        self.last_run = {
+            "finished_at": datetime.utcnow(),
+            "sessions": sessions,
+            "raw_bytes": raw_bytes,
+            "compressed_bytes": compressed_bytes,
+        }
+        if sessions:
+            logger.info(
+                "已归档 %s 个会话: %s -> %s 字节 (%.1fx)",
+                sessions, raw_bytes, compressed_bytes, raw_bytes / max(compressed_bytes, 1),
+            )
+        return self.last_run
+
+    def _archive_batch(self, cutoff: datetime) -> Tuple[int, int, int]:
+        db = self.session_factory()
+        try:
+            # 锁定要归档的会话：条件按最新提交的版本判断，正在写入消息的会话被跳过
+            sessions = db.scalars(
+                select(ChatSession)
+                .where(func.coalesce(ChatSession.updated_at, ChatSession.created_at) < cutoff)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            # 写回队列中还有数据的会话留到下次
+            sessions = [session for session in sessions if not write_behind.pending_messages(session.id)]
+            if not sessions:
+                db.rollback()
+                return 0, 0, 0
+            raw, compressed = archive_sessions(db, sessions, cutoff)
+            db.commit()
+            return len(sessions), raw, compressed
+        except StaleArchive:
+            db.rollback()
+            logger.info("归档期间会话被更新，本批留到下个周期")
+            return 0, 0, 0
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# 全局冷存储迁移任务，ARCHIVE_AFTER_DAYS 为0时关闭
+archive_mover = ArchiveMover(
+    SessionLocal,
+    archive_after_days=int(os.getenv("ARCHIVE_AFTER_DAYS", "0")),
+    batch_size=int(os.getenv("ARCHIVE_BATCH_SIZE", "50")),
+    interval=int(os.getenv("ARCHIVE_INTERVAL_SECONDS", "3600")),
+    batch_pause=int(os.getenv("ARCHIVE_BATCH_PAUSE_MS", "100")) / 1000,
+)
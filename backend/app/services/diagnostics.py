@@ -0,0 +1,226 @@
+import asyncio
+import gc
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+from ..core.metrics import Gauge
+from .loop_watchdog import loop_watchdog
+
+# 诊断接口默认关闭，开启后也只允许管理员访问
+DIAGNOSTICS_ENABLED = os.getenv("DIAGNOSTICS_ENABLED", "False").lower() == "true"
+DIAGNOSTICS_MAX_PROFILE_SECONDS = float(os.getenv("DIAGNOSTICS_MAX_PROFILE_SECONDS", "60"))
+
+OPEN_STREAMS = Gauge("chat_streams_open", "正在进行的流式对话（transport: sse / ws）", labels=("transport",))
+
+# 线程空闲（等待锁、IO或定时）时最内层的函数，profile 时可以排除
+_IDLE_FUNCTIONS = {"wait", "select", "poll", "sleep"}
+
+
+class DiagnosticsBusy(Exception):
+    """已有一个profile在进行"""
+
+
+def _short_path(filename: str) -> str:
+    """去掉 sys.path 前缀，得到 app/api/chat.py、httpx/_client.py 这样的相对路径"""
+    best = filename
+    for entry in sys.path:
+        if entry and filename.startswith(entry) and len(filename) - len(entry) < len(best):
+            best = filename[len(entry):].lstrip(os.sep)
+    return best
+
+
+class SamplingProfiler:
+    """进程内的采样CPU profiler
+
+    在后台线程中按固定间隔读取所有线程的调用栈（sys._current_frames），
+    汇总为 flamegraph.pl / speedscope 可直接读取的 collapsed 格式：每行 "线程;外层帧;...;内层帧 次数"。
+    只在调用期间采样，不影响其余时间的性能。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._labels: Dict[Any, str] = {}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({_short_path(code.co_filename)})"
+        return label
+
+    def _sample(self, seconds: float, interval: float, main_only: bool, skip_idle: bool) -> Counter:
+        stacks: Counter = Counter()
+        me = threading.get_ident()
+        main = threading.main_thread().ident
+        end = time.monotonic() + seconds
+        while time.monotonic() < end:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me or (main_only and ident != main):
+                    continue
+                if skip_idle and frame.f_code.co_name in _IDLE_FUNCTIONS:
+                    continue
+                frames: List[str] = []
+                while frame is not None:
+                    frames.append(self._label(frame.f_code))
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(frames))] += 1
+            time.sleep(interval)
+        return stacks
+
+    async def profile(
+        self, seconds: float, interval: float = 0.01, main_only: bool = False, skip_idle: bool = True
+    ) -> str:
+        """采样 seconds 秒，返回 collapsed 格式的调用栈；同一时间只允许一个profile"""
+        if not self._lock.acquire(blocking=False):
+            raise DiagnosticsBusy("已有profile在进行")
+        try:
+            stacks = await asyncio.to_thread(self._sample, seconds, interval, main_only, skip_idle)
+        finally:
+            self._lock.release()
+        return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+class MemoryDiagnostics:
+    """基于 tracemalloc 的内存分配快照与差异
+
+    start 后开始记录分配（有额外的CPU和内存开销），snapshot 记下基线，
+    diff 对比当前与基线，找出持续增长的分配位置（如未释放的图片缓冲区、不断变大的缓存）。
+    """
+
+    def __init__(self):
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+
+    @property
+    def tracing(self) -> bool:
+        return tracemalloc.is_tracing()
+
+    @property
+    def has_baseline(self) -> bool:
+        return self._baseline is not None
+
+    def start(self, frames: int = 10):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self._baseline = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._baseline = None
+
+    @staticmethod
+    def _take() -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<unknown>"),
+        ))
+
+    @staticmethod
+    def _stat(stat, group_by: str) -> Dict[str, Any]:
+        frame = stat.traceback[0]
+        result = {
+            "location": f"{_short_path(frame.filename)}:{frame.lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "count": stat.count,
+        }
+        if hasattr(stat, "size_diff"):
+            result["size_diff_kb"] = round(stat.size_diff / 1024, 1)
+            result["count_diff"] = stat.count_diff
+        if group_by == "traceback":
+            result["traceback"] = [f"{_short_path(f.filename)}:{f.lineno}" for f in stat.traceback]
+        return result
+
+    def _snapshot(self, limit: int, group_by: str) -> Dict[str, Any]:
+        snapshot = self._take()
+        self._baseline = snapshot
+        stats = snapshot.statistics(group_by)
+        return {
+            "total_kb": round(sum(stat.size for stat in stats) / 1024, 1),
+            "top": [self._stat(stat, group_by) for stat in stats[:limit]],
+        }
+
+    def _diff(self, limit: int, group_by: str, reset: bool) -> Dict[str, Any]:
+        snapshot = self._take()
+        stats = snapshot.compare_to(self._baseline, group_by)
+        if reset:
+            self._baseline = snapshot
+        return {
+            "total_diff_kb": round(sum(stat.size_diff for stat in stats) / 1024, 1),
+            "top": [self._stat(stat, group_by) for stat in stats[:limit]],
+        }
+
+    async def snapshot(self, limit: int = 30, group_by: str = "lineno") -> Dict[str, Any]:
+        """记下新的基线并返回当前占用最多的分配位置"""
+        return await asyncio.to_thread(self._snapshot, limit, group_by)
+
+    async def diff(self, limit: int = 30, group_by: str = "lineno", reset: bool = False) -> Dict[str, Any]:
+        """当前与基线相比增长最多的分配位置；reset 时把当前快照作为新的基线"""
+        return await asyncio.to_thread(self._diff, limit, group_by, reset)
+
+
+def _rss_mb() -> Optional[float]:
+    """当前常驻内存（Linux），其他平台返回None"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024, 1)
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _pool_status(engine) -> Dict[str, Any]:
+    pool = engine.pool
+    status: Dict[str, Any] = {"url": engine.url.render_as_string(hide_password=True), "class": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            status[name] = method()
+    return status
+
+
+async def loop_lag() -> float:
+    """事件循环调度延迟：从请求回调到回调实际执行的时间（秒）"""
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    scheduled = loop.time()
+    loop.call_soon(lambda: future.done() or future.set_result(loop.time() - scheduled))
+    return await future
+
+
+async def runtime_stats(engines: List[Any]) -> Dict[str, Any]:
+    """进程当前的运行状态：事件循环延迟、任务、流式对话、连接池、内存和线程"""
+    tasks = asyncio.all_tasks()
+    by_coroutine = Counter(
+        getattr(task.get_coro(), "__qualname__", type(task.get_coro()).__name__) for task in tasks
+    )
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        "pid": os.getpid(),
+        "loop_lag_ms": round(await loop_lag() * 1000, 3),
+        "loop_blocked": loop_watchdog.stats(),
+        "tasks": {"total": len(tasks), "by_coroutine": dict(by_coroutine.most_common(20))},
+        "streams": {
+            "sse": int(OPEN_STREAMS.value(transport="sse")),
+            "ws": int(OPEN_STREAMS.value(transport="ws")),
+        },
+        "db_pools": [_pool_status(engine) for engine in engines],
+        "memory": {
+            "rss_mb": _rss_mb(),
+            "max_rss_mb": round(usage.ru_maxrss / 1024, 1),  # Linux 上单位为KB
+            "tracemalloc": tracemalloc.is_tracing(),
+        },
+        "cpu_seconds": {"user": round(usage.ru_utime, 2), "system": round(usage.ru_stime, 2)},
+        "threads": threading.active_count(),
+        "gc": {"counts": gc.get_count(), "collections": [stats["collections"] for stats in gc.get_stats()]},
+    }
+
+
+profiler = SamplingProfiler()
+memory_diagnostics = MemoryDiagnostics()
@@ -0,0 +1,41 @@
+import asyncio
+import logging
+
+import httpx
+
+from . import storage
+from ..core.deadline import within
+
+logger = logging.getLogger(__name__)
+
+# 单次下载的上限，有请求时限时取两者中较小者
+FETCH_TIMEOUT = 30.0
+
+
+class ImageFetchError(Exception):
+    """图片获取失败，异常信息可直接展示给用户"""
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+async def fetch_image(image_url: str) -> bytes:
+    """获取图片内容：本服务上传的文件直接读磁盘，其他URL通过HTTP下载"""
+    filename = storage.resolve_upload_filename(image_url)
+    if filename:
+        return await within("image_fetch", asyncio.to_thread(_read_file, storage.upload_path(filename)))
+
+    # 配置HTTP客户端，禁用SSL验证以避免证书问题
+    async with httpx.AsyncClient(
+        timeout=FETCH_TIMEOUT,
+        verify=False,
+        follow_redirects=True
+    ) as client:
+        logger.debug("正在下载图片: %s", image_url)
+        response = await within("image_fetch", client.get(image_url))
+        if response.status_code != 200:
+            raise ImageFetchError(f"无法下载图片，状态码：{response.status_code}")
+        logger.debug("图片下载成功，大小: %s bytes", len(response.content))
+        return response.content
@@ -0,0 +1,224 @@
+import asyncio
+import io
+import os
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+from ..core.deadline import within
+from ..core.workers import WEB_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ImageBudget:
+    """单个模型的图片输入预算"""
+    max_pixels: int  # 模型有效输入分辨率（宽 * 高）
+    max_bytes: int  # 编码后图片的最大字节数
+    min_quality: int = 60
+    max_quality: int = 88
+
+
+@dataclass
+class EncodedImage:
+    """编码后可直接发送给模型的图片"""
+    data: bytes
+    mime_type: str
+    width: int
+    height: int
+    original_bytes: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return max(self.original_bytes - len(self.data), 0)
+
+
+# 各模型的图片预算，超出有效分辨率的像素只会增加请求体积和上游延迟
+MODEL_IMAGE_BUDGETS: Dict[str, ImageBudget] = {
+    "qwen-vl-plus": ImageBudget(max_pixels=1280 * 28 * 28, max_bytes=1536 * 1024),
+    "qwen-vl-max": ImageBudget(max_pixels=16384 * 28 * 28, max_bytes=4 * 1024 * 1024),
+}
+DEFAULT_IMAGE_BUDGET = ImageBudget(max_pixels=1280 * 28 * 28, max_bytes=1536 * 1024)
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+    "PNG": "image/png",
+}
+
+# 逐级降低的质量档位，取第一个满足字节预算的结果
+QUALITY_STEPS = (88, 80, 72, 65, 60)
+
+
+def get_image_budget(model: str) -> ImageBudget:
+    """获取模型对应的图片预算"""
+    return MODEL_IMAGE_BUDGETS.get(model, DEFAULT_IMAGE_BUDGET)
+
+
+def _fit_to_pixels(image: Image.Image, max_pixels: int) -> Image.Image:
+    """按像素预算等比缩放图片"""
+    pixels = image.width * image.height
+    if pixels <= max_pixels:
+        return image
+    ratio = (max_pixels / pixels) ** 0.5
+    size = (max(int(image.width * ratio), 1), max(int(image.height * ratio), 1))
+    return image.resize(size, Image.Resampling.LANCZOS)
+
+
+def _has_alpha(image: Image.Image) -> bool:
+    if image.mode in ("RGBA", "LA"):
+        return image.getextrema()[-1][0] < 255
+    return image.mode == "P" and "transparency" in image.info
+
+
+def _save(image: Image.Image, fmt: str, quality: Optional[int] = None) -> bytes:
+    """编码图片，不写入EXIF/ICC等元数据"""
+    output = io.BytesIO()
+    if fmt == "PNG":
+        image.save(output, format="PNG", optimize=True)
+    elif fmt == "WEBP":
+        image.save(output, format="WEBP", quality=quality, method=4)
+    else:
+        image.save(output, format="JPEG", quality=quality, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def _encode_candidates(image: Image.Image, alpha: bool, quality: int) -> Tuple[str, bytes]:
+    """在当前质量下选出体积最小的格式"""
+    if alpha:
+        candidates = [("WEBP", _save(image, "WEBP", quality)), ("PNG", _save(image, "PNG"))]
+    else:
+        candidates = [("JPEG", _save(image, "JPEG", quality)), ("WEBP", _save(image, "WEBP", quality))]
+    return min(candidates, key=lambda item: len(item[1]))
+
+
+def encode_image(image_data: bytes, model: str) -> EncodedImage:
+    """按模型预算压缩图片：校正EXIF方向、去除元数据并自适应选择格式和质量"""
+    budget = get_image_budget(model)
+    with Image.open(io.BytesIO(image_data)) as source:
+        source_format = source.format
+        original_size = source.size
+        # EXIF方向标记也属于元数据，存在时原图不能直接透传
+        has_metadata = bool(source.getexif()) or "icc_profile" in source.info
+        image = ImageOps.exif_transpose(source)
+        image.load()
+
+    alpha = _has_alpha(image)
+    image = image.convert("RGBA" if alpha else "RGB")
+    image = _fit_to_pixels(image, budget.max_pixels)
+
+    steps = [q for q in QUALITY_STEPS if budget.min_quality <= q <= budget.max_quality]
+    while True:
+        for quality in steps or [budget.min_quality]:
+            fmt, data = _encode_candidates(image, alpha, quality)
+            if len(data) <= budget.max_bytes:
+                break
+        if len(data) <= budget.max_bytes or min(image.size) <= 64:
+            break
+        # 最低质量仍超出字节预算时继续缩小尺寸
+        image = image.resize(
+            (max(int(image.width * 0.75), 1), max(int(image.height * 0.75), 1)),
+            Image.Resampling.LANCZOS,
+        )
+
+    # 原图已满足预算且无需旋转、去元数据时，比较后保留更小的一份
+    if (
+        source_format in MIME_TYPES
+        and len(image_data) <= len(data)
+        and image.size == original_size
+        and not has_metadata
+    ):
+        fmt, data = source_format, image_data
+
+    return EncodedImage(
+        data=data,
+        mime_type=MIME_TYPES[fmt],
+        width=image.width,
+        height=image.height,
+        original_bytes=len(image_data),
+    )
+
+
+# 图片处理进程池：Pillow解码和编码都是CPU密集操作，不能占用事件循环
+_image_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_image_executor() -> ProcessPoolExecutor:
+    """获取（按需创建）后台图片处理进程池"""
+    global _image_executor
+    if _image_executor is None:
+        # 多个工作进程时平分CPU核数，避免进程总数远超核数
+        default = min(max(1, (os.cpu_count() or 1) // WEB_CONCURRENCY), 4)
+        workers = int(os.getenv("IMAGE_WORKERS", str(default)))
+        _image_executor = ProcessPoolExecutor(max_workers=workers)
+    return _image_executor
+
+
+def shutdown_image_executor():
+    """关闭图片处理进程池"""
+    global _image_executor
+    if _image_executor is not None:
+        _image_executor.shutdown(wait=False, cancel_futures=True)
+        _image_executor = None
+
+
+async def prepare_image(image_data: bytes, model: str) -> EncodedImage:
+    """在后台进程池中把图片编码为模型可用的格式
+
+    超出请求时限时不再等待；尚在进程池队列中未开始的任务随之取消。
+    """
+    loop = asyncio.get_running_loop()
+    encoded = await within("preprocess", loop.run_in_executor(get_image_executor(), encode_image, image_data, model))
+    logger.info(
+        "图片编码完成: %s -> %s bytes (%s, %sx%s)",
+        encoded.original_bytes, len(encoded.data), encoded.mime_type, encoded.width, encoded.height,
+    )
+    return encoded
+
+
+# 聊天记录中图片的响应式尺寸（宽度像素，与 srcset 的 w 描述符一致）
+VARIANT_WIDTHS = (128, 512, 1024)
+# WebP 单边的最大像素数
+WEBP_MAX_DIMENSION = 16383
+
+# EXIF 方向为这些值时图片需要旋转90度，显示宽度为存储的高度
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def display_width(source_path: str) -> int:
+    """图片按EXIF方向显示时的宽度；只读取文件头，不解码像素"""
+    with Image.open(source_path) as source:
+        width, height = source.size
+        if source.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+            return height
+        return width
+
+
+def variant_size(width: int, height: int, target: int) -> Tuple[int, int]:
+    """缩略图尺寸：宽度为 target 但不放大原图，高度按比例且不超过 WebP 的上限"""
+    new_width = min(target, width)
+    new_height = max(1, round(height * new_width / width))
+    if new_height > WEBP_MAX_DIMENSION:
+        # 极长的图片按高度上限缩小，宽度随之变窄
+        new_width = max(1, round(new_width * WEBP_MAX_DIMENSION / new_height))
+        new_height = WEBP_MAX_DIMENSION
+    return new_width, new_height
+
+
+def render_variant(source_path: str, dest_path: str, width: int):
+    """生成指定宽度的WebP缩略图，高度按原图比例；原图较窄时保持原宽度，不放大"""
+    with Image.open(source_path) as source:
+        image = ImageOps.exif_transpose(source)
+        image.load()
+    image = image.convert("RGBA" if _has_alpha(image) else "RGB")
+    size = variant_size(image.width, image.height, width)
+    if size != image.size:
+        image = image.resize(size, Image.Resampling.LANCZOS)
+    # 先写临时文件再原子替换，并发请求不会读到半个文件
+    tmp_path = f"{dest_path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="WEBP", quality=80, method=4)
+    os.replace(tmp_path, dest_path)
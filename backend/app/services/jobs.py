@@ -0,0 +1,481 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+import httpx
+from sqlalchemy.exc import IntegrityError
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # 未安装时只能使用进程内队列
+    aioredis = None
+
+from . import storage
+from .image_fetch import ImageFetchError
+from .preprocess import load_image
+from .persistence import write_behind
+from .model_router import model_router
+from .qwen_vl import DEFAULT_IMAGE_PROMPT, QwenAPIError, build_image_request, qwen_vl_service
+from ..core.ids import new_id
+from ..db.database import SessionLocal, replica_router
+from ..models.chat_session import ChatSession
+from ..models.message import Message, MessageType
+
+logger = logging.getLogger(__name__)
+
+# 任务队列：配置了 redis:// 地址时多个后端进程共享队列，否则使用进程内队列
+JOB_BROKER_URL = os.getenv("JOB_BROKER_URL", os.getenv("REDIS_URL", ""))
+# 同时处理的图片数量（每个进程）
+JOB_CONCURRENCY = int(os.getenv("JOB_CONCURRENCY", "4"))
+JOB_MAX_ITEMS = int(os.getenv("JOB_MAX_ITEMS", "20"))
+JOB_ITEM_TIMEOUT_SECONDS = float(os.getenv("JOB_ITEM_TIMEOUT_SECONDS", "300"))
+# 任务状态保留时间，过期后只能在会话中查看结果
+JOB_TTL_SECONDS = int(os.getenv("JOB_TTL_SECONDS", "86400"))
+# 取出的图片由 worker 持有租约，处理期间定期续期；进程崩溃后租约过期，图片重新入队
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+# 单张图片的状态
+ITEM_QUEUED = "queued"
+ITEM_RUNNING = "running"
+ITEM_DONE = "done"
+ITEM_FAILED = "failed"
+ITEM_CANCELLED = "cancelled"
+ITEM_FINISHED = (ITEM_DONE, ITEM_FAILED, ITEM_CANCELLED)
+
+
+def job_status(job: Dict[str, Any]) -> str:
+    """由各图片的状态汇总任务状态"""
+    states = [item["status"] for item in job["items"]]
+    if all(state in ITEM_FINISHED for state in states):
+        if job.get("cancelled"):
+            return "cancelled"
+        return "failed" if all(state == ITEM_FAILED for state in states) else "completed"
+    if job.get("cancelled"):
+        return "cancelling"
+    if all(state == ITEM_QUEUED for state in states):
+        return "queued"
+    return "running"
+
+
+def job_finished(job: Dict[str, Any]) -> bool:
+    return all(item["status"] in ITEM_FINISHED for item in job["items"])
+
+
+class InMemoryBroker:
+    """进程内的任务队列和状态存储，单进程部署和测试使用"""
+
+    def __init__(self):
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._expires: Dict[str, float] = {}
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    async def create(self, job: Dict[str, Any]):
+        now = time.monotonic()
+        for job_id in [key for key, expires in self._expires.items() if expires < now]:
+            self._jobs.pop(job_id, None)
+            self._expires.pop(job_id, None)
+        self._jobs[job["id"]] = job
+        self._expires[job["id"]] = now + JOB_TTL_SECONDS
+        for index in range(len(job["items"])):
+            self._queue.put_nowait((job["id"], index))
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return json.loads(json.dumps(job)) if job is not None else None
+
+    async def update_item(self, job_id: str, index: int, item: Dict[str, Any]):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["items"][index] = item
+
+    async def cancel(self, job_id: str):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job["cancelled"] = True
+
+    async def dequeue(self) -> Tuple[str, int]:
+        return await self._queue.get()
+
+    # 队列与 worker 在同一进程中，不需要租约
+    async def renew(self, job_id: str, index: int):
+        pass
+
+    async def ack(self, job_id: str, index: int):
+        pass
+
+    async def reap(self) -> int:
+        return 0
+
+    async def publish(self, job_id: str, event: Dict[str, Any]):
+        for queue in self._subscribers.get(job_id, []):
+            queue.put_nowait(event)
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[asyncio.Queue]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(job_id, []).append(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers.get(job_id, [])
+            subscribers.remove(queue)
+            if not subscribers:
+                self._subscribers.pop(job_id, None)
+
+    async def close(self):
+        pass
+
+
+class RedisBroker:
+    """基于 Redis 的任务队列：列表作为队列，每张图片的状态单独存一个哈希字段，进度通过 pub/sub 推送
+
+    至少一次投递：BLMOVE 把取出的图片原子地移入处理中列表并设置租约，处理完成后确认（ack）才移除；
+    持有者崩溃时租约过期，由 reap() 放回队列重新处理。
+    """
+
+    QUEUE_KEY = "jobs:queue"
+    PROCESSING_KEY = "jobs:processing"
+
+    def __init__(self, url: str, lease: float = 60.0):
+        self.redis = aioredis.from_url(url, decode_responses=True)
+        self.lease = lease
+        # 上次检查时没有租约的条目：BLMOVE 与设置租约之间有短暂间隔，连续两次检查都没有租约才放回队列
+        self._unleased: set = set()
+
+    @staticmethod
+    def _lease_key(value: str) -> str:
+        return f"jobs:lease:{value}"
+
+    @staticmethod
+    def _job_key(job_id: str) -> str:
+        return f"jobs:{job_id}"
+
+    @staticmethod
+    def _items_key(job_id: str) -> str:
+        return f"jobs:{job_id}:items"
+
+    @staticmethod
+    def _channel(job_id: str) -> str:
+        return f"jobs:{job_id}:events"
+
+    async def create(self, job: Dict[str, Any]):
+        meta = {key: value for key, value in job.items() if key != "items"}
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(self._job_key(job["id"]), json.dumps(meta), ex=JOB_TTL_SECONDS)
+            pipe.hset(self._items_key(job["id"]), mapping={
+                str(index): json.dumps(item) for index, item in enumerate(job["items"])
+            })
+            pipe.expire(self._items_key(job["id"]), JOB_TTL_SECONDS)
+            pipe.lpush(self.QUEUE_KEY, *(f"{job['id']}:{index}" for index in range(len(job["items"]))))
+            await pipe.execute()
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        meta = await self.redis.get(self._job_key(job_id))
+        if meta is None:
+            return None
+        job = json.loads(meta)
+        items = await self.redis.hgetall(self._items_key(job_id))
+        job["items"] = [json.loads(items[str(index)]) for index in range(len(items))]
+        return job
+
+    async def update_item(self, job_id: str, index: int, item: Dict[str, Any]):
+        await self.redis.hset(self._items_key(job_id), str(index), json.dumps(item))
+
+    async def cancel(self, job_id: str):
+        meta = await self.redis.get(self._job_key(job_id))
+        if meta is not None:
+            job = json.loads(meta)
+            job["cancelled"] = True
+            await self.redis.set(self._job_key(job_id), json.dumps(job), keepttl=True)
+
+    async def dequeue(self) -> Tuple[str, int]:
+        value = None
+        while value is None:
+            value = await self.redis.blmove(self.QUEUE_KEY, self.PROCESSING_KEY, 5, "RIGHT", "LEFT")
+        await self.redis.set(self._lease_key(value), "1", px=int(self.lease * 1000))
+        job_id, index = value.rsplit(":", 1)
+        return job_id, int(index)
+
+    async def renew(self, job_id: str, index: int):
+        await self.redis.set(self._lease_key(f"{job_id}:{index}"), "1", px=int(self.lease * 1000))
+
+    async def ack(self, job_id: str, index: int):
+        value = f"{job_id}:{index}"
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.lrem(self.PROCESSING_KEY, 1, value)
+            pipe.delete(self._lease_key(value))
+            await pipe.execute()
+
+    async def reap(self) -> int:
+        """把租约已过期的图片放回队列，返回放回的数量；多个进程同时执行时 LREM 保证只放回一次"""
+        processing = await self.redis.lrange(self.PROCESSING_KEY, 0, -1)
+        unleased = set()
+        for value in processing:
+            if not await self.redis.exists(self._lease_key(value)):
+                unleased.add(value)
+        expired = unleased & self._unleased
+        self._unleased = unleased - expired
+        requeued = 0
+        for value in expired:
+            if await self.redis.lrem(self.PROCESSING_KEY, 1, value):
+                # 放到队列的取出端，优先重新处理
+                await self.redis.rpush(self.QUEUE_KEY, value)
+                requeued += 1
+        if requeued:
+            logger.warning("%s 张图片的处理租约已过期，重新入队", requeued)
+        return requeued
+
+    async def publish(self, job_id: str, event: Dict[str, Any]):
+        await self.redis.publish(self._channel(job_id), json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, job_id: str) -> AsyncIterator[asyncio.Queue]:
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self._channel(job_id))
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def forward():
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    queue.put_nowait(json.loads(message["data"]))
+
+        task = asyncio.create_task(forward())
+        try:
+            yield queue
+        finally:
+            task.cancel()
+            await pubsub.unsubscribe()
+            await pubsub.aclose()
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+def create_broker(url: str):
+    if url.startswith(("redis://", "rediss://")):
+        if aioredis is None:
+            logger.warning("未安装redis，任务队列退回进程内实现")
+        else:
+            return RedisBroker(url, JOB_LEASE_SECONDS)
+    return InMemoryBroker()
+
+
+def _error_reply(error: Exception) -> str:
+    if isinstance(error, ImageFetchError):
+        return str(error)
+    if isinstance(error, QwenAPIError):
+        return f"图片分析失败，错误代码：{error.status_code}"
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException)):
+        return "图片分析超时"
+    if isinstance(error, httpx.ConnectError):
+        return f"网络连接失败：{str(error)}"
+    logger.exception("图片分析任务失败")
+    return f"图片处理出错：{str(error)}"
+
+
+class JobService:
+    """异步图片分析任务：提交后立即返回任务ID，由后台 worker 以有限的并发逐张调用模型
+
+    每张图片的结果作为一问一答两条消息写入任务所属的会话，进度通过 broker 发布，
+    客户端可以轮询任务状态或订阅进度事件。
+    """
+
+    def __init__(
+        self,
+        broker,
+        concurrency: int = 4,
+        item_timeout: float = 300.0,
+        lease: float = 60.0,
+    ):
+        self.broker = broker
+        self.concurrency = concurrency
+        self.item_timeout = item_timeout
+        self.lease = lease
+        self._workers: List[asyncio.Task] = []
+
+    async def submit(
+        self,
+        user_id: int,
+        username: str,
+        user_tier: str,
+        session_id: str,
+        prompt: Optional[str],
+        image_urls: List[str],
+    ) -> Dict[str, Any]:
+        job = {
+            "id": new_id(),
+            "user_id": user_id,
+            "username": username,
+            "user_tier": user_tier,
+            "session_id": session_id,
+            "prompt": prompt,
+            "created_at": datetime.utcnow().isoformat(),
+            "cancelled": False,
+            "items": [{"image_url": url, "status": ITEM_QUEUED} for url in image_urls],
+        }
+        await self.broker.create(job)
+        return job
+
+    async def get(self, job_id: str, user_id: int) -> Optional[Dict[str, Any]]:
+        job = await self.broker.get(job_id)
+        if job is None or job["user_id"] != user_id:
+            return None
+        return job
+
+    async def cancel(self, job_id: str):
+        """取消尚未开始的图片，正在处理的图片会完成"""
+        await self.broker.cancel(job_id)
+        await self.broker.publish(job_id, {"type": "cancelled"})
+
+    def subscribe(self, job_id: str):
+        return self.broker.subscribe(job_id)
+
+    # worker
+    async def start(self):
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+            self._workers.append(asyncio.create_task(self._reaper()))
+            logger.info("图片分析任务已启用: %s, 并发 %s", type(self.broker).__name__, self.concurrency)
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        await self.broker.close()
+
+    async def _worker(self):
+        while True:
+            try:
+                job_id, index = await self.broker.dequeue()
+                # 处理期间续期租约；被取消（进程退出）时不确认，租约过期后由其他进程重新处理
+                keepalive = asyncio.create_task(self._keep_lease(job_id, index))
+                try:
+                    await self._process(job_id, index)
+                finally:
+                    keepalive.cancel()
+                await self.broker.ack(job_id, index)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("任务队列处理失败")
+                await asyncio.sleep(1)
+
+    async def _keep_lease(self, job_id: str, index: int):
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            try:
+                await self.broker.renew(job_id, index)
+            except Exception:
+                logger.warning("续期任务租约失败", exc_info=True)
+
+    async def _reaper(self):
+        while True:
+            await asyncio.sleep(self.lease / 2)
+            try:
+                await self.broker.reap()
+            except Exception:
+                logger.warning("回收过期的任务租约失败", exc_info=True)
+
+    async def _process(self, job_id: str, index: int):
+        job = await self.broker.get(job_id)
+        if job is None:
+            return  # 已过期
+        item = job["items"][index]
+        if item["status"] in ITEM_FINISHED:
+            return
+        if job.get("cancelled"):
+            item["status"] = ITEM_CANCELLED
+            await self._update(job, index, item)
+            return
+
+        item["status"] = ITEM_RUNNING
+        await self._update(job, index, item)
+        try:
+            content = await asyncio.wait_for(
+                self._analyze(item["image_url"], job["prompt"], job["user_tier"]), self.item_timeout
+            )
+            item["status"] = ITEM_DONE
+        except Exception as e:
+            content = _error_reply(e)
+            item["status"] = ITEM_FAILED
+            item["error"] = content
+
+        try:
+            item["message_id"] = await self._save_result(job, item["image_url"], content)
+        except IntegrityError:
+            # 会话在处理期间被删除
+            item["status"] = ITEM_FAILED
+            item["error"] = "会话已删除"
+        await self._update(job, index, item)
+
+    async def _analyze(self, image_url: str, prompt: Optional[str], user_tier: str) -> str:
+        tier = model_router.route(prompt or "", True, user_tier).tier
+        image = await load_image(image_url, tier.model)
+        result = await qwen_vl_service.complete(build_image_request(image, prompt, tier))
+        return result.content
+
+    async def _update(self, job: Dict[str, Any], index: int, item: Dict[str, Any]):
+        await self.broker.update_item(job["id"], index, item)
+        job["items"][index] = item
+        await self.broker.publish(job["id"], {"type": "item", "index": index, **item})
+
+    async def _save_result(self, job: Dict[str, Any], image_url: str, content: str) -> str:
+        """把一张图片的提问和回答写入会话，返回回答消息的ID"""
+        filename = storage.resolve_upload_filename(image_url)
+        now = datetime.utcnow()
+        rows = [
+            {
+                "id": new_id(),
+                "chat_session_id": job["session_id"],
+                "content": job["prompt"] or DEFAULT_IMAGE_PROMPT,
+                "type": MessageType.user,
+                "image_url": image_url,
+                "image_path": storage.upload_path(filename) if filename else None,
+                "timestamp": now,
+            },
+            {
+                "id": new_id(),
+                "chat_session_id": job["session_id"],
+                "content": content,
+                "type": MessageType.bot,
+                "timestamp": now,
+            },
+        ]
+        if write_behind.enabled:
+            for row in rows:
+                write_behind.add_message(row)
+            write_behind.touch_session(job["session_id"], now)
+            replica_router.mark_write(job["username"])
+        else:
+            await asyncio.to_thread(self._write_rows, job, rows, now)
+        return rows[1]["id"]
+
+    @staticmethod
+    def _write_rows(job: Dict[str, Any], rows: List[Dict[str, Any]], now: datetime):
+        db = SessionLocal()
+        db.info["routing_key"] = job["username"]
+        try:
+            db.add_all(Message(**row) for row in rows)
+            db.query(ChatSession).filter(ChatSession.id == job["session_id"]).update(
+                {ChatSession.updated_at: now}, synchronize_session=False
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+job_service = JobService(
+    create_broker(JOB_BROKER_URL),
+    concurrency=JOB_CONCURRENCY,
+    item_timeout=JOB_ITEM_TIMEOUT_SECONDS,
+    lease=JOB_LEASE_SECONDS,
+)
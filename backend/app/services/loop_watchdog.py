@@ -0,0 +1,235 @@
+import asyncio
+import contextvars
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from ..core.metrics import Counter, Histogram
+from ..core.tracing import trace_in_context
+
+logger = logging.getLogger(__name__)
+
+LOOP_WATCHDOG_ENABLED = os.getenv("LOOP_WATCHDOG_ENABLED", "True").lower() == "true"
+# 测量间隔；调度延迟超过阈值视为事件循环被阻塞，记录阻塞处的调用栈
+LOOP_WATCHDOG_INTERVAL = float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "100")) / 1000
+LOOP_BLOCK_THRESHOLD = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+# 测试模式：阻塞超过预算即记为违规，服务关闭时汇总输出错误日志，测试用 assert_no_blocking() 检查
+LOOP_WATCHDOG_STRICT = os.getenv("LOOP_WATCHDOG_STRICT", "False").lower() == "true"
+LOOP_BLOCK_BUDGET = float(os.getenv("LOOP_BLOCK_BUDGET_MS", "100")) / 1000
+
+LOOP_LAG = Histogram(
+    "event_loop_lag_seconds",
+    "事件循环调度延迟（定时回调实际执行时间与预定时间之差）",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0),
+)
+LOOP_BLOCKED = Counter(
+    "event_loop_blocked_total",
+    "事件循环被阻塞超过阈值的次数，location 为阻塞时最内层的应用代码",
+    labels=("location",),
+)
+
+# 优先定位到本应用的代码，而不是其调用的库（SQLAlchemy、Pillow、bcrypt 等）内部
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class BlockEvent:
+    """一次事件循环阻塞"""
+    duration: float
+    location: str
+    task: Optional[str]
+    route: Optional[str]
+    stack: List[str]
+
+    def describe(self) -> str:
+        where = f"{self.location}（任务 {self.task}" + (f"，请求 {self.route}" if self.route else "") + "）"
+        return f"事件循环阻塞 {self.duration * 1000:.0f}ms: {where}\n" + "".join(self.stack)
+
+
+def _location(stack: traceback.StackSummary) -> str:
+    """阻塞处的位置：最内层的应用代码帧，没有时取最内层的帧"""
+    for frame in reversed(stack):
+        if frame.filename.startswith(_APP_DIR):
+            return f"{os.path.relpath(frame.filename, os.path.dirname(_APP_DIR))}:{frame.name}"
+    if stack:
+        frame = stack[-1]
+        return f"{os.path.basename(frame.filename)}:{frame.name}"
+    return "unknown"
+
+
+class LoopWatchdog:
+    """持续测量事件循环调度延迟，并定位阻塞事件循环的代码
+
+    事件循环内的任务每隔 interval 记录一次调度延迟；后台线程发现心跳停滞超过阈值时，
+    读取事件循环线程当时的调用栈（即正在执行的协程）。事件循环恢复后，
+    由循环内的任务输出日志和指标，严格模式下超出预算的阻塞记为违规。
+
+    后台线程不调用 asyncio 的接口：启动后安装的任务工厂在事件循环线程中登记每个任务的
+    最外层协程帧及其上下文，后台线程在调用栈中找到登记过的帧，即得到正在执行的任务和所属请求。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        interval: float = 0.1,
+        threshold: float = 0.1,
+        strict: bool = False,
+        budget: float = 0.1,
+    ):
+        self.enabled = enabled
+        self.interval = interval
+        self.threshold = threshold
+        self.strict = strict
+        self.budget = budget
+        self.violations: List[BlockEvent] = []
+        self.blocked: Dict[str, int] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._heartbeat = 0.0
+        # 后台线程捕获的阻塞现场：(阻塞前的心跳, 调用栈, 任务, 路由)
+        self._captured: Optional[tuple] = None
+        # 任务最外层协程帧的 id -> (帧, 任务, 上下文)，只在事件循环线程中修改
+        self._tasks: Dict[int, tuple] = {}
+        self._previous_factory = None
+
+    async def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._heartbeat = time.monotonic()
+        self._stopping.clear()
+        self._previous_factory = self._loop.get_task_factory()
+        self._loop.set_task_factory(self._create_task)
+        self._task = asyncio.create_task(self._run())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(
+            "事件循环监测已启动: 阈值 %.0fms%s", self.threshold * 1000,
+            f", 严格模式预算 {self.budget * 1000:.0f}ms" if self.strict else "",
+        )
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping.set()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+        if self._loop.get_task_factory() == self._create_task:
+            self._loop.set_task_factory(self._previous_factory)
+        self._tasks.clear()
+        if self.violations:
+            # 关闭过程中不抛出异常，由测试调用 assert_no_blocking() 使其失败
+            logger.error(
+                "%s 次事件循环阻塞超出预算 %.0fms: %s", len(self.violations), self.budget * 1000,
+                ", ".join(sorted({event.location for event in self.violations})),
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """各位置的阻塞次数，供诊断接口使用"""
+        return {
+            "enabled": self._task is not None,
+            "threshold_ms": self.threshold * 1000,
+            "by_location": dict(sorted(self.blocked.items(), key=lambda item: -item[1])),
+            "violations": len(self.violations),
+        }
+
+    def assert_no_blocking(self):
+        """严格模式的检查，供测试调用：有超出预算的阻塞时抛出 AssertionError"""
+        if self.violations:
+            details = "\n\n".join(event.describe() for event in self.violations)
+            raise AssertionError(f"{len(self.violations)} 次事件循环阻塞超出预算 {self.budget * 1000:.0f}ms:\n{details}")
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - expected)
+            previous, self._heartbeat = self._heartbeat, time.monotonic()
+            LOOP_LAG.observe(lag)
+            if lag >= self.threshold:
+                self._report(lag, previous)
+
+    def _report(self, lag: float, heartbeat: float):
+        captured, self._captured = self._captured, None
+        if captured is None or captured[0] != heartbeat:
+            # 阻塞在后台线程检查之前就结束了，没有调用栈
+            stack, task, route = traceback.StackSummary(), None, None
+        else:
+            _, stack, task, route = captured
+        event = BlockEvent(
+            duration=lag, location=_location(stack), task=task, route=route,
+            stack=stack.format(),
+        )
+        LOOP_BLOCKED.inc(location=event.location)
+        self.blocked[event.location] = self.blocked.get(event.location, 0) + 1
+        if self.strict and lag > self.budget:
+            self.violations.append(event)
+            logger.error("%s", event.describe())
+        else:
+            logger.warning("%s", event.describe())
+
+    def _monitor(self):
+        check = min(self.threshold, self.interval) / 2
+        captured_for = None
+        while not self._stopping.wait(check):
+            heartbeat = self._heartbeat
+            stalled = time.monotonic() - heartbeat - self.interval
+            if stalled < self.threshold or captured_for == heartbeat:
+                continue
+            # 每次阻塞只捕获一次，在阻塞仍在进行时读取事件循环线程的调用栈
+            captured_for = heartbeat
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._captured = (heartbeat, traceback.extract_stack(frame, limit=40), *self._current_task(frame))
+
+    def _create_task(self, loop, coro, context=None):
+        """任务工厂：登记任务的最外层协程帧和上下文（Python 3.12 之前的任务没有 get_context()）"""
+        if context is None:
+            context = contextvars.copy_context()
+        if self._previous_factory is not None:
+            task = self._previous_factory(loop, coro, context=context)
+        else:
+            task = asyncio.Task(coro, loop=loop, context=context)
+        frame = getattr(coro, "cr_frame", None)
+        if frame is not None:
+            key = id(frame)
+            self._tasks[key] = (frame, task, context)
+            task.add_done_callback(lambda _: self._tasks.pop(key, None))
+        return task
+
+    def _current_task(self, frame):
+        """阻塞时正在执行的任务名称及其所属请求的路由：调用栈中最内层的已登记任务帧"""
+        while frame is not None:
+            entry = self._tasks.get(id(frame))
+            if entry is not None and entry[0] is frame:
+                _, task, context = entry
+                name = f"{task.get_name()} {getattr(task.get_coro(), '__qualname__', '')}".strip()
+                trace = trace_in_context(context)
+                return name, trace.route if trace is not None else None
+            frame = frame.f_back
+        return None, None
+
+loop_watchdog = LoopWatchdog(
+    enabled=LOOP_WATCHDOG_ENABLED,
+    interval=LOOP_WATCHDOG_INTERVAL,
+    threshold=LOOP_BLOCK_THRESHOLD,
+    strict=LOOP_WATCHDOG_STRICT,
+    budget=LOOP_BLOCK_BUDGET,
+)
@@ -0,0 +1,227 @@
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Deque, Dict, List, Optional, Tuple
+
+from ..core.metrics import Counter, Gauge
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_TOKENS = 1500
+DEFAULT_TEMPERATURE = 0.7
+
+# 滚动窗口内的首字延迟样本；样本不足时不判断是否超出SLO
+MODEL_SLO_WINDOW_SECONDS = float(os.getenv("MODEL_SLO_WINDOW_SECONDS", "300"))
+MODEL_SLO_MIN_SAMPLES = int(os.getenv("MODEL_SLO_MIN_SAMPLES", "20"))
+# 降级期间仍按此比例把请求发给原档位，持续测量其延迟以便恢复
+MODEL_PROBE_RATE = float(os.getenv("MODEL_PROBE_RATE", "0.05"))
+
+
+@dataclass(frozen=True)
+class ModelTier:
+    """一个模型档位：模型、生成参数、首字延迟SLO以及超出SLO时降级到的更快档位"""
+    name: str
+    model: str
+    vision: bool = False
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    temperature: float = DEFAULT_TEMPERATURE
+    slo_p95_ttft: Optional[float] = None  # 秒，None 表示不做延迟降级
+    fallback: Optional[str] = None
+
+
+@dataclass(frozen=True)
+class RoutingRule:
+    """按顺序匹配的路由规则，未设置的条件视为不限"""
+    tier: str
+    image: Optional[bool] = None
+    user_tier: Optional[str] = None
+    min_chars: Optional[int] = None
+    max_chars: Optional[int] = None
+
+    def matches(self, prompt_chars: int, has_image: bool, user_tier: str) -> bool:
+        return (
+            (self.image is None or self.image == has_image)
+            and (self.user_tier is None or self.user_tier == user_tier)
+            and (self.min_chars is None or prompt_chars >= self.min_chars)
+            and (self.max_chars is None or prompt_chars <= self.max_chars)
+        )
+
+
+@dataclass(frozen=True)
+class RouteDecision:
+    tier: ModelTier
+    requested: str  # 规则选中的档位
+    reason: str  # rule / degraded / probe
+
+
+DEFAULT_TIERS = [
+    ModelTier("text-max", "qwen-max", slo_p95_ttft=4.0, fallback="text-plus"),
+    ModelTier("text-plus", "qwen-plus", slo_p95_ttft=2.5, fallback="text-turbo"),
+    ModelTier("text-turbo", "qwen-turbo", slo_p95_ttft=1.5),
+    ModelTier("vl-max", "qwen-vl-max", vision=True, slo_p95_ttft=8.0, fallback="vl-plus"),
+    ModelTier("vl-plus", "qwen-vl-plus", vision=True, slo_p95_ttft=5.0),
+]
+
+# 默认与原先一致：文本用 qwen-plus，图片用 qwen-vl-plus；premium 用户使用更大的模型
+DEFAULT_RULES = [
+    RoutingRule("vl-max", image=True, user_tier="premium"),
+    RoutingRule("vl-plus", image=True),
+    RoutingRule("text-max", user_tier="premium"),
+    RoutingRule("text-plus"),
+]
+
+
+def _load_json(name: str, factory, default):
+    """从环境变量读取 JSON 数组配置，格式错误时使用默认值"""
+    raw = os.getenv(name)
+    if not raw:
+        return default
+    try:
+        return [factory(**item) for item in json.loads(raw)]
+    except (TypeError, ValueError) as e:
+        logger.error("%s 配置无效，使用默认配置: %s", name, e)
+        return default
+
+
+MODEL_ROUTE_DECISIONS = Counter(
+    "model_route_decisions_total",
+    "模型路由决策（reason: rule 按规则, degraded 因SLO降级, probe 降级期间的探测请求）",
+    labels=("requested", "tier", "reason"),
+)
+MODEL_TTFT_P95 = Gauge("model_ttft_p95_seconds", "各档位滚动窗口内的首字延迟p95", labels=("tier",), aggregate="max")
+MODEL_TIER_DEGRADED = Gauge("model_tier_degraded", "档位当前是否超出SLO（1为超出）", labels=("tier",), aggregate="max")
+
+
+class RollingLatency:
+    """滚动时间窗口内的延迟样本"""
+
+    def __init__(self, window: float, max_samples: int = 2000):
+        self.window = window
+        self._samples: Deque[Tuple[float, float]] = deque(maxlen=max_samples)
+
+    def add(self, value: float, now: float):
+        self._samples.append((now, value))
+
+    def _expire(self, now: float):
+        while self._samples and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def percentile(self, q: float, now: float) -> Tuple[Optional[float], int]:
+        """返回 (分位数, 样本数)，没有样本时分位数为None"""
+        self._expire(now)
+        values = sorted(value for _, value in self._samples)
+        if not values:
+            return None, 0
+        index = min(len(values) - 1, max(0, int(round(q * len(values))) - 1))
+        return values[index], len(values)
+
+
+class ModelRouter:
+    """按规则为每个请求选择模型档位，档位的滚动p95首字延迟超出SLO时降级到更快的档位
+
+    降级沿 fallback 链找到第一个未超出SLO的档位；降级期间少量探测请求仍发往原档位，
+    原档位的p95回到SLO以内（或样本过期不足以判断）后自动恢复。
+    """
+
+    def __init__(
+        self,
+        tiers: List[ModelTier],
+        rules: List[RoutingRule],
+        window: float = 300.0,
+        min_samples: int = 20,
+        probe_rate: float = 0.05,
+        rng: Optional[random.Random] = None,
+    ):
+        self.tiers: Dict[str, ModelTier] = {tier.name: tier for tier in tiers}
+        self.rules = rules
+        self.min_samples = min_samples
+        self.probe_rate = probe_rate
+        self._rng = rng or random.Random()
+        self._latency = {name: RollingLatency(window) for name in self.tiers}
+        self._lock = threading.Lock()
+        for rule in rules:
+            if rule.tier not in self.tiers:
+                raise ValueError(f"路由规则引用了不存在的档位: {rule.tier}")
+        for tier in tiers:
+            if tier.fallback is not None and tier.fallback not in self.tiers:
+                raise ValueError(f"档位 {tier.name} 的降级档位不存在: {tier.fallback}")
+        if not any(rule.matches(0, False, "") for rule in rules) or not any(rule.matches(0, True, "") for rule in rules):
+            raise ValueError("路由规则需要为文本和图片请求各提供一个兜底规则")
+
+    def _select(self, prompt_chars: int, has_image: bool, user_tier: str) -> ModelTier:
+        for rule in self.rules:
+            if rule.matches(prompt_chars, has_image, user_tier):
+                return self.tiers[rule.tier]
+        raise LookupError("没有匹配的路由规则")
+
+    def breaching(self, tier: ModelTier, now: Optional[float] = None) -> bool:
+        """档位的滚动p95首字延迟是否超出SLO"""
+        if tier.slo_p95_ttft is None:
+            return False
+        with self._lock:
+            p95, count = self._latency[tier.name].percentile(0.95, now or time.monotonic())
+        breaching = count >= self.min_samples and p95 is not None and p95 > tier.slo_p95_ttft
+        MODEL_TIER_DEGRADED.set(1 if breaching else 0, tier=tier.name)
+        return breaching
+
+    def _resolve(self, prompt: str, has_image: bool, user_tier: str) -> Tuple[ModelTier, ModelTier, str]:
+        requested = self._select(len(prompt or ""), has_image, user_tier)
+        now = time.monotonic()
+        tier, reason = requested, "rule"
+        seen = set()
+        while self.breaching(tier, now) and tier.fallback and tier.fallback not in seen:
+            seen.add(tier.name)
+            tier, reason = self.tiers[tier.fallback], "degraded"
+        return requested, tier, reason
+
+    def route(self, prompt: str, has_image: bool, user_tier: str = "standard") -> RouteDecision:
+        """为一个请求选择档位并记录决策"""
+        requested, tier, reason = self._resolve(prompt, has_image, user_tier)
+        if reason == "degraded" and self._rng.random() < self.probe_rate:
+            tier, reason = requested, "probe"
+        MODEL_ROUTE_DECISIONS.inc(requested=requested.name, tier=tier.name, reason=reason)
+        return RouteDecision(tier=tier, requested=requested.name, reason=reason)
+
+    def predict(self, prompt: str, has_image: bool, user_tier: str = "standard") -> ModelTier:
+        """预测请求会使用的档位（不记录决策），用于上传时的预处理"""
+        return self._resolve(prompt, has_image, user_tier)[1]
+
+    def observe(self, tier: ModelTier, ttft: float):
+        """记录一次请求的首字延迟"""
+        now = time.monotonic()
+        with self._lock:
+            latency = self._latency[tier.name]
+            latency.add(ttft, now)
+            p95, _ = latency.percentile(0.95, now)
+        if p95 is not None:
+            MODEL_TTFT_P95.set(p95, tier=tier.name)
+
+    def status(self) -> Dict[str, dict]:
+        """各档位的当前延迟和降级状态"""
+        now = time.monotonic()
+        result = {}
+        for name, tier in self.tiers.items():
+            with self._lock:
+                p95, count = self._latency[name].percentile(0.95, now)
+            result[name] = {
+                "model": tier.model,
+                "slo_p95_ttft": tier.slo_p95_ttft,
+                "p95_ttft": p95,
+                "samples": count,
+                "breaching": self.breaching(tier, now),
+            }
+        return result
+
+
+model_router = ModelRouter(
+    _load_json("MODEL_TIERS", ModelTier, DEFAULT_TIERS),
+    _load_json("MODEL_ROUTING_RULES", RoutingRule, DEFAULT_RULES),
+    window=MODEL_SLO_WINDOW_SECONDS,
+    min_samples=MODEL_SLO_MIN_SAMPLES,
+    probe_rate=MODEL_PROBE_RATE,
+)
@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import sessionmaker
+
+from ..db.database import SessionLocal
+from ..models.chat_session import ChatSession
+from ..models.message import Message
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindQueue:
+    """消息写回队列：把消息插入和会话时间更新合并成周期性的批量事务
+
+    未落库的数据只保存在本进程的内存中：
+    - 正常关闭时写完剩余数据；进程崩溃或被强制终止时，最近一个刷新间隔（或一个批次）内的消息会丢失
+    - 同一进程内对同一会话的读取会合并这些数据（read-your-writes）；其他工作进程在刷新之前看不到
+    会话本身不经过队列，创建时同步提交，任何工作进程都能立即找到新会话（不会因为请求落到
+    另一个进程而返回404），队列中只有引用已落库会话的消息和更新时间。
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        enabled: bool = False,
+        flush_interval: float = 0.2,
+        max_batch: int = 500,
+    ):
+        self.session_factory = session_factory
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._messages: List[Dict[str, Any]] = []
+        self._touches: Dict[str, datetime] = {}
+        # 正在写库的批次，提交完成前仍对读取可见
+        self._inflight_messages: List[Dict[str, Any]] = []
+        self._inflight_touches: Dict[str, datetime] = {}
+        self._lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    # 写入
+    def add_message(self, row: Dict[str, Any]):
+        self._messages.append(row)
+        if len(self._messages) >= self.max_batch:
+            self._wakeup.set()
+
+    def touch_session(self, session_id: str, updated_at: datetime):
+        self._touches[session_id] = updated_at
+
+    # 读取未落库的数据
+    def pending_messages(self, session_id: str) -> List[Dict[str, Any]]:
+        return [
+            row for row in self._inflight_messages + self._messages
+            if row["chat_session_id"] == session_id
+        ]
+
+    def pending_touch(self, session_id: str) -> Optional[datetime]:
+        return self._touches.get(session_id) or self._inflight_touches.get(session_id)
+
+    def has_pending(self) -> bool:
+        return bool(
+            self._messages or self._touches or self._inflight_messages or self._inflight_touches
+        )
+
+    # 刷新
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("消息写回队列已启动: 间隔 %.3fs, 批量 %s", self.flush_interval, self.max_batch)
+
+    async def stop(self):
+        """停止后台任务并写完剩余数据"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        if self._messages or self._touches:
+            logger.error("关闭时仍有未写入的数据: %s 条消息", len(self._messages))
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("消息批量写入失败，将在下次刷新时重试")
+
+    async def flush(self):
+        """把当前缓冲的数据写入数据库；写入失败时数据放回缓冲区"""
+        async with self._lock:
+            messages, touches = self._messages, self._touches
+            if not (messages or touches):
+                return
+            self._messages, self._touches = [], {}
+            self._inflight_messages, self._inflight_touches = messages, touches
+            try:
+                await asyncio.to_thread(self._write_batch, messages, touches)
+            except Exception:
+                # 数据库不可用等错误：放回缓冲区，保留期间新写入的数据
+                self._messages = messages + self._messages
+                self._touches = {**touches, **self._touches}
+                raise
+            finally:
+                self._inflight_messages, self._inflight_touches = [], {}
+
+    def _write_batch(self, messages, touches):
+        db = self.session_factory()
+        try:
+            self._execute(db, messages, touches)
+            db.commit()
+        except IntegrityError:
+            # 个别行违反约束（如会话已被删除）时逐行写入，只丢弃出错的行
+            db.rollback()
+            logger.warning("批量写入违反约束，改为逐行写入")
+            self._write_rows(db, messages, touches)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _execute(db, messages, touches):
+        if messages:
+            db.execute(insert(Message), messages)
+        if touches:
+            db.execute(update(ChatSession), [
+                {"id": session_id, "updated_at": updated_at}
+                for session_id, updated_at in touches.items()
+            ])
+
+    def _write_rows(self, db, messages, touches):
+        items = (
+            [([row], {}) for row in messages]
+            + [([], {session_id: updated_at}) for session_id, updated_at in touches.items()]
+        )
+        for item in items:
+            try:
+                self._execute(db, *item)
+                db.commit()
+            except IntegrityError as e:
+                db.rollback()
+                logger.error("丢弃无法写入的数据: %s", e.orig)
+
+
+# 全局写回队列，默认关闭
+write_behind = WriteBehindQueue(
+    SessionLocal,
+    enabled=os.getenv("WRITE_BEHIND_ENABLED", "False").lower() == "true",
+    flush_interval=int(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL_MS", "200")) / 1000,
+    max_batch=int(os.getenv("WRITE_BEHIND_MAX_BATCH", "500")),
+)
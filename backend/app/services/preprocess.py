@@ -0,0 +1,171 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Set, Tuple
+
+from . import storage
+from .image_fetch import fetch_image
+from .image_processing import EncodedImage, prepare_image
+from .qwen_vl import qwen_vl_service
+from ..core.deadline import within
+from ..core.metrics import Counter
+from ..core.shared_state import SharedState, shared_state
+
+logger = logging.getLogger(__name__)
+
+PREPROCESS_ENABLED = os.getenv("PREPROCESS_ON_UPLOAD", "True").lower() == "true"
+# 上传后预热到上游的连接，发送消息时省去TCP/TLS握手
+PREPROCESS_WARM_UPSTREAM = os.getenv("PREPROCESS_WARM_UPSTREAM", "True").lower() == "true"
+# 缓存的编码结果数量和有效期：上传后通常几秒内就会发送消息
+PREPROCESS_CACHE_SIZE = int(os.getenv("PREPROCESS_CACHE_SIZE", "32"))
+PREPROCESS_TTL_SECONDS = float(os.getenv("PREPROCESS_TTL_SECONDS", "600"))
+
+PREPROCESS_LOOKUPS = Counter(
+    "image_preprocess_lookups_total",
+    "发送图片消息时预处理结果的命中情况"
+    "（ready: 已完成, pending: 等待进行中的预处理, shared: 其他工作进程的结果, miss: 现场处理）",
+    labels=("result",),
+)
+
+
+def _dump_image(image: EncodedImage) -> bytes:
+    header = {
+        "mime_type": image.mime_type,
+        "width": image.width,
+        "height": image.height,
+        "original_bytes": image.original_bytes,
+    }
+    return json.dumps(header).encode() + b"\n" + image.data
+
+
+def _load_image(payload: bytes) -> EncodedImage:
+    header, data = payload.split(b"\n", 1)
+    return EncodedImage(data=data, **json.loads(header))
+
+
+class SpeculativePreprocessor:
+    """上传时预先把图片编码为模型输入
+
+    每张图片（按内容寻址的文件名和模型区分）对应一个 Future，发送消息时直接复用，
+    预处理尚未完成则等待它而不是重新处理。结果保存在内存中，按数量和时间淘汰；
+    配置了共享状态时同时保存到共享状态，上传和发送由不同工作进程处理时也能复用
+    （另一进程仍在处理中的图片在本进程现场处理）。
+    """
+
+    def __init__(self, max_entries: int = 32, ttl: float = 600.0, state: SharedState = shared_state):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.state = state
+        # (文件名, 模型) -> (创建时间, 预处理结果, 是否取自其他工作进程)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, asyncio.Future, bool]]" = OrderedDict()
+        # 保留后台任务的引用避免被垃圾回收
+        self._tasks: Set[asyncio.Task] = set()
+
+    @staticmethod
+    def _shared_key(key: Tuple[str, str]) -> str:
+        filename, model = key
+        return f"preprocess:{model}:{filename}"
+
+    def schedule(self, filename: str, image_data: bytes, model: str):
+        """在后台开始预处理；同一图片已有结果或正在处理时不重复"""
+        key = (filename, model)
+        self._evict()
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            return
+        task = asyncio.create_task(prepare_image(image_data, model))
+        task.add_done_callback(lambda future: self._finished(key, future))
+        self._remember(key, task, remote=False)
+        if PREPROCESS_WARM_UPSTREAM:
+            self._spawn(qwen_vl_service.warm_up())
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _remember(self, key: Tuple[str, str], future: asyncio.Future, remote: bool):
+        self._entries[key] = (time.monotonic(), future, remote)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _finished(self, key: Tuple[str, str], future: asyncio.Future):
+        if future.cancelled():
+            return
+        if future.exception() is not None:
+            logger.warning("图片预处理失败，发送时将重新处理: %s", future.exception())
+        elif self.state.shared:
+            self._spawn(self.state.set_value(self._shared_key(key), _dump_image(future.result()), self.ttl))
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl
+        while self._entries:
+            created = next(iter(self._entries.values()))[0]
+            if created >= cutoff:
+                break
+            self._entries.popitem(last=False)
+
+    async def _lookup(self, image_url: Optional[str], model: str) -> Tuple[Optional[asyncio.Future], str]:
+        """返回 (预处理结果, 来源)；其他工作进程的结果取回后保存在本进程"""
+        filename = storage.resolve_upload_filename(image_url)
+        if not filename:
+            return None, "miss"
+        key = (filename, model)
+        self._evict()
+        entry = self._entries.get(key)
+        if entry is not None:
+            _, future, remote = entry
+            if remote:
+                return future, "shared"
+            return future, "ready" if future.done() else "pending"
+        payload = await self.state.get_value(self._shared_key(key))
+        if payload is None:
+            return None, "miss"
+        future = asyncio.get_running_loop().create_future()
+        future.set_result(_load_image(payload))
+        self._remember(key, future, remote=True)
+        return future, "shared"
+
+    async def has(self, image_url: Optional[str], model: str) -> bool:
+        future, _ = await self._lookup(image_url, model)
+        return future is not None
+
+    async def get(self, image_url: Optional[str], model: str) -> Optional[EncodedImage]:
+        """取预处理结果，必要时等待进行中的预处理；没有或失败时返回None，由调用方现场处理"""
+        future, result = await self._lookup(image_url, model)
+        PREPROCESS_LOOKUPS.inc(result=result)
+        if future is None:
+            return None
+        try:
+            # shield: 请求被取消时不影响其他请求复用同一个预处理结果
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            return None
+
+
+speculative_preprocessor = SpeculativePreprocessor(
+    max_entries=PREPROCESS_CACHE_SIZE,
+    ttl=PREPROCESS_TTL_SECONDS,
+)
+
+
+def schedule_preprocess(filename: str, image_data: bytes, model: str):
+    """上传完成后按预计使用的模型开始预处理"""
+    if PREPROCESS_ENABLED:
+        speculative_preprocessor.schedule(filename, image_data, model)
+
+
+async def load_image(image_url: str, model: str) -> EncodedImage:
+    """获取模型可用的图片：优先使用上传时的预处理结果，否则现场下载并编码"""
+    image = await within("preprocess", speculative_preprocessor.get(image_url, model))
+    if image is not None:
+        return image
+    image_data = await fetch_image(image_url)
+    # 按模型预算压缩图片，原始图片随后即可释放
+    return await prepare_image(image_data, model)
+
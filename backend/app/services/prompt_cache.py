@@ -0,0 +1,260 @@
+import difflib
+import hashlib
+import os
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Set, Tuple
+
+from ..core.metrics import Counter, Gauge
+from ..core.shared_state import shared_state
+
+# 默认关闭；设为 False 即可随时停用（kill switch），已缓存的回答不再使用
+PROMPT_CACHE_ENABLED = os.getenv("PROMPT_CACHE_ENABLED", "False").lower() == "true"
+# 字符 n-gram 集合的 Jaccard 相似度达到阈值才视为同一问题；默认 1.0 只复用归一化后完全相同的问题。
+# 短问题中换一个地名或数字相似度仍有 0.7~0.8（"北京天气" 与 "南京天气"），近似匹配的阈值应高于 0.9
+PROMPT_CACHE_THRESHOLD = float(os.getenv("PROMPT_CACHE_THRESHOLD", "1.0"))
+PROMPT_CACHE_TTL_SECONDS = int(os.getenv("PROMPT_CACHE_TTL_SECONDS", "86400"))
+PROMPT_CACHE_MAX_ENTRIES = int(os.getenv("PROMPT_CACHE_MAX_ENTRIES", "5000"))
+# 只缓存短问题，长文本几乎不会重复
+PROMPT_CACHE_MAX_CHARS = int(os.getenv("PROMPT_CACHE_MAX_CHARS", "200"))
+PROMPT_CACHE_NGRAM = int(os.getenv("PROMPT_CACHE_NGRAM", "2"))
+
+# MinHash 签名长度 = 分带数 * 每带行数；阈值附近的候选召回率约为 1-(1-s^r)^b
+NUM_BANDS = 16
+ROWS_PER_BAND = 4
+NUM_PERMUTATIONS = NUM_BANDS * ROWS_PER_BAND
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+
+# 固定种子，签名在进程重启后保持一致
+_rng = random.Random(20240601)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(NUM_PERMUTATIONS)
+]
+
+# 句尾语气词不影响问题含义
+_FILLER_RE = re.compile(r"[啊呀呢吧吗嘛哦哈么]+$")
+# 近似匹配时两个问题只允许在这些字上不同（虚词、语气词、代词、疑问词）；
+# 其他字、字母或数字不同（地名、人名、数量等实体）即视为不同的问题
+_IGNORABLE_CHARS = frozenset("的地得了着过呢吧啊呀吗嘛哦哈么请问一下些个都也还就再到底简单帮我给你您能可以会要想用怎样如何什")
+
+PROMPT_CACHE_LOOKUPS = Counter(
+    "prompt_cache_lookups_total",
+    "首轮文本对话的提示缓存查询（hit: 复用缓存回答, miss: 调用模型）",
+    labels=("result",),
+)
+PROMPT_CACHE_ENTRIES = Gauge("prompt_cache_entries", "提示缓存中的条目数", aggregate="max")
+
+
+def normalize(text: str) -> str:
+    """归一化：全半角统一、转小写、去掉标点符号和空白以及句尾语气词"""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = "".join(
+        ch for ch in text
+        if not unicodedata.category(ch).startswith(("P", "S", "Z", "C"))
+    )
+    return _FILLER_RE.sub("", text)
+
+
+def shingles(text: str, n: int = PROMPT_CACHE_NGRAM) -> FrozenSet[str]:
+    if len(text) <= n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def _shingle_hash(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "big")
+
+
+def minhash(items: FrozenSet[str]) -> Tuple[int, ...]:
+    hashes = [_shingle_hash(item) for item in items]
+    return tuple(
+        min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+        for a, b in _PERMUTATIONS
+    )
+
+
+def same_entities(left: str, right: str) -> bool:
+    """两个归一化后的问题是否只在虚词、语气词等可忽略的字上不同"""
+    matcher = difflib.SequenceMatcher(None, left, right, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal" and not set(left[i1:i2] + right[j1:j2]) <= _IGNORABLE_CHARS:
+            return False
+    return True
+
+
+def jaccard(left: FrozenSet[str], right: FrozenSet[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+@dataclass
+class CacheEntry:
+    id: int
+    normalized: str
+    shingles: FrozenSet[str]
+    answer: str
+    created: float
+    hits: int = 0
+    bands: List[Tuple[int, Tuple[int, ...]]] = field(default_factory=list)
+
+
+@dataclass
+class CacheHit:
+    answer: str
+    similarity: float
+    prompt: str  # 命中的缓存问题（归一化后）
+
+
+class PromptCache:
+    """近似重复问题的回答缓存
+
+    默认（threshold=1.0）只复用归一化后完全相同的问题。阈值小于 1 时启用近似匹配：
+    对归一化文本的字符 n-gram 计算 MinHash 签名，用分带 LSH 找候选，再用精确的 Jaccard 相似度确认，
+    达到阈值且两者只在虚词、语气词上不同（实体和数字相同）才复用回答。保存在进程内存中，按 LRU 和 TTL 淘汰；
+    新条目广播给其他工作进程，各进程的缓存内容保持一致。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        threshold: float = 1.0,
+        ttl: float = 86400,
+        max_entries: int = 5000,
+        max_chars: int = 200,
+    ):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self._entries: "OrderedDict[int, CacheEntry]" = OrderedDict()
+        self._exact: Dict[str, int] = {}
+        self._bands: Dict[Tuple[int, Tuple[int, ...]], Set[int]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def cacheable(self, prompt: str) -> bool:
+        return self.enabled and 0 < len(prompt.strip()) <= self.max_chars
+
+    def lookup(self, prompt: str) -> Optional[CacheHit]:
+        """查找相似问题的缓存回答，未命中返回None"""
+        if not self.cacheable(prompt):
+            return None
+        normalized = normalize(prompt)
+        if not normalized:
+            return None
+        items = shingles(normalized)
+        now = time.monotonic()
+        with self._lock:
+            best, best_similarity = None, 0.0
+            entry_id = self._exact.get(normalized)
+            if entry_id is not None:
+                best, best_similarity = self._entries[entry_id], 1.0
+            elif self.threshold < 1.0:
+                for entry_id in self._candidates(minhash(items)):
+                    entry = self._entries[entry_id]
+                    similarity = jaccard(items, entry.shingles)
+                    if similarity > best_similarity and same_entities(normalized, entry.normalized):
+                        best, best_similarity = entry, similarity
+            if best is not None and now - best.created > self.ttl:
+                self._remove(best.id)
+                best = None
+            if best is None or best_similarity < self.threshold:
+                PROMPT_CACHE_LOOKUPS.inc(result="miss")
+                return None
+            best.hits += 1
+            self._entries.move_to_end(best.id)
+        PROMPT_CACHE_LOOKUPS.inc(result="hit")
+        return CacheHit(answer=best.answer, similarity=best_similarity, prompt=best.normalized)
+
+    def _candidates(self, signature: Tuple[int, ...]) -> Set[int]:
+        result: Set[int] = set()
+        for key in self._band_keys(signature):
+            result.update(self._bands.get(key, ()))
+        return result
+
+    @staticmethod
+    def _band_keys(signature: Tuple[int, ...]) -> List[Tuple[int, Tuple[int, ...]]]:
+        return [
+            (band, signature[band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND])
+            for band in range(NUM_BANDS)
+        ]
+
+    def store(self, prompt: str, answer: str):
+        """保存问题和模型的回答；已有相同问题时覆盖"""
+        if self._insert(prompt, answer):
+            shared_state.broadcast("prompt_cache", {"prompt": prompt, "answer": answer})
+
+    def store_remote(self, message: Dict[str, str]):
+        """其他工作进程广播来的条目"""
+        self._insert(message["prompt"], message["answer"])
+
+    def _insert(self, prompt: str, answer: str) -> bool:
+        if not self.cacheable(prompt) or not answer:
+            return False
+        normalized = normalize(prompt)
+        if not normalized:
+            return False
+        items = shingles(normalized)
+        signature = minhash(items)
+        with self._lock:
+            existing = self._exact.get(normalized)
+            if existing is not None:
+                self._remove(existing)
+            self._next_id += 1
+            entry = CacheEntry(
+                id=self._next_id, normalized=normalized, shingles=items,
+                answer=answer, created=time.monotonic(),
+                bands=self._band_keys(signature),
+            )
+            self._entries[entry.id] = entry
+            self._exact[normalized] = entry.id
+            for key in entry.bands:
+                self._bands.setdefault(key, set()).add(entry.id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+            PROMPT_CACHE_ENTRIES.set(len(self._entries))
+        return True
+
+    def _remove(self, entry_id: int):
+        entry = self._entries.pop(entry_id, None)
+        if entry is None:
+            return
+        self._exact.pop(entry.normalized, None)
+        for key in entry.bands:
+            bucket = self._bands.get(key)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._bands[key]
+        PROMPT_CACHE_ENTRIES.set(len(self._entries))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            self._bands.clear()
+            PROMPT_CACHE_ENTRIES.set(0)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+prompt_cache = PromptCache(
+    enabled=PROMPT_CACHE_ENABLED,
+    threshold=PROMPT_CACHE_THRESHOLD,
+    ttl=PROMPT_CACHE_TTL_SECONDS,
+    max_entries=PROMPT_CACHE_MAX_ENTRIES,
+    max_chars=PROMPT_CACHE_MAX_CHARS,
+)
+
+if prompt_cache.enabled:
+    shared_state.listen("prompt_cache", prompt_cache.store_remote)
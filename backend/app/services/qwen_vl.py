@@ -1,171 +1,265 @@
-import base64
+import asyncio
 import httpx
-from typing import List, Dict, Any, Optional
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, AsyncIterator, Callable
 import os
+import json
+import time
 import logging
+from .image_processing import EncodedImage, prepare_image
+from .model_router import DEFAULT_MAX_TOKENS, DEFAULT_TEMPERATURE, ModelTier, model_router
+from .request_body import StreamingJSONBody, new_placeholder
+from ..core.deadline import DeadlineExceeded, within
+from ..core.metrics import Gauge
+from ..core.tracing import record_span
+from ..core.workers import per_worker
 
 logger = logging.getLogger(__name__)
 
+# 模型和生成参数由 model_router 的档位配置决定
+REQUEST_TIMEOUT = 60.0
+# 同时发往上游的请求上限（所有工作进程合计，平分给各进程），超出的请求排队等待（消耗请求时限）
+UPSTREAM_MAX_CONCURRENCY = per_worker(int(os.getenv("QWEN_MAX_CONCURRENCY", "32")))
+# 连接预热的最小间隔，连接池中的空闲连接在此期间通常仍然可用
+WARM_UP_INTERVAL = 30.0
+
+TEXT_SYSTEM_PROMPT = "你是一个有帮助的AI助手，请用中文回答用户的问题，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"
+VISION_SYSTEM_PROMPT = "你是一个专业的图像分析助手，能够准确分析图片内容并回答用户问题。请用中文回答，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"
+DEFAULT_IMAGE_PROMPT = "请分析这张图片的内容，用中文详细描述你看到了什么。"
+
+# 对话历史最多保留的消息条数
+HISTORY_LIMIT = 5
+
+UPSTREAM_INFLIGHT = Gauge("qwen_upstream_inflight", "正在进行的上游请求数")
+
+
+@dataclass
+class CompletionRequest:
+    """一次对话补全请求"""
+    model: str
+    messages: List[Dict[str, Any]]
+    max_tokens: int = DEFAULT_MAX_TOKENS
+    temperature: float = DEFAULT_TEMPERATURE
+    image: Optional[EncodedImage] = None  # 填入消息中 image_placeholder 位置的图片
+    image_placeholder: str = ""
+
+    def payload(self, stream: bool) -> Dict[str, Any]:
+        data = {
+            "model": self.model,
+            "messages": self.messages,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "stream": stream,
+        }
+        if stream:
+            data["stream_options"] = {"include_usage": True}
+        return data
+
+
+@dataclass
+class CompletionChunk:
+    """流式输出的一个片段"""
+    content: str = ""
+    usage: Optional[Dict[str, Any]] = None
+
+
+@dataclass
+class CompletionResult:
+    """完整的补全结果"""
+    content: str
+    usage: Dict[str, Any] = field(default_factory=dict)
+
+
+class QwenAPIError(Exception):
+    """上游API返回非200状态码"""
+
+    def __init__(self, status_code: int, detail: str = ""):
+        self.status_code = status_code
+        self.detail = detail
+        super().__init__(f"API调用失败: {status_code}")
+
+
+def build_text_request(history: List[Dict[str, str]], message: str, tier: ModelTier) -> CompletionRequest:
+    """构建文本对话请求，history为按时间升序的 role/content 列表"""
+    messages = [{"role": "system", "content": TEXT_SYSTEM_PROMPT}]
+    messages.extend(history[-HISTORY_LIMIT:])
+    messages.append({"role": "user", "content": message})
+    return CompletionRequest(
+        model=tier.model, messages=messages, max_tokens=tier.max_tokens, temperature=tier.temperature
+    )
+
+
+def build_image_request(image: EncodedImage, prompt: Optional[str], tier: ModelTier) -> CompletionRequest:
+    """构建图片分析请求，图片在发送时流式编码进请求体"""
+    placeholder = new_placeholder()
+    messages = [
+        {"role": "system", "content": VISION_SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": prompt or DEFAULT_IMAGE_PROMPT},
+                {"type": "image_url", "image_url": {"url": placeholder}},
+            ],
+        },
+    ]
+    return CompletionRequest(
+        model=tier.model, messages=messages, max_tokens=tier.max_tokens,
+        temperature=tier.temperature, image=image, image_placeholder=placeholder
+    )
+
+
+def _upstream_too_slow(error: Exception) -> bool:
+    """上游在首个片段之前超时（排队超时是本地的拥塞，不计入）"""
+    if isinstance(error, DeadlineExceeded):
+        return error.stage in ("upstream_connect", "first_token")
+    return isinstance(error, httpx.TimeoutException)
+
+
 class QwenVLService:
     """Qwen-VL API服务"""
-    
+
     def __init__(self):
         self.api_key = os.getenv("QWEN_API_KEY", "your-qwen-api-key-here")
         self.base_url = os.getenv("QWEN_BASE_URL", "https://dashscope.aliyuncs.com/compatible-mode/v1")
-        self.client = httpx.AsyncClient(timeout=60.0)
-    
+        self.client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+        self._slots = asyncio.Semaphore(UPSTREAM_MAX_CONCURRENCY)
+        self._last_warm_up = 0.0
+
+    def _build_http_request(self, request: CompletionRequest, stream: bool) -> httpx.Request:
+        """构建HTTP请求：带图片时使用流式请求体"""
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        url = f"{self.base_url}/chat/completions"
+        if request.image is not None:
+            body = StreamingJSONBody(
+                request.payload(stream), memoryview(request.image.data), request.image.mime_type,
+                request.image_placeholder,
+            )
+            return self.client.build_request("POST", url, headers={**headers, **body.headers}, content=body)
+        return self.client.build_request("POST", url, headers=headers, json=request.payload(stream))
+
+    async def stream_completion(
+        self,
+        request: CompletionRequest,
+        on_ttft: Optional[Callable[[float], None]] = None,
+    ) -> AsyncIterator[CompletionChunk]:
+        """流式对话补全，逐段产出模型输出；上游返回错误时抛出QwenAPIError
+
+        有请求时限时，排队、建立连接和等待首个片段都只在剩余时限内进行；首个片段之后不再限制。
+        on_ttft 收到上游首字延迟（从发出请求到首个片段，不含排队和本地处理）；
+        上游在首个片段之前超时的话收到已等待的时间，同样计为一次慢请求。
+        """
+        await within("upstream_queue", self._slots.acquire())
+        UPSTREAM_INFLIGHT.inc()
+        sent = time.perf_counter()
+        first_token_at = None
+        try:
+            http_request = self._build_http_request(request, stream=True)
+            response = await within("upstream_connect", self.client.send(http_request, stream=True))
+            try:
+                if response.status_code != 200:
+                    detail = (await response.aread()).decode("utf-8", errors="replace")
+                    logger.error("Qwen API错误: %s - %s", response.status_code, detail)
+                    raise QwenAPIError(response.status_code, detail)
+
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        if first_token_at is None:
+                            line = await within("first_token", lines.__anext__())
+                        else:
+                            line = await lines.__anext__()
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data: "):
+                        continue
+                    data_str = line[6:]  # 移除 "data: " 前缀
+                    if data_str.strip() == "[DONE]":
+                        break
+                    try:
+                        chunk = json.loads(data_str)
+                    except json.JSONDecodeError:
+                        continue
+                    if chunk.get("usage"):
+                        yield CompletionChunk(usage=chunk["usage"])
+                    choices = chunk.get("choices") or []
+                    if choices:
+                        content = choices[0].get("delta", {}).get("content")
+                        if content:
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                record_span("upstream_ttft", sent, first_token_at - sent, model=request.model)
+                                if on_ttft is not None:
+                                    on_ttft(first_token_at - sent)
+                            yield CompletionChunk(content=content)
+            finally:
+                await response.aclose()
+        except (DeadlineExceeded, httpx.TimeoutException) as e:
+            if on_ttft is not None and first_token_at is None and _upstream_too_slow(e):
+                on_ttft(time.perf_counter() - sent)
+            raise
+        finally:
+            if first_token_at is not None:
+                record_span("upstream_stream", first_token_at, time.perf_counter() - first_token_at)
+            UPSTREAM_INFLIGHT.dec()
+            self._slots.release()
+
+    async def complete(self, request: CompletionRequest) -> CompletionResult:
+        """非流式对话补全，基于stream_completion汇总结果；有请求时限时整个生成都须在时限内完成"""
+        return await within("generation", self._collect(request))
+
+    async def _collect(self, request: CompletionRequest) -> CompletionResult:
+        parts = []
+        usage: Dict[str, Any] = {}
+        async for chunk in self.stream_completion(request):
+            if chunk.content:
+                parts.append(chunk.content)
+            if chunk.usage:
+                usage = chunk.usage
+        return CompletionResult(content="".join(parts), usage=usage)
+
     async def analyze_image(
-        self, 
-        image_data: bytes, 
+        self,
+        image_data: bytes,
         prompt: str = "请分析这张图片的内容，用中文回答。"
     ) -> Dict[str, Any]:
         """分析图片内容"""
         try:
-            # 将图片转换为base64
-            image_base64 = base64.b64encode(image_data).decode('utf-8')
-            
-            # 构建请求数据
-            messages = [
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": prompt
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": f"data:image/jpeg;base64,{image_base64}"
-                            }
-                        }
-                    ]
-                }
-            ]
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
+            tier = model_router.route(prompt, has_image=True).tier
+            image = await prepare_image(image_data, tier.model)
+            result = await self.complete(build_image_request(image, prompt, tier))
+            return {
+                "success": True,
+                "content": result.content,
+                "usage": result.usage
             }
-            
-            data = {
-                "model": "qwen-vl-plus",  # Qwen-VL图像分析模型
-                "messages": messages,
-                "max_tokens": 1500,
-                "temperature": 0.7
+        except QwenAPIError as e:
+            return {
+                "success": False,
+                "error": str(e)
             }
-            
-            # 发送请求
-            response = await self.client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data
-            )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "content": result["choices"][0]["message"]["content"],
-                    "usage": result.get("usage", {})
-                }
-            else:
-                logger.error(f"Qwen-VL API错误: {response.status_code} - {response.text}")
-                return {
-                    "success": False,
-                    "error": f"API调用失败: {response.status_code}"
-                }
-                
         except Exception as e:
-            logger.error(f"Qwen-VL服务错误: {str(e)}")
+            logger.error("Qwen-VL服务错误: %s", e)
             return {
                 "success": False,
                 "error": f"服务错误: {str(e)}"
             }
-    
-    async def chat_with_image(
-        self, 
-        image_data: bytes, 
-        user_message: str,
-        conversation_history: Optional[List[Dict[str, Any]]] = None
-    ) -> Dict[str, Any]:
-        """与图片进行对话"""
+
+    async def warm_up(self):
+        """预先建立到上游的连接（放回连接池供随后的请求复用），短时间内只预热一次"""
+        now = time.monotonic()
+        if now - self._last_warm_up < WARM_UP_INTERVAL:
+            return
+        self._last_warm_up = now
         try:
-            # 构建对话历史
-            messages = []
-            
-            # 添加系统消息
-            messages.append({
-                "role": "system",
-                "content": "你是一个专业的图像分析助手，能够准确分析图片内容并回答用户问题。请用中文回答，并使用Markdown格式来组织你的回答，包括标题、列表、强调等。"
-            })
-            
-            # 添加对话历史
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # 只保留最近5条消息
-                    messages.append({
-                        "role": msg["role"],
-                        "content": msg["content"]
-                    })
-            
-            # 添加当前用户消息和图片
-            messages.append({
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": user_message
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{base64.b64encode(image_data).decode('utf-8')}"
-                        }
-                    }
-                ]
-            })
-            
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            }
-            
-            data = {
-                "model": "qwen-vl-plus",
-                "messages": messages,
-                "max_tokens": 1500,
-                "temperature": 0.7,
-                "stream": False
-            }
-            
-            # 发送请求
-            response = await self.client.post(
-                f"{self.base_url}/chat/completions",
-                headers=headers,
-                json=data
+            response = await self.client.get(
+                f"{self.base_url}/models",
+                headers={"Authorization": f"Bearer {self.api_key}"},
+                timeout=5.0,
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "content": result["choices"][0]["message"]["content"],
-                    "usage": result.get("usage", {})
-                }
-            else:
-                logger.error(f"Qwen-VL API错误: {response.status_code} - {response.text}")
-                return {
-                    "success": False,
-                    "error": f"API调用失败: {response.status_code}"
-                }
-                
-        except Exception as e:
-            logger.error(f"Qwen-VL对话错误: {str(e)}")
-            return {
-                "success": False,
-                "error": f"对话错误: {str(e)}"
-            }
-    
+            await response.aclose()
+        except httpx.HTTPError as e:
+            logger.debug("上游连接预热失败: %s", e)
+
     async def close(self):
         """关闭HTTP客户端"""
         await self.client.aclose()
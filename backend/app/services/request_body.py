@@ -0,0 +1,82 @@
+import asyncio
+import base64
+import json
+import os
+import secrets
+from typing import Any, AsyncIterator, Dict, Union
+
+# 每次编码的原始字节数，必须是3的倍数，保证分块base64可以直接拼接
+CHUNK_SIZE = 3 * 64 * 1024
+
+ImageSource = Union[bytes, bytearray, memoryview, str, os.PathLike]
+
+
+def new_placeholder() -> str:
+    """每个请求单独生成的图片data URL占位符，用户输入的文本无法预先包含它"""
+    return f"__image_{secrets.token_hex(16)}__"
+
+
+class StreamingJSONBody:
+    """流式JSON请求体：图片按块base64编码后写入JSON信封，避免在内存中拼出完整请求体
+
+    payload 中图片data URL的位置填写 placeholder（new_placeholder() 生成），序列化后在此处切开信封。
+    """
+
+    def __init__(
+        self,
+        payload: Dict[str, Any],
+        image: ImageSource,
+        mime_type: str,
+        placeholder: str,
+        chunk_size: int = CHUNK_SIZE,
+    ):
+        if chunk_size % 3:
+            raise ValueError("chunk_size必须是3的倍数")
+        envelope = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        marker = placeholder.encode()
+        if not placeholder or envelope.count(marker) != 1:
+            raise ValueError("请求体中须有且只有一个图片占位符")
+        self.prefix, _, self.suffix = envelope.partition(marker)
+        self.prefix += f"data:{mime_type};base64,".encode()
+        self.image = image
+        self.chunk_size = chunk_size
+
+    def _image_size(self) -> int:
+        if isinstance(self.image, (bytes, bytearray, memoryview)):
+            return memoryview(self.image).nbytes
+        return os.path.getsize(self.image)
+
+    @property
+    def content_length(self) -> int:
+        """请求体总长度，用于设置Content-Length以避免分块传输"""
+        encoded_size = (self._image_size() + 2) // 3 * 4
+        return len(self.prefix) + encoded_size + len(self.suffix)
+
+    def _read_encoded(self, f) -> bytes:
+        return base64.b64encode(f.read(self.chunk_size))
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self.prefix
+        if isinstance(self.image, (bytes, bytearray, memoryview)):
+            view = memoryview(self.image)
+            for offset in range(0, view.nbytes, self.chunk_size):
+                yield base64.b64encode(view[offset:offset + self.chunk_size])
+        else:
+            # 文件的打开、读取和编码在线程池中进行，不阻塞事件循环
+            f = await asyncio.to_thread(open, self.image, "rb")
+            try:
+                while True:
+                    encoded = await asyncio.to_thread(self._read_encoded, f)
+                    if not encoded:
+                        break
+                    yield encoded
+            finally:
+                f.close()
+        yield self.suffix
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            "Content-Type": "application/json",
+            "Content-Length": str(self.content_length),
+        }
@@ -0,0 +1,279 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session, sessionmaker
+
+from . import storage
+from .image_processing import VARIANT_WIDTHS
+from .session_sync import record_tombstones, purge_tombstones
+from ..core.shared_state import shared_state
+from ..db.database import SessionLocal
+from ..models.archived_session import ArchivedSession, ArchivedSessionUpload
+from ..models.chat_session import ChatSession
+from ..models.message import Message
+
+logger = logging.getLogger(__name__)
+
+# 最近被上传过的文件不释放：可能刚上传、还没有消息引用它
+RELEASE_GRACE_SECONDS = int(os.getenv("UPLOAD_RELEASE_GRACE_SECONDS", "600"))
+
+# 释放文件的后台任务，保留引用避免被垃圾回收
+_background_tasks: Set[asyncio.Task] = set()
+
+
+def upload_reference_filter(filename: str):
+    """引用了指定上传文件的消息的过滤条件（等值查询 ix_messages_upload_filename）"""
+    return Message.upload_filename == filename
+
+
+def archive_reference_filter(filename: str):
+    """引用了指定上传文件的归档会话的过滤条件（按 archived_session_uploads 的主键查询）"""
+    return ArchivedSession.id.in_(
+        select(ArchivedSessionUpload.archived_session_id).where(ArchivedSessionUpload.filename == filename)
+    )
+
+
+def user_owns_upload(db: Session, user_id: int, filename: str) -> bool:
+    """用户是否在自己的会话（含已归档的）中发送过该上传文件"""
+    return bool(
+        db.query(Message.id).join(ChatSession).filter(
+            upload_reference_filter(filename),
+            ChatSession.user_id == user_id
+        ).first() or db.query(ArchivedSession.id).filter(
+            archive_reference_filter(filename),
+            ArchivedSession.user_id == user_id
+        ).first()
+    )
+
+
+def archived_upload_filenames(archived_sessions) -> Set[str]:
+    """归档会话引用的上传文件，参数为带 image_filenames 属性的行"""
+    return {
+        filename
+        for archived in archived_sessions
+        for filename in (archived.image_filenames or "").split()
+    }
+
+
+def session_upload_filenames(db: Session, session_ids: Iterable[str]) -> Set[str]:
+    """会话中消息引用的本服务上传文件"""
+    return set(db.scalars(
+        select(Message.upload_filename).where(
+            Message.chat_session_id.in_(list(session_ids)),
+            Message.upload_filename.is_not(None)
+        ).distinct()
+    ))
+
+
+def delete_sessions(db: Session, *conditions) -> int:
+    """按条件批量删除会话，消息由数据库的 ON DELETE CASCADE 删除，返回删除的会话数"""
+    result = db.execute(
+        delete(ChatSession).where(*conditions).execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+def _release_uploads(filenames: Set[str], session_factory: sessionmaker) -> Tuple[int, Set[str]]:
+    db = session_factory()
+    released, deferred = 0, set()
+    try:
+        for filename in filenames:
+            if db.query(Message.id).filter(upload_reference_filter(filename)).first():
+                continue
+            if db.query(ArchivedSessionUpload.filename).filter(ArchivedSessionUpload.filename == filename).first():
+                continue
+            try:
+                modified = os.path.getmtime(storage.upload_path(filename))
+            except FileNotFoundError:
+                modified = 0
+            if time.time() - modified < RELEASE_GRACE_SECONDS:
+                deferred.add(filename)
+                continue
+            storage.delete_upload(filename, VARIANT_WIDTHS)
+            released += 1
+    finally:
+        db.close()
+    return released, deferred
+
+
+async def release_uploads(
+    filenames: Set[str],
+    session_factory: sessionmaker = SessionLocal
+) -> Tuple[int, Set[str]]:
+    """删除不再被任何消息引用的上传文件及其缩略图
+
+    返回删除的文件数，以及因最近被上传过而暂缓释放的文件。
+    """
+    if not filenames:
+        return 0, set()
+    return await asyncio.to_thread(_release_uploads, filenames, session_factory)
+
+
+async def _release_after_delete(filenames: Set[str]):
+    _, deferred = await release_uploads(filenames)
+    if deferred:
+        # 宽限期过后再检查一次
+        await asyncio.sleep(RELEASE_GRACE_SECONDS)
+        await release_uploads(deferred)
+
+
+def _log_release_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("释放上传文件失败: %s", task.exception())
+
+
+def schedule_release(filenames: Set[str]):
+    """删除会话后在后台释放其图片文件"""
+    if not filenames:
+        return
+    task = asyncio.create_task(_release_after_delete(filenames))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    task.add_done_callback(_log_release_failure)
+
+
+def _deleted_rows(db: Session, model, rows) -> List[Tuple[str, int]]:
+    """批量删除后仍存在的行未被删除（删除前又有更新），返回实际删除的 (id, user_id)"""
+    remaining = set(db.scalars(select(model.id).where(model.id.in_([row.id for row in rows]))))
+    return [(row.id, row.user_id) for row in rows if row.id not in remaining]
+
+
+class RetentionSweeper:
+    """过期会话清理：定期删除超过保留天数未更新的会话（包括已归档的会话）
+
+    每批只删除少量会话并单独提交，批次之间短暂停顿，避免长时间持有行锁。
+    """
+
+    def __init__(
+        self,
+        session_factory: sessionmaker,
+        retention_days: int = 0,
+        batch_size: int = 100,
+        interval: float = 3600,
+        batch_pause: float = 0.1,
+    ):
+        self.session_factory = session_factory
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.batch_pause = batch_pause
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.retention_days > 0
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("过期会话清理已启动: 保留 %s 天, 每批 %s 个会话", self.retention_days, self.batch_size)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                # 多个工作进程时每个周期只由取得租约的一个进程执行
+                if await shared_state.acquire("retention_sweep", self.interval):
+                    purged = await self.sweep()
+                    if purged:
+                        logger.info("已清理 %s 个过期会话", purged)
+            except Exception:
+                logger.exception("过期会话清理失败，将在下个周期重试")
+            await asyncio.sleep(self.interval)
+
+    async def sweep(self) -> int:
+        """分批清理全部过期会话，返回清理的会话数"""
+        cutoff = datetime.utcnow() - timedelta(days=self.retention_days)
+        total = 0
+        while True:
+            purged, filenames = await asyncio.to_thread(self._purge_batch, cutoff)
+            total += purged
+            await release_uploads(filenames, self.session_factory)
+            # 热表不足一批时下一批会转到归档表，两者都清理完才结束
+            if purged == 0:
+                break
+            await asyncio.sleep(self.batch_pause)
+        # 过期的删除记录
+        while await asyncio.to_thread(self._purge_tombstones) >= self.batch_size:
+            await asyncio.sleep(self.batch_pause)
+        return total
+
+    def _purge_tombstones(self) -> int:
+        db = self.session_factory()
+        try:
+            purged = purge_tombstones(db, self.batch_size)
+            db.commit()
+            return purged
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _purge_batch(self, cutoff: datetime) -> Tuple[int, Set[str]]:
+        db = self.session_factory()
+        try:
+            # 锁定要删除的会话，正在写入的会话被跳过；删除时再按最新提交的版本判断是否过期，
+            # 选出后又有新消息的会话不删除（不支持行锁的数据库上同样成立）
+            expired = func.coalesce(ChatSession.updated_at, ChatSession.created_at) < cutoff
+            sessions = db.execute(
+                select(ChatSession.id, ChatSession.user_id)
+                .where(expired)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if sessions:
+                session_ids = [session.id for session in sessions]
+                filenames = session_upload_filenames(db, session_ids)
+                purged = delete_sessions(db, ChatSession.id.in_(session_ids), expired)
+                record_tombstones(db, _deleted_rows(db, ChatSession, sessions))
+                db.commit()
+                return purged, filenames
+            # 热表清理完后再清理过期的归档会话
+            archived_expired = func.coalesce(ArchivedSession.updated_at, ArchivedSession.created_at) < cutoff
+            archived_sessions = db.execute(
+                select(ArchivedSession.id, ArchivedSession.user_id, ArchivedSession.image_filenames)
+                .where(archived_expired)
+                .limit(self.batch_size)
+                .with_for_update(skip_locked=True)
+            ).all()
+            if not archived_sessions:
+                db.rollback()
+                return 0, set()
+            filenames = archived_upload_filenames(archived_sessions)
+            purged = db.execute(
+                delete(ArchivedSession)
+                .where(ArchivedSession.id.in_([archived.id for archived in archived_sessions]), archived_expired)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            record_tombstones(db, _deleted_rows(db, ArchivedSession, archived_sessions))
+            db.commit()
+            return purged, filenames
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+
+# 全局清理任务，RETENTION_DAYS 为0时关闭
+retention_sweeper = RetentionSweeper(
+    SessionLocal,
+    retention_days=int(os.getenv("RETENTION_DAYS", "0")),
+    batch_size=int(os.getenv("RETENTION_BATCH_SIZE", "100")),
+    interval=int(os.getenv("RETENTION_INTERVAL_SECONDS", "3600")),
+    batch_pause=int(os.getenv("RETENTION_BATCH_PAUSE_MS", "100")) / 1000,
+)
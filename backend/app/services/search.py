@@ -0,0 +1,128 @@
+import html
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import and_, literal, select
+from sqlalchemy.dialects.mysql import match
+from sqlalchemy.orm import Session
+
+from ..models.chat_session import ChatSession
+from ..models.message import Message, MessageType
+
+# MySQL ngram 分词的词元长度（ngram_token_size，默认2），更短的词无法走全文索引
+NGRAM_TOKEN_SIZE = int(os.getenv("SEARCH_NGRAM_TOKEN_SIZE", "2"))
+SEARCH_FULLTEXT_ENABLED = os.getenv("SEARCH_FULLTEXT", "True").lower() == "true"
+
+MAX_TERMS = 8
+SNIPPET_RADIUS = 40
+
+# 布尔模式中有特殊含义的字符
+BOOLEAN_OPERATORS_RE = re.compile(r'[+\-<>()~*"@]')
+
+
+@dataclass
+class SearchHit:
+    """一条匹配的消息"""
+    message_id: str
+    session_id: str
+    session_title: str
+    type: MessageType
+    content: str
+    timestamp: Optional[datetime]
+    score: float
+
+
+def parse_terms(query: str) -> List[str]:
+    """把查询拆成关键词：按空白分隔，去掉布尔运算符，去重并限制数量"""
+    terms = []
+    for term in BOOLEAN_OPERATORS_RE.sub(" ", query).split():
+        if term.lower() not in (t.lower() for t in terms):
+            terms.append(term)
+    return terms[:MAX_TERMS]
+
+
+def _use_fulltext(db: Session, terms: List[str]) -> bool:
+    return (
+        SEARCH_FULLTEXT_ENABLED
+        and db.get_bind().dialect.name == "mysql"
+        and all(len(term) >= NGRAM_TOKEN_SIZE for term in terms)
+    )
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_messages(
+    db: Session,
+    user_id: int,
+    terms: List[str],
+    limit: int,
+    offset: int = 0,
+    use_fulltext: Optional[bool] = None
+) -> List[SearchHit]:
+    """在用户的消息中搜索同时包含全部关键词的消息，按相关度和时间排序
+
+    MySQL 上使用 ngram 全文索引（布尔模式，每个词作为必须出现的短语）；
+    其他数据库或关键词短于 ngram 词元时退回 LIKE 扫描该用户的消息。
+    """
+    if use_fulltext is None:
+        use_fulltext = _use_fulltext(db, terms)
+
+    if use_fulltext:
+        against = " ".join(f'+"{term}"' for term in terms)
+        score = match(Message.content, against=against).in_boolean_mode()
+        condition = score > 0
+    else:
+        score = literal(0.0)
+        condition = and_(*(
+            Message.content.like(f"%{_escape_like(term)}%", escape="\\") for term in terms
+        ))
+
+    rows = db.execute(
+        select(
+            Message.id, Message.chat_session_id, ChatSession.title, Message.type,
+            Message.content, Message.timestamp, score.label("score")
+        )
+        .join(ChatSession, Message.chat_session_id == ChatSession.id)
+        .where(ChatSession.user_id == user_id, condition)
+        .order_by(score.desc(), Message.timestamp.desc())
+        .limit(limit)
+        .offset(offset)
+    ).all()
+
+    hits = [SearchHit(*row) for row in rows]
+    if not use_fulltext:
+        # LIKE 没有相关度，按关键词出现次数给分（只影响展示，不改变分页顺序）
+        for hit in hits:
+            content = (hit.content or "").lower()
+            hit.score = float(sum(content.count(term.lower()) for term in terms))
+    return hits
+
+
+def highlight(content: Optional[str], terms: List[str], radius: int = SNIPPET_RADIUS) -> str:
+    """截取第一个关键词附近的片段，HTML转义后用 <mark> 标出全部关键词"""
+    content = content or ""
+    pattern = re.compile(
+        "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True)),
+        re.IGNORECASE
+    )
+    first = pattern.search(content)
+    center = first.start() if first else 0
+    start = max(0, center - radius)
+    end = min(len(content), center + radius * 2)
+    fragment = content[start:end]
+
+    parts = []
+    position = 0
+    for found in pattern.finditer(fragment):
+        parts.append(html.escape(fragment[position:found.start()]))
+        parts.append(f"<mark>{html.escape(found.group())}</mark>")
+        position = found.end()
+    parts.append(html.escape(fragment[position:]))
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(content) else ""
+    return prefix + "".join(parts) + suffix
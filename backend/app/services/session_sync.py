@@ -0,0 +1,136 @@
+import base64
+import binascii
+import hashlib
+import os
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+
+from .persistence import write_behind
+from ..db.database import REPLICA_STALENESS_SECONDS
+from ..models.archived_session import ArchivedSession
+from ..models.chat_session import ChatSession
+from ..models.session_tombstone import SessionTombstone
+
+# 增量查询向前重叠的时间：覆盖提交顺序与时间戳顺序不一致的事务和只读副本的落后，客户端按ID去重
+CHANGES_OVERLAP_SECONDS = float(
+    os.getenv("SESSION_CHANGES_OVERLAP_SECONDS", str(max(5.0, REPLICA_STALENESS_SECONDS)))
+)
+# 删除记录保留天数，更早的同步令牌需要全量刷新
+TOMBSTONE_RETENTION_DAYS = int(os.getenv("SESSION_TOMBSTONE_RETENTION_DAYS", "30"))
+
+# 会话列表响应格式变化时递增，使旧ETag失效
+ETAG_VERSION = "1"
+
+
+def encode_token(moment: datetime) -> str:
+    return base64.urlsafe_b64encode(moment.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_token(token: str) -> Optional[datetime]:
+    """解析同步令牌，无效时返回None"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        return datetime.fromisoformat(base64.urlsafe_b64decode(padded).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def sync_token(latest: Optional[datetime]) -> str:
+    """由本次响应读到的最新时间戳生成同步令牌
+
+    令牌取自数据而不是服务器时钟：从落后的只读副本读取时，令牌不会越过副本尚未复制的写入。
+    下限为当前时间减去副本可能的落后时间，长期没有变化的用户的令牌也不会过期。
+    """
+    floor = datetime.utcnow() - timedelta(seconds=REPLICA_STALENESS_SECONDS)
+    return encode_token(max(latest, floor) if latest else floor)
+
+
+def token_expired(since: datetime) -> bool:
+    return since < datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+
+
+def sync_state(db: Session, user_id: int) -> Tuple[Optional[str], str]:
+    """会话列表的ETag和同步令牌，由会话数量和最近更新时间计算；写回队列有未落库数据时不提供ETag"""
+    hot_count, hot_latest = db.execute(
+        select(
+            func.count(ChatSession.id),
+            func.max(func.coalesce(ChatSession.updated_at, ChatSession.created_at))
+        ).where(ChatSession.user_id == user_id)
+    ).one()
+    archived_count, archived_latest = db.execute(
+        select(
+            func.count(ArchivedSession.id),
+            func.max(func.coalesce(ArchivedSession.updated_at, ArchivedSession.created_at))
+        ).where(ArchivedSession.user_id == user_id)
+    ).one()
+    deleted_latest = db.scalar(
+        select(func.max(SessionTombstone.deleted_at)).where(SessionTombstone.user_id == user_id)
+    )
+    token = sync_token(_latest(hot_latest, archived_latest, deleted_latest))
+    if write_behind.enabled and write_behind.has_pending():
+        return None, token
+    state = f"{ETAG_VERSION}:{hot_count}:{hot_latest}:{archived_count}:{archived_latest}:{deleted_latest}"
+    return f'W/"{hashlib.sha256(state.encode()).hexdigest()[:32]}"', token
+
+
+def changes_token(sessions: Iterable[ChatSession], deleted: Iterable[Tuple[str, datetime]]) -> str:
+    """增量响应的同步令牌：返回的会话和删除记录中最新的时间戳"""
+    return sync_token(_latest(
+        *(session.updated_at or session.created_at for session in sessions),
+        *(deleted_at for _, deleted_at in deleted)
+    ))
+
+
+def _latest(*moments: Optional[datetime]) -> Optional[datetime]:
+    # 令牌统一为不带时区的UTC时间
+    moments = [moment.replace(tzinfo=None) for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+def changed_sessions(db: Session, user_id: int, since: datetime) -> List[ChatSession]:
+    """since之后创建或更新的会话（含重叠窗口）"""
+    cutoff = since - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+    return db.query(ChatSession).filter(
+        ChatSession.user_id == user_id,
+        func.coalesce(ChatSession.updated_at, ChatSession.created_at) > cutoff
+    ).order_by(ChatSession.updated_at.desc()).all()
+
+
+def deleted_sessions(db: Session, user_id: int, since: datetime) -> List[Tuple[str, datetime]]:
+    """since之后删除的会话（含重叠窗口），返回 (会话ID, 删除时间)"""
+    cutoff = since - timedelta(seconds=CHANGES_OVERLAP_SECONDS)
+    return [tuple(row) for row in db.execute(
+        select(SessionTombstone.session_id, SessionTombstone.deleted_at).where(
+            SessionTombstone.user_id == user_id,
+            SessionTombstone.deleted_at > cutoff
+        )
+    )]
+
+
+def record_tombstones(db: Session, sessions: Iterable[Tuple[str, int]]):
+    """记录被删除的会话（不提交），sessions为 (会话ID, 用户ID)"""
+    now = datetime.utcnow()
+    rows = [
+        {"session_id": session_id, "user_id": user_id, "deleted_at": now}
+        for session_id, user_id in sessions
+    ]
+    if rows:
+        db.execute(insert(SessionTombstone), rows)
+
+
+def purge_tombstones(db: Session, limit: int) -> int:
+    """删除超过保留期的删除记录（不提交），返回删除的条数"""
+    cutoff = datetime.utcnow() - timedelta(days=TOMBSTONE_RETENTION_DAYS)
+    session_ids = list(db.scalars(
+        select(SessionTombstone.session_id).where(SessionTombstone.deleted_at < cutoff).limit(limit)
+    ))
+    if not session_ids:
+        return 0
+    return db.execute(
+        delete(SessionTombstone)
+        .where(SessionTombstone.session_id.in_(session_ids))
+        .execution_options(synchronize_session=False)
+    ).rowcount
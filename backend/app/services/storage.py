@@ -0,0 +1,155 @@
+import hashlib
+import hmac
+import os
+import re
+import time
+from typing import Dict, Optional
+from urllib.parse import parse_qs, urlparse
+
+from ..core.uploads import UPLOAD_URL_PREFIX, is_safe_filename, upload_filename_from_url  # noqa: F401
+
+# 上传文件目录
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")
+
+# nginx内部location前缀，启用X-Accel-Redirect时由nginx直接发送文件
+X_ACCEL_PREFIX = os.getenv("UPLOAD_X_ACCEL_PREFIX", "/_protected_uploads/")
+X_ACCEL_ENABLED = os.getenv("UPLOAD_X_ACCEL", "False").lower() == "true"
+
+# 图片访问URL的签名密钥，默认与JWT使用同一密钥
+MEDIA_URL_SECRET = (os.getenv("MEDIA_URL_SECRET") or os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")).encode()
+# 图片访问URL的有效期；到期时间按 MEDIA_URL_TTL_STEP_SECONDS 取整，
+# 同一时段内签发的URL相同，浏览器缓存仍然有效，泄露的URL最多在 TTL + STEP 后失效
+MEDIA_URL_TTL_SECONDS = int(os.getenv("MEDIA_URL_TTL_SECONDS", str(7 * 24 * 3600)))
+MEDIA_URL_TTL_STEP_SECONDS = int(os.getenv("MEDIA_URL_TTL_STEP_SECONDS", str(24 * 3600)))
+
+# 内容寻址文件名：sha256 + 扩展名
+CONTENT_ADDRESSED_RE = re.compile(r"^([0-9a-f]{64})\.[a-z0-9]+$")
+
+FORMAT_EXTENSIONS = {
+    "JPEG": ".jpg",
+    "PNG": ".png",
+    "GIF": ".gif",
+    "WEBP": ".webp",
+    "BMP": ".bmp",
+}
+
+
+def content_hash(filename: str) -> Optional[str]:
+    """内容寻址文件返回其sha256，否则返回None"""
+    match = CONTENT_ADDRESSED_RE.match(filename)
+    return match.group(1) if match else None
+
+
+def upload_path(filename: str) -> str:
+    return os.path.join(UPLOAD_DIR, filename)
+
+
+def upload_url(filename: str) -> str:
+    return f"{UPLOAD_URL_PREFIX}{filename}"
+
+
+def save_upload(content: bytes, image_format: Optional[str]) -> str:
+    """按内容哈希保存上传文件，相同内容只存一份，返回文件名"""
+    extension = FORMAT_EXTENSIONS.get(image_format or "", ".jpg")
+    filename = f"{hashlib.sha256(content).hexdigest()}{extension}"
+    path = upload_path(filename)
+    if not os.path.exists(path):
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        # 先写临时文件再原子替换，避免并发请求读到半个文件
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    else:
+        # 重复上传刷新修改时间，释放文件时据此跳过刚上传、尚未被消息引用的文件
+        os.utime(path)
+    return filename
+
+
+def resolve_upload_filename(image_url: Optional[str]) -> Optional[str]:
+    """如果图片URL指向本服务已存在的上传文件，返回文件名"""
+    filename = upload_filename_from_url(image_url)
+    if not filename or not os.path.isfile(upload_path(filename)):
+        return None
+    return filename
+
+
+# 缩略图目录：variants/{原文件名主干}_w{宽度}.webp
+VARIANT_DIR = os.path.join(UPLOAD_DIR, "variants")
+
+
+def variant_filename(filename: str, width: int) -> str:
+    return f"{os.path.splitext(filename)[0]}_w{width}.webp"
+
+
+def variant_path(filename: str, width: int) -> str:
+    return os.path.join(VARIANT_DIR, variant_filename(filename, width))
+
+
+def media_expiry(now: Optional[float] = None) -> int:
+    """新签发URL的到期时间（Unix时间戳），按时段取整"""
+    deadline = int(now if now is not None else time.time()) + MEDIA_URL_TTL_SECONDS
+    step = max(MEDIA_URL_TTL_STEP_SECONDS, 1)
+    return -(-deadline // step) * step
+
+
+def media_signature(filename: str, user_id: int, expires: int) -> str:
+    """用户访问上传文件的签名：绑定用户、文件和到期时间"""
+    message = f"{user_id}:{expires}:{filename}".encode()
+    return hmac.new(MEDIA_URL_SECRET, message, hashlib.sha256).hexdigest()[:32]
+
+
+def verify_media_signature(filename: str, user_id: int, expires: int, signature: str) -> bool:
+    """签名有效且未过期"""
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(media_signature(filename, user_id, expires), signature)
+
+
+def signed_media_user(image_url: Optional[str]) -> Optional[int]:
+    """带有效签名的上传文件URL（media_url 签发）返回签发给的用户ID，否则返回 None"""
+    filename = upload_filename_from_url(image_url)
+    if not filename:
+        return None
+    query = parse_qs(urlparse(image_url).query)
+    user_id, expires, signature = (query.get(name, [""])[0] for name in ("u", "e", "sig"))
+    if not user_id.isdigit() or not expires.isdigit():
+        return None
+    if not verify_media_signature(filename, int(user_id), int(expires), signature):
+        return None
+    return int(user_id)
+
+
+def media_url(filename: str, user_id: int, width: Optional[int] = None, expires: Optional[int] = None) -> str:
+    """<img> 使用的上传文件URL：以签名代替认证头，不在URL中携带访问令牌"""
+    expires = expires or media_expiry()
+    size = f"&w={width}" if width else ""
+    signature = media_signature(filename, user_id, expires)
+    return f"{upload_url(filename)}?u={user_id}&e={expires}{size}&sig={signature}"
+
+
+def image_src(image_url: Optional[str], user_id: int) -> Optional[str]:
+    """本服务上传的图片返回带签名的访问URL，外部图片原样返回"""
+    filename = upload_filename_from_url(image_url)
+    return media_url(filename, user_id) if filename else image_url
+
+
+def image_variants(image_url: Optional[str], widths, user_id: int) -> Dict[str, str]:
+    """本服务上传的图片返回各尺寸缩略图的访问URL，外部图片返回空字典"""
+    filename = upload_filename_from_url(image_url)
+    if not filename:
+        return {}
+    return {str(width): media_url(filename, user_id, width) for width in widths}
+
+
+def delete_upload(filename: str, widths):
+    """删除上传文件及其各尺寸缩略图，文件不存在时忽略"""
+    paths = [upload_path(filename)] + [variant_path(filename, width) for width in widths]
+    # 旧版按最长边生成的缩略图：variants/{原文件名主干}_{尺寸}.webp
+    stem = os.path.splitext(filename)[0]
+    paths += [os.path.join(VARIANT_DIR, f"{stem}_{width}.webp") for width in widths]
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import os
+from functools import lru_cache
+from typing import Dict, Optional, Set, Tuple
+
+from . import storage
+from .image_processing import VARIANT_WIDTHS, display_width, get_image_executor, render_variant
+
+logger = logging.getLogger(__name__)
+
+# 正在生成的缩略图，同一尺寸的并发请求共享一次生成
+_pending: Dict[str, asyncio.Future] = {}
+# 缓存的原图宽度数量；上传文件按内容寻址，宽度不会变化
+VARIANT_WIDTH_CACHE_SIZE = int(os.getenv("VARIANT_WIDTH_CACHE_SIZE", "10000"))
+
+# 上传后触发的后台任务，保留引用避免被垃圾回收
+_background_tasks: Set[asyncio.Task] = set()
+
+
+@lru_cache(maxsize=VARIANT_WIDTH_CACHE_SIZE)
+def _available_widths(filename: str) -> Tuple[int, ...]:
+    try:
+        width = display_width(storage.upload_path(filename))
+    except (OSError, ValueError):
+        logger.warning("无法读取图片尺寸: %s", filename, exc_info=True)
+        return ()
+    return tuple(variant_width for variant_width in VARIANT_WIDTHS if variant_width <= width)
+
+
+def variant_widths(image_url: Optional[str]) -> Tuple[int, ...]:
+    """图片可提供的缩略图宽度：只列出不超过原图宽度的尺寸（缩略图不放大），srcset 的 w 描述符即实际宽度"""
+    filename = storage.upload_filename_from_url(image_url)
+    return _available_widths(filename) if filename else ()
+
+
+async def ensure_variant(filename: str, width: int) -> str:
+    """确保缩略图存在（不存在时在图片进程池中生成），返回其路径"""
+    path = storage.variant_path(filename, width)
+    if os.path.isfile(path):
+        return path
+
+    pending = _pending.get(path)
+    if pending is None:
+        os.makedirs(storage.VARIANT_DIR, exist_ok=True)
+        loop = asyncio.get_running_loop()
+        pending = loop.run_in_executor(
+            get_image_executor(), render_variant, storage.upload_path(filename), path, width
+        )
+        _pending[path] = pending
+        pending.add_done_callback(lambda _: _pending.pop(path, None))
+    await asyncio.shield(pending)
+    return path
+
+
+async def generate_variants(filename: str):
+    """生成全部尺寸的缩略图"""
+    for width in VARIANT_WIDTHS:
+        try:
+            await ensure_variant(filename, width)
+        except Exception:
+            logger.exception("缩略图生成失败: %s (%spx)", filename, width)
+
+
+def schedule_variants(filename: str):
+    """上传完成后在后台预生成缩略图"""
+    task = asyncio.create_task(generate_variants(filename))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
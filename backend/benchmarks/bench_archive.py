@@ -0,0 +1,112 @@
+"""冷存储归档基准测试
+
+用合成数据集运行一次 ArchiveMover，输出归档统计（压缩前后大小、节省空间、热表规模），
+并测量归档会话恢复到热表的延迟。同时对比 zstd 与 zlib 在同一批消息上的压缩率。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/bench_archive.py [--url mysql+pymysql://...] [--messages 200000]
+默认使用本地 SQLite 文件代替 MySQL。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import zlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from app.models import ArchivedSession
+from app.services import archive
+from app.services.archive import ArchiveMover, archive_stats, rehydrate_session
+from synthetic_dataset import create_bench_engine, reset_schema, load_background
+
+
+def codec_comparison(factory, sample):
+    """对同一批归档数据分别用 zstd 和 zlib 压缩"""
+    db = factory()
+    try:
+        rows = db.scalars(select(ArchivedSession).limit(sample)).all()
+        raw = [archive.decompress(row.codec, row.payload) for row in rows]
+    finally:
+        db.close()
+    total = sum(len(data) for data in raw)
+    result = {"zlib": sum(len(zlib.compress(data, archive.ZLIB_LEVEL)) for data in raw)}
+    if archive.zstandard is not None:
+        compressor = archive.zstandard.ZstdCompressor(level=archive.ZSTD_LEVEL)
+        result["zstd"] = sum(len(compressor.compress(data)) for data in raw)
+    return total, result
+
+
+def bench_rehydrate(factory, count):
+    db = factory()
+    try:
+        targets = db.execute(select(ArchivedSession.id, ArchivedSession.user_id).limit(count)).all()
+    finally:
+        db.close()
+    samples = []
+    for session_id, user_id in targets:
+        db = factory()
+        try:
+            start = time.perf_counter()
+            assert rehydrate_session(db, session_id, user_id) is not None
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_archive.db")
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--archive-after-days", type=int, default=30)
+    parser.add_argument("--rehydrate", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_bench_engine(args.url)
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    reset_schema(engine)
+    # 合成会话从一年前开始，大部分会超过归档天数
+    load_background(engine, args.messages, args.users, random.Random(args.seed))
+
+    db = factory()
+    before = archive_stats(db)
+    db.close()
+
+    mover = ArchiveMover(factory, archive_after_days=args.archive_after_days, batch_size=50, batch_pause=0)
+    start = time.perf_counter()
+    run = asyncio.run(mover.run_once())
+    elapsed = time.perf_counter() - start
+
+    db = factory()
+    after = archive_stats(db)
+    db.close()
+
+    print(f"数据库: {engine.url.get_backend_name()}, 编码: {'zstd' if archive.zstandard else 'zlib'}")
+    print(f"归档 {run['sessions']} 个会话, 耗时 {elapsed:.1f}s ({run['sessions'] / elapsed:.0f} 个/秒)")
+    print(f"热表消息: {before['hot_messages']} -> {after['hot_messages']}")
+    ratio = after["archived_raw_bytes"] / max(after["archived_compressed_bytes"], 1)
+    print(f"归档数据: {after['archived_raw_bytes']} -> {after['archived_compressed_bytes']} 字节 "
+          f"({ratio:.1f}x, 节省 {after['reclaimed_bytes']} 字节)")
+
+    total, codecs = codec_comparison(factory, 1000)
+    for codec, size in codecs.items():
+        print(f"  {codec}: {total / max(size, 1):.2f}x")
+
+    samples = bench_rehydrate(factory, args.rehydrate)
+    if samples:
+        print(f"恢复延迟: p50 {statistics.median(samples):.2f}ms, max {max(samples):.2f}ms ({len(samples)} 次)")
+    print(json.dumps(after, default=str, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
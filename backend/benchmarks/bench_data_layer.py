@@ -0,0 +1,203 @@
+"""数据访问路径规模基准测试
+
+直接调用 app/api/chat.py 中的接口函数，在不同数据规模下计时：
+- sessions: get_chat_sessions，用户拥有 N 个会话（每个会话4条消息）
+- history:  _build_completion 的历史查询，会话中有 N 条消息
+- delete:   delete_chat_session，删除含 N 条消息的会话
+
+对相邻规模计算 log-log 斜率（1 为线性），斜率超过 1.15 标记为超线性，
+明显高于该路径预期复杂度的也会标记。安装了 matplotlib 时输出延迟-规模图。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/bench_data_layer.py [--url mysql+pymysql://...] [--background 1000000] [--plot data_layer.png]
+默认使用本地 SQLite 文件代替 MySQL。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import Response
+from sqlalchemy.orm import sessionmaker
+
+from app.api.chat import get_chat_sessions, delete_chat_session, _build_completion
+from app.core.ids import new_id
+from app.models import User, ChatSession, Message
+from app.models.message import MessageType
+from app.schemas.chat import ChatRequest
+from app.services.model_router import model_router
+from synthetic_dataset import create_bench_engine, reset_schema, create_user, load_sessions, load_background
+
+SUPERLINEAR_SLOPE = 1.15
+# 各路径的预期复杂度（log-log 斜率）：历史查询只取最近10条，应与会话大小无关
+EXPECTED_SLOPE = {"sessions": 1.0, "history": 0.0, "delete": 1.0}
+
+
+def timed(fn, repeats):
+    """返回多次执行的中位耗时（毫秒），第一次作为预热不计入"""
+    fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def bench_sessions(engine, factory, size, repeats, rng):
+    user_id = create_user(engine, f"sessions{size}")
+    load_sessions(engine, user_id, [4] * size, rng)
+
+    def run():
+        db = factory()
+        try:
+            user = db.get(User, user_id)
+            result = asyncio.run(get_chat_sessions(response=Response(), if_none_match=None, current_user=user, db=db))
+            assert len(result) == size
+        finally:
+            db.close()
+
+    return timed(run, repeats)
+
+
+def bench_history(engine, factory, size, repeats, rng):
+    user_id = create_user(engine, f"history{size}")
+    session_id = load_sessions(engine, user_id, [size], rng)[0]
+    request = ChatRequest(message="继续", session_id=session_id)
+    tier = model_router.predict(request.message, False)
+
+    def run():
+        db = factory()
+        try:
+            session = db.get(ChatSession, session_id)
+            user_message = Message(id=new_id(), chat_session_id=session_id, type=MessageType.user)
+            completion = asyncio.run(_build_completion(request, session, user_message, db, tier))
+            assert len(completion.messages) > 2
+        finally:
+            db.close()
+
+    return timed(run, repeats)
+
+
+def bench_delete(engine, factory, size, repeats, rng):
+    user_id = create_user(engine, f"delete{size}")
+    samples = []
+    # 每次删除前重新写入会话，写入不计时；多写一次作为预热
+    for _ in range(repeats + 1):
+        session_id = load_sessions(engine, user_id, [size], rng)[0]
+        db = factory()
+        try:
+            user = db.get(User, user_id)
+            start = time.perf_counter()
+            asyncio.run(delete_chat_session(session_id, current_user=user, db=db))
+            samples.append((time.perf_counter() - start) * 1000)
+        finally:
+            db.close()
+    return statistics.median(samples[1:])
+
+
+BENCHMARKS = {
+    "sessions": bench_sessions,
+    "history": bench_history,
+    "delete": bench_delete,
+}
+
+
+def slopes(points):
+    """相邻规模之间的 log-log 斜率"""
+    return [
+        math.log(t2 / t1) / math.log(n2 / n1)
+        for (n1, t1), (n2, t2) in zip(points, points[1:])
+    ]
+
+
+def plot(results, path):
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print("未安装 matplotlib，跳过绘图")
+        return
+    fig, axes = plt.subplots(1, len(results), figsize=(5 * len(results), 4))
+    for ax, (name, points) in zip(axes if len(results) > 1 else [axes], results.items()):
+        sizes, latencies = zip(*points)
+        ax.loglog(sizes, latencies, "o-", label="measured")
+        # 以最小规模为起点的线性参考线
+        ax.loglog(sizes, [latencies[0] * n / sizes[0] for n in sizes], "--", label="linear")
+        ax.set_title(name)
+        ax.set_xlabel("size")
+        ax.set_ylabel("ms")
+        ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    print(f"图表已保存: {path}")
+
+
+def parse_sizes(value):
+    return [int(size) for size in value.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_data_layer.db")
+    parser.add_argument("--background", type=int, default=0, help="先写入的背景消息数，如 1000000")
+    parser.add_argument("--background-users", type=int, default=1000)
+    parser.add_argument("--session-sizes", type=parse_sizes, default=[50, 500, 5000])
+    parser.add_argument("--message-sizes", type=parse_sizes, default=[200, 2000, 20000])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--only", choices=list(BENCHMARKS), action="append")
+    parser.add_argument("--plot", help="图表输出路径（需要 matplotlib）")
+    parser.add_argument("--json", help="原始结果输出路径")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    engine = create_bench_engine(args.url)
+    factory = sessionmaker(bind=engine, autocommit=False, autoflush=False)
+    reset_schema(engine)
+    if args.background:
+        start = time.perf_counter()
+        load_background(engine, args.background, args.background_users, rng)
+        print(f"背景数据: {args.background} 条消息, 耗时 {time.perf_counter() - start:.1f}s")
+
+    results = {}
+    for name in args.only or BENCHMARKS:
+        sizes = args.session_sizes if name == "sessions" else args.message_sizes
+        results[name] = []
+        for size in sizes:
+            latency = BENCHMARKS[name](engine, factory, size, args.repeats, rng)
+            results[name].append((size, latency))
+            print(f"  {name:<9}{size:>8}: {latency:10.2f} ms")
+
+    print(f"\n数据库: {engine.url.get_backend_name()}, 背景消息: {args.background}")
+    print(f"{'路径':<10}{'规模区间':>18}{'斜率':>8}{'预期':>6}  结论")
+    flagged = False
+    for name, points in results.items():
+        for ((n1, _), (n2, _)), slope in zip(zip(points, points[1:]), slopes(points)):
+            expected = EXPECTED_SLOPE[name]
+            verdict = "正常"
+            if slope > SUPERLINEAR_SLOPE:
+                verdict = "超线性"
+            elif slope > expected + 0.5:
+                verdict = "高于预期"
+            flagged |= verdict != "正常"
+            print(f"{name:<10}{f'{n1}->{n2}':>18}{slope:>8.2f}{expected:>6.1f}  {verdict}")
+
+    if args.plot:
+        plot(results, args.plot)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({name: [{"size": n, "ms": t} for n, t in points] for name, points in results.items()}, f, indent=2)
+    sys.exit(1 if flagged else 0)
+
+
+if __name__ == "__main__":
+    main()
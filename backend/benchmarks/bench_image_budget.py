@@ -0,0 +1,102 @@
+"""图片预算编码基准测试
+
+统计样本图片经过模型预算编码后节省的字节数和编码耗时；
+加 --live 时同时对比原图与编码后图片调用上游模型的端到端延迟。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_image_budget.py [图片目录] [--model qwen-vl-plus] [--live]
+"""
+import argparse
+import asyncio
+import base64
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+from PIL import Image
+
+from app.services.image_processing import encode_image
+
+SYNTHETIC_SIZES = [(640, 480), (1920, 1080), (4032, 3024), (6000, 4000)]
+
+
+def load_corpus(directory):
+    """读取样本图片；未指定目录时生成合成图片"""
+    if directory:
+        for name in sorted(os.listdir(directory)):
+            path = os.path.join(directory, name)
+            if os.path.isfile(path):
+                with open(path, "rb") as f:
+                    yield name, f.read()
+        return
+    for width, height in SYNTHETIC_SIZES:
+        image = Image.effect_mandelbrot((width, height), (-2.0, -1.2, 1.0, 1.2), 100).convert("RGB")
+        output = io.BytesIO()
+        image.save(output, format="PNG")
+        yield f"synthetic_{width}x{height}.png", output.getvalue()
+
+
+async def call_upstream(client, model, image_data, mime_type):
+    """发送一次图片分析请求，返回耗时（秒）"""
+    payload = {
+        "model": model,
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "用一句话描述这张图片。"},
+                {"type": "image_url", "image_url": {
+                    "url": f"data:{mime_type};base64,{base64.b64encode(image_data).decode()}"
+                }},
+            ],
+        }],
+        "max_tokens": 50,
+    }
+    start = time.perf_counter()
+    response = await client.post(
+        f"{os.getenv('QWEN_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')}/chat/completions",
+        headers={"Authorization": f"Bearer {os.getenv('QWEN_API_KEY')}"},
+        json=payload,
+    )
+    response.raise_for_status()
+    return time.perf_counter() - start
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", nargs="?", help="样本图片目录")
+    parser.add_argument("--model", default="qwen-vl-plus")
+    parser.add_argument("--live", action="store_true", help="对比上游端到端延迟")
+    args = parser.parse_args()
+
+    total_original = total_encoded = 0
+    client = httpx.AsyncClient(timeout=120.0) if args.live else None
+    print(f"{'图片':<32}{'原始':>12}{'编码后':>12}{'节省':>8}{'编码ms':>10}  格式")
+    for name, data in load_corpus(args.corpus):
+        start = time.perf_counter()
+        encoded = encode_image(data, args.model)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        total_original += len(data)
+        total_encoded += len(encoded.data)
+        ratio = 1 - len(encoded.data) / len(data)
+        print(f"{name:<32}{len(data):>12}{len(encoded.data):>12}{ratio:>8.1%}{elapsed_ms:>10.1f}  "
+              f"{encoded.mime_type} {encoded.width}x{encoded.height}")
+        if client:
+            with Image.open(io.BytesIO(data)) as source:
+                original_mime = Image.MIME.get(source.format, "image/jpeg")
+            original_s = await call_upstream(client, args.model, data, original_mime)
+            encoded_s = await call_upstream(client, args.model, encoded.data, encoded.mime_type)
+            print(f"{'':<32}端到端延迟: 原图 {original_s:.2f}s -> 编码后 {encoded_s:.2f}s")
+    if client:
+        await client.aclose()
+
+    if total_original:
+        print(f"\n合计: {total_original} -> {total_encoded} bytes，"
+              f"节省 {1 - total_encoded / total_original:.1%}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,141 @@
+"""日志开销基准测试
+
+模拟一轮图片对话在请求线程上产生的日志：应用日志（下载、编码、写库等）以及每条SQL的引擎日志，
+对比调用方（即事件循环）每个请求花在日志上的时间：
+- sync-echo:   原先的方式，StreamHandler 同步写输出、f-string 提前格式化、引擎 echo 输出每条SQL
+- async-echo:  队列异步输出，SQL_ECHO 打开（SQL日志经队列和限速）
+- production:  队列异步输出，SQL_ECHO 关闭，按生产配置抽样和限速
+
+输出写到一个模拟的慢速终端/管道（每次写入阻塞 --write-latency 微秒），同时给出丢弃的日志条数。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_logging.py [--requests 2000] [--queries 8] [--write-latency 50]
+"""
+import argparse
+import io
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.logs import (
+    LOG_RECORDS_DROPPED, TEXT_FORMAT, ContextFilter, SamplingFilter, _TextFormatter,
+    async_handler, parse_logger_config, shutdown_logging
+)
+
+APP_LOGGERS = ("app.services.image_fetch", "app.services.image_processing", "app.api.chat")
+SQL_LOGGER = "sqlalchemy.engine.Engine"
+STATEMENT = "SELECT messages.id, messages.type, messages.content FROM messages WHERE messages.chat_session_id = %s ORDER BY messages.timestamp DESC LIMIT %s"
+
+
+class SlowSink(io.TextIOBase):
+    """每次写入阻塞一段时间，模拟终端或日志采集管道的背压"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+
+    def write(self, text: str) -> int:
+        self.writes += 1
+        deadline = time.perf_counter() + self.latency
+        while time.perf_counter() < deadline:
+            pass
+        return len(text)
+
+
+def reset_loggers():
+    for name in ("",) + APP_LOGGERS + (SQL_LOGGER, "sqlalchemy.engine"):
+        logger = logging.getLogger(name)
+        logger.handlers.clear()
+        logger.filters.clear()
+        logger.setLevel(logging.NOTSET)
+    logging.getLogger().setLevel(logging.INFO)
+
+
+def one_request(eager: bool, queries: int, headers: dict):
+    fetch, process, chat = (logging.getLogger(name) for name in APP_LOGGERS)
+    sql = logging.getLogger(SQL_LOGGER)
+    url = "http://localhost/uploads/3f2a9c.jpg"
+    if eager:
+        # 原先的写法：无论是否输出都先格式化
+        fetch.info(f"正在下载图片: {url}")
+        fetch.info(f"图片下载成功，大小: {2_400_000} bytes")
+        chat.info(f"响应头: {headers}")
+    else:
+        fetch.debug("正在下载图片: %s", url)
+        fetch.debug("图片下载成功，大小: %s bytes", 2_400_000)
+        chat.debug("响应头: %s", headers)
+    process.info("图片编码完成: %s -> %s bytes (%s, %sx%s)", 2_400_000, 180_000, "image/jpeg", 1280, 960)
+    for i in range(queries):
+        sql.info(STATEMENT)
+        sql.info("[cached since %.4gs ago] %r", 12.5, ("c0ffee", 10))
+    chat.info("对话完成: session=%s, %s 字", "c0ffee", 420)
+
+
+def run(mode: str, args) -> dict:
+    reset_loggers()
+    sink = SlowSink(args.write_latency / 1e6)
+    console = logging.StreamHandler(sink)
+    console.setFormatter(_TextFormatter(TEXT_FORMAT))
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    root = logging.getLogger()
+
+    if mode == "sync-echo":
+        console.addFilter(ContextFilter())
+        root.addHandler(console)
+        sql_logger.setLevel(logging.INFO)
+    else:
+        sampling = parse_logger_config(args.sampling if mode == "production" else "")
+        rate_limits = parse_logger_config(args.rate_limit)
+        root.addHandler(async_handler(console, (SamplingFilter(sampling, rate_limits), ContextFilter())))
+        sql_logger.setLevel(logging.INFO if mode == "async-echo" else logging.WARNING)
+
+    headers = {f"x-header-{i}": "v" * 40 for i in range(20)}
+    samples = []
+    start = time.perf_counter()
+    for _ in range(args.requests):
+        t0 = time.perf_counter()
+        one_request(mode == "sync-echo", args.queries, headers)
+        samples.append((time.perf_counter() - t0) * 1e6)
+        # 请求之间的其他工作
+        time.sleep(args.interval / 1e6)
+    elapsed = time.perf_counter() - start
+    shutdown_logging()
+    samples.sort()
+    return {
+        "p50": statistics.median(samples),
+        "p99": samples[int(len(samples) * 0.99) - 1],
+        "mean": statistics.mean(samples),
+        "writes": sink.writes,
+        "elapsed": elapsed,
+    }
+
+
+def dropped() -> int:
+    return sum(LOG_RECORDS_DROPPED._values.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=8, help="每个请求的SQL语句数")
+    parser.add_argument("--write-latency", type=float, default=50, help="每次写输出的阻塞时间（微秒）")
+    parser.add_argument("--interval", type=float, default=500, help="请求之间的间隔（微秒）")
+    parser.add_argument("--sampling", default="app.services.image_processing=0.1")
+    parser.add_argument("--rate-limit", default="sqlalchemy.engine=50")
+    args = parser.parse_args()
+
+    print(f"{args.requests} 个请求，每个 {args.queries} 条SQL，每次写输出阻塞 {args.write_latency:.0f}us")
+    print(f"\n{'方式':<14}{'p50 us':>10}{'p99 us':>10}{'平均 us':>10}{'输出行数':>10}{'丢弃':>8}")
+    for mode in ("sync-echo", "async-echo", "production"):
+        before = dropped()
+        result = run(mode, args)
+        print(f"{mode:<14}{result['p50']:>10.1f}{result['p99']:>10.1f}{result['mean']:>10.1f}"
+              f"{result['writes']:>10}{dropped() - before:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
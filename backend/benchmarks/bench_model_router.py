@@ -0,0 +1,119 @@
+"""模型路由的SLO降级与恢复模拟
+
+用假的上游（各模型独立的首字延迟分布）驱动 ModelRouter，时间为模拟时钟。
+qwen-plus 在中间一段时间出现延迟尖峰，对比两种路由下用户看到的首字延迟：
+- static:  只按规则选档位，不做降级（原先的固定模型）
+- slo:     滚动p95超出SLO时降级到 fallback 档位，探测请求恢复后切回
+
+按阶段输出各档位实际处理的请求数和首字延迟 p50/p95。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_model_router.py [--rps 5] [--phase-seconds 600] [--spike 4.0]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import types
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services import model_router as router_module
+from app.services.model_router import DEFAULT_RULES, DEFAULT_TIERS, ModelRouter
+
+# 各模型正常情况下的首字延迟中位数（秒），按对数正态分布抽样
+BASE_LATENCY = {
+    "qwen-max": 2.0,
+    "qwen-plus": 1.0,
+    "qwen-turbo": 0.5,
+    "qwen-vl-max": 3.5,
+    "qwen-vl-plus": 2.0,
+}
+PHASES = ("before", "spike", "after")
+
+
+class SimulatedClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeUpstream:
+    def __init__(self, rng: random.Random, spike: float):
+        self.rng = rng
+        self.spike = spike
+        self.spiking = False
+
+    def ttft(self, model: str) -> float:
+        median = BASE_LATENCY[model]
+        if self.spiking and model == "qwen-plus":
+            median *= self.spike
+        return median * self.rng.lognormvariate(0, 0.3)
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def simulate(args, degrade: bool):
+    rng = random.Random(args.seed)
+    clock = SimulatedClock()
+    router_module.time = types.SimpleNamespace(monotonic=clock.monotonic)
+    router = ModelRouter(
+        DEFAULT_TIERS, DEFAULT_RULES,
+        window=args.window, min_samples=args.min_samples,
+        probe_rate=args.probe_rate, rng=random.Random(args.seed),
+    )
+    upstream = FakeUpstream(random.Random(args.seed + 1), args.spike)
+
+    results = {phase: {"ttft": [], "tiers": Counter()} for phase in PHASES}
+    for phase in PHASES:
+        upstream.spiking = phase == "spike"
+        end = clock.now + args.phase_seconds
+        while clock.now < end:
+            clock.now += rng.expovariate(args.rps)
+            has_image = rng.random() < args.image_ratio
+            user_tier = "premium" if rng.random() < args.premium_ratio else "standard"
+            if degrade:
+                decision = router.route("", has_image, user_tier)
+                tier, label = decision.tier, f"{decision.tier.name}({decision.reason})"
+            else:
+                tier = router._select(0, has_image, user_tier)
+                label = f"{tier.name}(rule)"
+            ttft = upstream.ttft(tier.model)
+            router.observe(tier, ttft)
+            results[phase]["ttft"].append(ttft)
+            results[phase]["tiers"][label] += 1
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rps", type=float, default=5.0)
+    parser.add_argument("--phase-seconds", type=float, default=600.0)
+    parser.add_argument("--spike", type=float, default=4.0, help="尖峰期间 qwen-plus 延迟的倍数")
+    parser.add_argument("--window", type=float, default=120.0)
+    parser.add_argument("--min-samples", type=int, default=20)
+    parser.add_argument("--probe-rate", type=float, default=0.05)
+    parser.add_argument("--image-ratio", type=float, default=0.2)
+    parser.add_argument("--premium-ratio", type=float, default=0.1)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{args.rps} req/s，每阶段 {args.phase_seconds:.0f}s，尖峰期间 qwen-plus 延迟 x{args.spike}")
+    for mode, degrade in (("static", False), ("slo", True)):
+        print(f"\n== {mode} ==")
+        print(f"{'阶段':<10}{'TTFT p50 s':>12}{'TTFT p95 s':>12}  档位分布")
+        for phase, result in simulate(args, degrade).items():
+            ttft = result["ttft"]
+            tiers = ", ".join(f"{label}={count}" for label, count in result["tiers"].most_common())
+            print(f"{phase:<10}{statistics.median(ttft):>12.2f}{percentile(ttft, 0.95):>12.2f}  {tiers}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""上传时预处理的首字延迟（TTFT）基准测试
+
+模拟"上传图片 -> 用户输入 think-time 秒 -> 发送消息"的图片对话，直接调用流式对话核心
+chat_events，上游用固定延迟的假实现代替。对比三种情况的 TTFT：
+- inline:       未预处理，发送后才下载（读盘）、解码、缩放、编码
+- speculative:  上传时开始预处理，发送时已完成
+- pending:      上传后立即发送，等待进行中的预处理
+
+同时输出 chat_ttft_seconds 指标中按 image_source 区分的统计，即 /metrics 中看到的数据。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_preprocess.py [--turns 10] [--size 4000x3000] [--think-time 2]
+"""
+import argparse
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_preprocess.db")
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--size", default="4000x3000", help="上传图片的尺寸")
+    parser.add_argument("--think-time", type=float, default=2.0, help="上传到发送消息的间隔（秒）")
+    parser.add_argument("--upstream-latency", type=float, default=0.3, help="假上游的首字延迟（秒）")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 数据库引擎和上传目录在导入时按环境变量确定
+os.environ["DATABASE_URL"] = ARGS.url
+os.environ["UPLOAD_DIR"] = tempfile.mkdtemp(prefix="bench_preprocess_")
+
+from PIL import Image
+
+from app.api.chat import CHAT_TTFT, chat_events
+from app.db import database
+from app.models import User
+from app.schemas.chat import ChatRequest
+from app.services import storage
+from app.services.image_processing import shutdown_image_executor
+from app.services.model_router import model_router
+from app.services.preprocess import speculative_preprocessor
+from app.services.qwen_vl import CompletionChunk, qwen_vl_service
+from synthetic_dataset import create_bench_engine, reset_schema, create_user
+
+database.engine.echo = False
+
+
+async def fake_stream_completion(request, on_ttft=None):
+    await asyncio.sleep(ARGS.upstream_latency)
+    for word in ("这是", "一张", "测试", "图片"):
+        yield CompletionChunk(content=word)
+
+
+async def no_warm_up():
+    pass
+
+
+def make_upload(width: int, height: int):
+    """生成一张随机噪声的照片尺寸JPEG并按上传流程保存，返回 (图片URL, 文件名, 内容)"""
+    image = Image.merge("RGB", [Image.effect_noise((width, height), 48) for _ in range(3)])
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=92)
+    content = buffer.getvalue()
+    filename = storage.save_upload(content, "JPEG")
+    return storage.upload_url(filename), filename, content
+
+
+async def image_turn(user, image_url: str) -> float:
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    events = chat_events(ChatRequest(message="描述图片", image_url=image_url), user, db)
+    try:
+        async for event in events:
+            if event.get("type") == "chunk":
+                return time.perf_counter() - start
+            if "error" in event or event.get("type") == "error":
+                raise RuntimeError(event)
+    finally:
+        await events.aclose()
+        db.close()
+    raise RuntimeError("没有收到回复")
+
+
+async def run(mode: str, user, width: int, height: int):
+    samples = []
+    for _ in range(ARGS.turns):
+        image_url, filename, content = make_upload(width, height)
+        if mode != "inline":
+            speculative_preprocessor.schedule(filename, content, model_router.predict("", True, user.tier).model)
+        if mode != "pending":
+            await asyncio.sleep(ARGS.think_time)
+        samples.append(await image_turn(user, image_url))
+    return samples
+
+
+async def main():
+    width, height = (int(value) for value in ARGS.size.split("x"))
+    engine = create_bench_engine(ARGS.url)
+    reset_schema(engine)
+    user_id = create_user(engine, "bench_preprocess")
+    db = database.SessionLocal()
+    user = db.get(User, user_id)
+    db.close()
+
+    qwen_vl_service.stream_completion = fake_stream_completion
+    qwen_vl_service.warm_up = no_warm_up
+
+    print(f"图片 {width}x{height}，上游首字延迟 {ARGS.upstream_latency}s，think-time {ARGS.think_time}s")
+    print(f"\n{'方式':<14}{'TTFT p50 ms':>14}{'TTFT max ms':>14}")
+    try:
+        for mode in ("inline", "speculative", "pending"):
+            samples = [s * 1000 for s in await run(mode, user, width, height)]
+            print(f"{mode:<14}{statistics.median(samples):>14.1f}{max(samples):>14.1f}")
+    finally:
+        shutdown_image_executor()
+
+    print("\nchat_ttft_seconds 指标:")
+    tier = model_router.predict("", True, user.tier).name
+    for source in ("inline", "speculative"):
+        count = CHAT_TTFT.count(kind="image", image_source=source, tier=tier)
+        if count:
+            mean = CHAT_TTFT.sum(kind="image", image_source=source, tier=tier) / count * 1000
+            print(f"  image_source={source:<12} count={count:<4} mean={mean:.1f}ms")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+"""提示缓存的命中率与误命中率
+
+用若干组常见问题的不同问法评估 MinHash/LSH 近似匹配：每组第一种问法的回答写入缓存，
+其余问法应命中本组（命中率），命中其他组的回答算误命中；另有一批无关问题，命中任何缓存都算误命中。
+对多个相似度阈值分别统计，并测量缓存中有大量条目时单次查询的耗时。
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_prompt_cache.py [--entries 5000]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.prompt_cache import PromptCache
+
+FAQ_GROUPS = [
+    ["你是谁？", "你是谁呀", "你是谁啊？？", "请问你是谁", "你到底是谁"],
+    ["介绍一下你自己", "请介绍一下你自己", "介绍下你自己吧", "简单介绍一下你自己"],
+    ["你能做什么？", "你能做些什么", "你都能做什么呢", "你可以做什么"],
+    ["怎么上传图片", "如何上传图片？", "图片怎么上传", "怎么上传一张图片"],
+    ["Python 怎么读取文件", "python怎么读取文件？", "Python如何读取文件", "用python怎么读取文件"],
+    ["今天天气怎么样", "今天的天气怎么样？", "今天天气如何"],
+    ["帮我写一首关于春天的诗", "写一首关于春天的诗", "帮我写首春天的诗"],
+    ["什么是机器学习", "机器学习是什么？", "什么是机器学习呢", "请解释什么是机器学习"],
+]
+
+UNRELATED = [
+    "Python 怎么写入文件", "今天股票怎么样", "帮我写一首关于秋天的诗", "什么是深度学习",
+    "怎么删除图片", "你能画画吗", "介绍一下北京", "机器学习和深度学习有什么区别",
+    "你是哪家公司开发的", "如何上传视频",
+]
+
+FILLER_WORDS = list("的一是在不了有和人这中大为上个国我以要他时来用们生到作地于出就分对成会可主发年动同工也能下过子说产种面而方后多定行学法所民得经十三之进着等部度家电力里如水化高自二理起小物现实加量都两体制机当使点从业本去把性好应开它合还因由其些然前外天政四日那社义事平形相全表间样与关各重新线内数正心反你明看原又么利比或但质气第向道命此变条只没结解问意建月公无系军很情者最立代想已通并提直题党程展五果料象员革位入常文总次品式活设及管特件长求老头基资边流路级少图山统接知较将组见计别她手角期根论运农指几九区强放决西被干做必战先回则任取据处队南给色光门即保治北造百规热领七海口东导器压志世金增争济阶油思术极交受联什认六共权收证改清己美再采转更单风切打白教速花带安场身车例真务具万每目至达走积示议声报斗完类八离华名确才科张信马节话米整空元况今集温传土许步群广石记需段研界拉林律叫且究观越织装影算低持音众书布复容儿须际商非验连断深难近矿千周委素技备半办青省列习响约支般史感劳便团往酸历市克何除消构府称太准精值号率族维划选标写存候毛亲快效斯院查江型眼王按格养易置派层片始却专状育厂京识适属圆包火住调满县局照参红细引听该铁价严")
+
+
+def random_question(rng: random.Random) -> str:
+    return "".join(rng.choice(FILLER_WORDS) for _ in range(rng.randint(6, 30)))
+
+
+def evaluate(threshold: float):
+    cache = PromptCache(enabled=True, threshold=threshold)
+    for group_id, group in enumerate(FAQ_GROUPS):
+        cache.store(group[0], f"answer-{group_id}")
+
+    hits = wrong = total = 0
+    for group_id, group in enumerate(FAQ_GROUPS):
+        for phrasing in group[1:]:
+            total += 1
+            hit = cache.lookup(phrasing)
+            if hit is None:
+                continue
+            if hit.answer == f"answer-{group_id}":
+                hits += 1
+            else:
+                wrong += 1
+    false_positives = sum(cache.lookup(question) is not None for question in UNRELATED)
+    return hits / total, (wrong + false_positives) / (total + len(UNRELATED))
+
+
+def bench_lookup(entries: int, seed: int):
+    rng = random.Random(seed)
+    cache = PromptCache(enabled=True, threshold=0.9, max_entries=entries)
+    start = time.perf_counter()
+    for i in range(entries):
+        cache.store(random_question(rng), f"answer-{i}")
+    store_ms = (time.perf_counter() - start) / entries * 1000
+
+    samples = []
+    for _ in range(1000):
+        question = random_question(rng)
+        start = time.perf_counter()
+        cache.lookup(question)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return store_ms, statistics.median(samples), samples[int(len(samples) * 0.99) - 1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--entries", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'阈值':<8}{'命中率':>10}{'误命中率':>10}")
+    for threshold in (0.6, 0.7, 0.8, 0.9, 0.95, 1.0):
+        hit_rate, false_rate = evaluate(threshold)
+        print(f"{threshold:<8}{hit_rate:>10.0%}{false_rate:>10.0%}")
+
+    store_ms, p50, p99 = bench_lookup(args.entries, args.seed)
+    print(f"\n{args.entries} 条缓存: 写入 {store_ms:.3f}ms/条, 查询 p50 {p50:.3f}ms, p99 {p99:.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""图片请求体内存基准测试
+
+对比两种构建 /chat/completions 请求体的峰值内存：
+- json: 完整base64字符串 + data字典 + httpx序列化出的JSON字节（当前做法）
+- stream: StreamingJSONBody 分块编码
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_request_body_memory.py [--sizes 1,5,10]
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.request_body import StreamingJSONBody, new_placeholder
+
+
+def build_payload(image_url):
+    return {
+        "model": "qwen-vl-plus",
+        "messages": [{
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "请分析这张图片的内容。"},
+                {"type": "image_url", "image_url": {"url": image_url}},
+            ],
+        }],
+        "max_tokens": 1500,
+        "temperature": 0.7,
+        "stream": True,
+    }
+
+
+async def json_path(image_data):
+    """模拟 httpx 的 json= 参数：整块编码后再序列化"""
+    image_base64 = base64.b64encode(image_data).decode("utf-8")
+    data = build_payload(f"data:image/jpeg;base64,{image_base64}")
+    body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+    return len(body)
+
+
+async def stream_path(image_data):
+    """StreamingJSONBody：逐块写出并丢弃，模拟发送到网络"""
+    placeholder = new_placeholder()
+    body = StreamingJSONBody(build_payload(placeholder), memoryview(image_data), "image/jpeg", placeholder)
+    sent = 0
+    async for chunk in body:
+        sent += len(chunk)
+    assert sent == body.content_length
+    return sent
+
+
+async def measure(func, image_data):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    size = await func(image_data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1,5,10", help="图片大小（MB），逗号分隔")
+    args = parser.parse_args()
+
+    print(f"{'图片MB':>8}{'请求体':>14}{'json峰值':>14}{'stream峰值':>14}{'倍数':>8}")
+    for size_mb in [float(s) for s in args.sizes.split(",")]:
+        image_data = os.urandom(int(size_mb * 1024 * 1024))
+        body_size, json_peak = await measure(json_path, image_data)
+        stream_size, stream_peak = await measure(stream_path, image_data)
+        assert body_size == stream_size
+        print(f"{size_mb:>8.1f}{body_size:>14}{json_peak:>14}{stream_peak:>14}"
+              f"{json_peak / stream_peak:>8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
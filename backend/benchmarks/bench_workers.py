@@ -0,0 +1,198 @@
+"""吞吐量随工作进程数的扩展
+
+按生产配置（gunicorn -c gunicorn.conf.py，预加载）依次以 1、2、4 ... 个工作进程启动后端，
+用多个压测进程在固定并发下持续请求同一个接口，输出吞吐量、延迟和相对单进程的加速比：
+- sessions: 会话列表（JWT校验、用户查询、会话查询和序列化），典型的读接口
+- login:    登录（bcrypt 校验在线程池中进行）
+- health:   健康检查，只有框架本身的开销
+
+压测进程与后端在同一台机器上，也会占用CPU；工作进程数接近核数时加速比会因此偏低。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/bench_workers.py [--url sqlite:///bench_workers.db] [--workers 1,2,4] [--route sessions]
+        [--duration 10] [--concurrency 64] [--clients 4]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+USERNAME = "bench_workers"
+PASSWORD = "bench-password"
+
+
+def parse_args():
+    cpus = os.cpu_count() or 1
+    default_workers = sorted({1} | {n for n in (2, 4, 8, 16) if n <= cpus} | {cpus})
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_workers.db")
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)), help="逗号分隔的工作进程数")
+    parser.add_argument("--route", choices=("sessions", "login", "health"), default="sessions")
+    parser.add_argument("--duration", type=float, default=10, help="每种配置的压测时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2, help="压测前的预热时长（秒）")
+    parser.add_argument("--concurrency", type=int, default=64, help="同时进行的请求数（所有压测进程合计）")
+    parser.add_argument("--clients", type=int, default=min(cpus, 4), help="压测进程数")
+    parser.add_argument("--sessions", type=int, default=50, help="测试用户的会话数")
+    return parser.parse_args()
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare_database(url: str, sessions: int) -> str:
+    """建表并写入测试用户和会话，返回访问令牌"""
+    from sqlalchemy import update
+
+    from app.models import User
+    from app.services.auth import create_access_token, get_password_hash
+    from synthetic_dataset import create_bench_engine, create_user, load_sessions, reset_schema
+
+    engine = create_bench_engine(url)
+    reset_schema(engine)
+    user_id = create_user(engine, USERNAME)
+    with engine.begin() as conn:
+        conn.execute(update(User).where(User.id == user_id).values(hashed_password=get_password_hash(PASSWORD)))
+    rng = random.Random(42)
+    load_sessions(engine, user_id, [rng.randint(2, 20) for _ in range(sessions)], rng)
+    engine.dispose()
+    return create_access_token(data={"sub": USERNAME})
+
+
+def start_server(workers: int, port: int, url: str) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "DATABASE_URL": url,
+        "WEB_CONCURRENCY": str(workers),
+        "HOST": "127.0.0.1",
+        "PORT": str(port),
+        "LOG_LEVEL": "WARNING",
+        "TRACE_SAMPLE_RATE": "0",
+    }
+    env.pop("METRICS_MULTIPROC_DIR", None)
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+def wait_ready(base: str, server: subprocess.Popen, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"后端启动失败（退出码 {server.returncode}）")
+        try:
+            if httpx.get(f"{base}/health", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("后端启动超时")
+
+
+def stop_server(server: subprocess.Popen):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+
+def build_request(client, base: str, route: str, token: str):
+    if route == "sessions":
+        return client.build_request("GET", f"{base}/api/chat/sessions", headers={"Authorization": f"Bearer {token}"})
+    if route == "login":
+        return client.build_request("POST", f"{base}/api/auth/login", data={"username": USERNAME, "password": PASSWORD})
+    return client.build_request("GET", f"{base}/health")
+
+
+async def load(base: str, route: str, token: str, concurrency: int, warmup: float, duration: float):
+    import httpx
+
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        measure_from = time.perf_counter() + warmup
+        until = measure_from + duration
+
+        async def user():
+            nonlocal errors
+            while True:
+                start = time.perf_counter()
+                if start >= until:
+                    return
+                try:
+                    response = await client.send(build_request(client, base, route, token))
+                    ok = response.status_code == 200
+                except httpx.HTTPError:
+                    ok = False
+                if start >= measure_from:
+                    if ok:
+                        latencies.append(time.perf_counter() - start)
+                    else:
+                        errors += 1
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def client_process(args):
+    return asyncio.run(load(*args))
+
+
+def run(workers: int, token: str, args) -> dict:
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = start_server(workers, port, args.url)
+    try:
+        wait_ready(base, server)
+        per_client = max(1, args.concurrency // args.clients)
+        jobs = [(base, args.route, token, per_client, args.warmup, args.duration)] * args.clients
+        with multiprocessing.get_context("spawn").Pool(args.clients) as pool:
+            results = pool.map(client_process, jobs)
+    finally:
+        stop_server(server)
+    latencies = sorted(latency for result in results for latency in result[0])
+    return {
+        "rps": len(latencies) / args.duration,
+        "p50": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+        "errors": sum(result[1] for result in results),
+    }
+
+
+def main():
+    args = parse_args()
+    os.environ["DATABASE_URL"] = args.url
+    token = prepare_database(args.url, args.sessions)
+    counts = [int(value) for value in args.workers.split(",")]
+
+    print(f"接口 {args.route}，并发 {args.concurrency}（{args.clients} 个压测进程），每种配置 {args.duration:.0f}s，"
+          f"CPU核数 {os.cpu_count()}")
+    print(f"\n{'工作进程':<10}{'请求/秒':>10}{'p50 ms':>10}{'p99 ms':>10}{'加速比':>8}{'效率':>8}{'错误':>8}")
+    baseline = None
+    for workers in counts:
+        result = run(workers, token, args)
+        baseline = baseline or result["rps"] / workers
+        speedup = result["rps"] / baseline if baseline else 0.0
+        print(f"{workers:<10}{result['rps']:>10.0f}{result['p50']:>10.1f}{result['p99']:>10.1f}"
+              f"{speedup:>8.2f}{speedup / workers:>8.0%}{result['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
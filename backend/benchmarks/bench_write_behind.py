@@ -0,0 +1,136 @@
+"""消息写回队列吞吐基准测试
+
+模拟并发的聊天轮次（创建会话、用户消息、AI回复 + 更新会话时间），对比：
+- commit: 当前做法，每轮三次独立提交
+- write-behind: 会话同步提交，消息和会话时间由 WriteBehindQueue 跨请求批量写入
+
+用法（在 backend 目录下）:
+    python benchmarks/bench_write_behind.py [--url mysql+pymysql://...] [--turns 2000] [--concurrency 50]
+默认使用本地 SQLite 文件代替 MySQL。
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+
+from app.core.ids import new_id
+from app.models import Base, User, ChatSession, Message
+from app.models.message import MessageType
+from app.services.persistence import WriteBehindQueue
+
+
+def setup(url):
+    engine = create_engine(url)
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    db = factory()
+    user = User(username="bench", email="bench@example.com", hashed_password="x")
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return engine, factory, user_id
+
+
+def commit_turn(factory, user_id):
+    """每轮三次提交，与 chat_with_ai_stream 的原有写法一致"""
+    db = factory()
+    try:
+        session = ChatSession(id=new_id(), user_id=user_id, title="bench")
+        db.add(session)
+        db.commit()
+        db.add(Message(id=new_id(), chat_session_id=session.id, content="问题", type=MessageType.user))
+        db.commit()
+        db.add(Message(id=new_id(), chat_session_id=session.id, content="回答" * 200, type=MessageType.bot))
+        session.updated_at = datetime.utcnow()
+        db.commit()
+    finally:
+        db.close()
+
+
+def create_session(factory, user_id) -> str:
+    db = factory()
+    try:
+        session = ChatSession(id=new_id(), user_id=user_id, title="bench")
+        db.add(session)
+        db.commit()
+        return session.id
+    finally:
+        db.close()
+
+
+async def write_behind_turn(queue, factory, user_id):
+    # 与 _get_or_create_session 一致：会话同步提交，其余写入进入队列
+    session_id = await asyncio.to_thread(create_session, factory, user_id)
+    now = datetime.utcnow()
+    queue.add_message({"id": new_id(), "chat_session_id": session_id, "content": "问题",
+                       "type": MessageType.user, "timestamp": now})
+    queue.add_message({"id": new_id(), "chat_session_id": session_id, "content": "回答" * 200,
+                       "type": MessageType.bot, "timestamp": now})
+    queue.touch_session(session_id, now)
+
+
+async def run(turns, concurrency, turn):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await turn()
+
+    await asyncio.gather(*(one() for _ in range(turns)))
+
+
+def count_messages(factory):
+    db = factory()
+    try:
+        return db.scalar(select(func.count()).select_from(Message))
+    finally:
+        db.close()
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_write_behind.db")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--flush-interval-ms", type=int, default=200)
+    parser.add_argument("--max-batch", type=int, default=500)
+    args = parser.parse_args()
+
+    engine, factory, user_id = setup(args.url)
+    start = time.perf_counter()
+    await run(args.turns, args.concurrency, lambda: asyncio.to_thread(commit_turn, factory, user_id))
+    commit_s = time.perf_counter() - start
+    assert count_messages(factory) == args.turns * 2
+    engine.dispose()
+
+    engine, factory, user_id = setup(args.url)
+    queue = WriteBehindQueue(
+        factory, enabled=True, flush_interval=args.flush_interval_ms / 1000, max_batch=args.max_batch
+    )
+    await queue.start()
+
+    start = time.perf_counter()
+    await run(args.turns, args.concurrency, lambda: write_behind_turn(queue, factory, user_id))
+    accepted_s = time.perf_counter() - start
+    await queue.stop()  # 包含最后一次刷新，保证数据全部落库
+    write_behind_s = time.perf_counter() - start
+    assert count_messages(factory) == args.turns * 2
+    engine.dispose()
+
+    print(f"轮次: {args.turns}, 并发: {args.concurrency}, 数据库: {engine.url.get_backend_name()}")
+    print(f"commit:       {commit_s:8.2f}s  {args.turns / commit_s:10.0f} 轮/秒")
+    print(f"write-behind: {write_behind_s:8.2f}s  {args.turns / write_behind_s:10.0f} 轮/秒"
+          f"（请求路径耗时 {accepted_s * 1000:.1f}ms）")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
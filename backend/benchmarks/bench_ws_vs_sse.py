@@ -0,0 +1,207 @@
+"""WebSocket 与 SSE 流式对话的单轮开销对比
+
+在进程内启动后端（uvicorn），用假的上游替换 qwen_vl_service.stream_completion
+（固定数量的分片，可设置分片间隔），分别测量：
+- SSE（长连接复用）：每轮一个 POST /api/chat/chat/stream，每次都要认证
+- SSE（每轮新连接）
+- WebSocket：一条连接、一次认证，顺序发起多轮
+- 并发：同时进行 N 轮，SSE 用 N 个请求，WebSocket 在一条连接上多路复用
+
+两者走同一个生成核心（chat_events），差异即为传输层和每轮认证的开销。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/bench_ws_vs_sse.py [--url sqlite:///bench_ws.db] [--turns 200] [--chunks 50] [--concurrency 4]
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_ws.db")
+    parser.add_argument("--turns", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=50, help="每轮回复的分片数")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="上游分片间隔（毫秒）")
+    parser.add_argument("--concurrency", type=int, default=4)
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+# 应用的数据库引擎在导入时按环境变量创建
+os.environ["DATABASE_URL"] = ARGS.url
+os.environ.setdefault("WS_MAX_STREAMS", str(max(4, ARGS.concurrency)))
+
+import httpx
+import uvicorn
+import websockets
+
+from app.db import database
+from app.services import qwen_vl
+from app.services.auth import create_access_token
+from main import app
+from synthetic_dataset import create_bench_engine, reset_schema, create_user
+
+database.engine.echo = False
+
+
+async def fake_stream_completion(request, on_ttft=None):
+    for i in range(ARGS.chunks):
+        if ARGS.chunk_delay:
+            await asyncio.sleep(ARGS.chunk_delay / 1000)
+        yield qwen_vl.CompletionChunk(content=f"片段{i} ")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def sse_turn(client, base, token):
+    start = time.perf_counter()
+    first = None
+    async with client.stream(
+        "POST", f"{base}/api/chat/chat/stream",
+        json={"message": "你好"}, headers={"Authorization": f"Bearer {token}"}
+    ) as response:
+        async for line in response.aiter_lines():
+            if not line.startswith("data: "):
+                continue
+            event = json.loads(line[6:])
+            if first is None and event.get("type") == "chunk":
+                first = time.perf_counter()
+            if event.get("type") == "done" or "error" in event:
+                break
+    end = time.perf_counter()
+    return (first or end) - start, end - start
+
+
+class WSClient:
+    """在一条 WebSocket 连接上按 stream_id 分发事件"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.waiters = {}
+        self.counter = 0
+        self.reader = asyncio.create_task(self._read())
+
+    async def _read(self):
+        async for raw in self.connection:
+            event = json.loads(raw)
+            if event.get("type") == "ping":
+                await self.connection.send(json.dumps({"type": "pong"}))
+            queue = self.waiters.get(event.get("stream_id"))
+            if queue is not None:
+                queue.put_nowait(event)
+
+    async def turn(self):
+        self.counter += 1
+        stream_id = str(self.counter)
+        queue = self.waiters[stream_id] = asyncio.Queue()
+        start = time.perf_counter()
+        first = None
+        await self.connection.send(json.dumps({"type": "chat", "stream_id": stream_id, "message": "你好"}))
+        while True:
+            event = await queue.get()
+            if first is None and event.get("type") == "chunk":
+                first = time.perf_counter()
+            if event.get("type") == "done" or "error" in event:
+                break
+        del self.waiters[stream_id]
+        end = time.perf_counter()
+        return (first or end) - start, end - start
+
+
+async def ws_connect(base, token):
+    connection = await websockets.connect(f"ws{base[4:]}/api/chat/ws")
+    await connection.send(json.dumps({"type": "auth", "token": token}))
+    ready = json.loads(await connection.recv())
+    assert ready["type"] == "ready", ready
+    return connection, WSClient(connection)
+
+
+def report(name, samples, elapsed):
+    first = sorted(s[0] * 1000 for s in samples)
+    total = sorted(s[1] * 1000 for s in samples)
+    p95 = lambda values: values[int(len(values) * 0.95) - 1]
+    print(
+        f"{name:<22}{statistics.median(first):>10.2f}{statistics.median(total):>10.2f}"
+        f"{p95(total):>10.2f}{len(samples) / elapsed:>10.1f}"
+    )
+
+
+async def run_sequential(name, turn, turns):
+    await turn()  # 预热
+    samples = []
+    start = time.perf_counter()
+    for _ in range(turns):
+        samples.append(await turn())
+    report(name, samples, time.perf_counter() - start)
+
+
+async def run_concurrent(name, turn, turns, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await turn()
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*(limited() for _ in range(turns)))
+    report(name, samples, time.perf_counter() - start)
+
+
+async def main():
+    engine = create_bench_engine(ARGS.url)
+    reset_schema(engine)
+    user_id = create_user(engine, "bench_ws")
+    token = create_access_token({"sub": "bench_ws"})
+    qwen_vl.qwen_vl_service.stream_completion = fake_stream_completion
+
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    print(f"用户 {user_id}，每轮 {ARGS.chunks} 个分片，分片间隔 {ARGS.chunk_delay}ms，{ARGS.turns} 轮")
+    print(f"\n{'方式':<22}{'首片p50':>10}{'整轮p50':>10}{'整轮p95':>10}{'轮/秒':>10}  (ms)")
+    try:
+        async with httpx.AsyncClient(timeout=60) as client:
+            await run_sequential("SSE 复用连接", lambda: sse_turn(client, base, token), ARGS.turns)
+
+        async def sse_new_connection():
+            async with httpx.AsyncClient(timeout=60) as client:
+                return await sse_turn(client, base, token)
+
+        await run_sequential("SSE 每轮新连接", sse_new_connection, ARGS.turns)
+
+        connection, ws = await ws_connect(base, token)
+        try:
+            await run_sequential("WebSocket", ws.turn, ARGS.turns)
+            await run_concurrent(f"WebSocket 并发{ARGS.concurrency}", ws.turn, ARGS.turns, ARGS.concurrency)
+        finally:
+            ws.reader.cancel()
+            await connection.close()
+
+        limits = httpx.Limits(max_connections=ARGS.concurrency)
+        async with httpx.AsyncClient(timeout=60, limits=limits) as client:
+            await run_concurrent(
+                f"SSE 并发{ARGS.concurrency}", lambda: sse_turn(client, base, token), ARGS.turns, ARGS.concurrency
+            )
+    finally:
+        server.should_exit = True
+        await server_task
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
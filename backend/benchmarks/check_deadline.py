@@ -0,0 +1,142 @@
+"""请求时限检查
+
+直接调用流式对话核心 chat_events，上游用 httpx.MockTransport 模拟可控的连接和首字延迟，验证：
+- 首字迟于时限时在时限处失败，而不是等到上游返回
+- 上游并发占满时，排队超出时限即失败，不再发出请求
+- 时限已耗尽的请求不调用上游
+- 时限充足时正常完成
+并输出 deadline_exceeded_total 按阶段的统计，即 /metrics 中看到的数据。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/check_deadline.py [--url sqlite:///bench_deadline.db] [--deadline 1.0]
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_deadline.db")
+    parser.add_argument("--deadline", type=float, default=1.0, help="每个请求的时限（秒）")
+    return parser.parse_args()
+
+
+ARGS = parse_args()
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# 应用的数据库引擎在导入时按环境变量创建
+os.environ["DATABASE_URL"] = ARGS.url
+
+import httpx
+
+from app.api.chat import chat_events
+from app.core.deadline import DEADLINE_EXCEEDED, Deadline, deadline_scope
+from app.db import database
+from app.models import User
+from app.schemas.chat import ChatRequest
+from app.services.qwen_vl import qwen_vl_service
+from synthetic_dataset import create_bench_engine, reset_schema, create_user
+
+database.engine.echo = False
+
+STAGES = ("image_fetch", "preprocess", "upstream_queue", "upstream_connect", "first_token")
+
+
+class FakeUpstream:
+    """按设定的延迟返回流式回复的假上游"""
+
+    def __init__(self):
+        self.connect_delay = 0.0
+        self.first_token_delay = 0.0
+        self.calls = 0
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        await asyncio.sleep(self.connect_delay)
+        return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=self._body())
+
+    async def _body(self):
+        await asyncio.sleep(self.first_token_delay)
+        yield 'data: {"choices":[{"delta":{"content":"你好"}}]}\n\n'.encode("utf-8")
+        yield b"data: [DONE]\n\n"
+
+
+def expect(condition, message):
+    print(f"[{'OK' if condition else 'FAIL'}] {message}")
+    return condition
+
+
+async def turn(user, seconds: float):
+    """在时限内进行一轮对话，返回 (耗时, 是否超时, 回复)"""
+    db = database.SessionLocal()
+    start = time.perf_counter()
+    reply, timed_out = "", False
+    events = chat_events(ChatRequest(message="你好"), user, db)
+    try:
+        with deadline_scope(Deadline.after("check", seconds)):
+            async for event in events:
+                if event.get("type") == "chunk":
+                    reply += event["content"]
+                elif event.get("type") == "error":
+                    reply, timed_out = event["content"], event["content"].startswith("请求超时")
+    finally:
+        await events.aclose()
+        db.close()
+    return time.perf_counter() - start, timed_out, reply
+
+
+async def main():
+    engine = create_bench_engine(ARGS.url)
+    reset_schema(engine)
+    user_id = create_user(engine, "bench_deadline")
+    db = database.SessionLocal()
+    user = db.get(User, user_id)
+    db.close()
+
+    upstream = FakeUpstream()
+    qwen_vl_service.client = httpx.AsyncClient(transport=httpx.MockTransport(upstream.handle))
+    deadline = ARGS.deadline
+    slack = 0.3
+
+    ok = True
+    upstream.first_token_delay = deadline * 3
+    elapsed, timed_out, _ = await turn(user, deadline)
+    ok &= expect(timed_out and elapsed < deadline + slack, f"首字迟到：{elapsed:.2f}s 后超时失败")
+
+    upstream.first_token_delay = 0.0
+    upstream.connect_delay = deadline * 3
+    elapsed, timed_out, _ = await turn(user, deadline)
+    ok &= expect(timed_out and elapsed < deadline + slack, f"连接迟到：{elapsed:.2f}s 后超时失败")
+
+    upstream.connect_delay = 0.0
+    slots = qwen_vl_service._slots
+    qwen_vl_service._slots = asyncio.Semaphore(0)
+    calls = upstream.calls
+    elapsed, timed_out, _ = await turn(user, deadline)
+    qwen_vl_service._slots = slots
+    ok &= expect(
+        timed_out and upstream.calls == calls and elapsed < deadline + slack,
+        f"上游并发占满：排队 {elapsed:.2f}s 后失败，未发出请求"
+    )
+
+    calls = upstream.calls
+    _, timed_out, _ = await turn(user, 0)
+    ok &= expect(timed_out and upstream.calls == calls, "时限已耗尽的请求不调用上游")
+
+    _, timed_out, reply = await turn(user, deadline)
+    ok &= expect(not timed_out and reply == "你好", "时限充足时正常完成")
+
+    print("\ndeadline_exceeded_total:")
+    for stage in STAGES:
+        count = DEADLINE_EXCEEDED.value(route="check", stage=stage)
+        if count:
+            print(f"  stage={stage:<18} {count:.0f}")
+
+    await qwen_vl_service.close()
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,158 @@
+"""合成数据集生成器
+
+向 MySQL 或本地 SQLite 批量写入用户、会话和消息，数据分布接近真实使用：
+每个用户的会话数和每个会话的消息数都是长尾分布，用户消息与AI回复交替，
+AI回复更长，少量用户消息带图片。既可单独运行生成数据集，也被
+bench_data_layer.py 用来构造指定规模的用户和会话。
+
+用法（在 backend 目录下，目标库会被清空）:
+    python benchmarks/synthetic_dataset.py --url sqlite:///bench_dataset.db --messages 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, event, insert, select
+
+from app.core.ids import new_id
+from app.models import Base, User, ChatSession, Message
+from app.models.message import MessageType
+
+BATCH_SIZE = 5000
+IMAGE_RATIO = 0.05
+USER_TEXT = "请帮我看看这个问题应该怎么处理，"
+BOT_TEXT = "## 分析\n\n根据你的描述，可以从以下几个方面考虑：\n\n- **原因**：说明\n- **建议**：步骤\n\n"
+# 话题词表，按 Zipf 分布抽取，让搜索基准既有高频词也有低频词
+VOCABULARY = [
+    "图片", "数据库", "索引", "性能", "Python", "缓存", "部署", "旅行", "菜谱", "猫咪",
+    "docker", "nginx", "MySQL", "报错", "优化", "算法", "翻译", "简历", "天气", "股票",
+    "kubernetes", "FastAPI", "前端", "Vue", "机器学习", "模型", "摄影", "健身", "咖啡", "电影",
+    "transformer", "latency", "throughput", "日志", "监控", "证书", "编码", "压缩", "向量", "检索",
+]
+VOCABULARY_WEIGHTS = [1 / (rank + 1) for rank in range(len(VOCABULARY))]
+
+
+def create_bench_engine(url: str):
+    """创建引擎；SQLite 需要显式开启外键，ON DELETE CASCADE 才会生效"""
+    engine = create_engine(url)
+    if engine.url.get_backend_name() == "sqlite":
+        @event.listens_for(engine, "connect")
+        def enable_foreign_keys(dbapi_connection, _):
+            dbapi_connection.execute("PRAGMA foreign_keys=ON")
+    return engine
+
+
+def reset_schema(engine):
+    """重建表结构（与迁移一致的模型定义，含复合索引和级联外键）"""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+
+def create_user(engine, username: str) -> int:
+    with engine.begin() as conn:
+        conn.execute(insert(User), {
+            "username": username, "email": f"{username}@example.com", "hashed_password": "x"
+        })
+        return conn.execute(select(User.id).where(User.username == username)).scalar_one()
+
+
+def message_rows(session_id: str, count: int, start: datetime, rng: random.Random):
+    """生成一个会话的消息，用户消息与AI回复交替，时间递增"""
+    timestamp = start
+    for i in range(count):
+        is_user = i % 2 == 0
+        timestamp += timedelta(seconds=rng.randint(5, 120))
+        image_url = None
+        if is_user and rng.random() < IMAGE_RATIO:
+            image_url = f"/uploads/{rng.getrandbits(256):064x}.jpg"
+        topics = "、".join(rng.choices(VOCABULARY, VOCABULARY_WEIGHTS, k=rng.randint(1, 3)))
+        yield {
+            "id": new_id(),
+            "chat_session_id": session_id,
+            "content": (USER_TEXT * rng.randint(1, 4) if is_user else BOT_TEXT * rng.randint(2, 12)) + topics,
+            "type": MessageType.user if is_user else MessageType.bot,
+            "image_url": image_url,
+            "timestamp": timestamp,
+        }
+
+
+def _flush(conn, table, rows):
+    if rows:
+        conn.execute(insert(table), rows)
+        rows.clear()
+
+
+def load_sessions(engine, user_id: int, message_counts, rng: random.Random, start: datetime = None):
+    """为用户写入会话，message_counts为每个会话的消息数，返回按创建顺序的会话ID"""
+    start = start or datetime.utcnow() - timedelta(days=365)
+    session_ids = []
+    sessions, messages = [], []
+    with engine.begin() as conn:
+        for count in message_counts:
+            session_id = new_id()
+            session_ids.append(session_id)
+            created_at = start + timedelta(minutes=len(session_ids))
+            rows = list(message_rows(session_id, count, created_at, rng))
+            sessions.append({
+                "id": session_id,
+                "user_id": user_id,
+                "title": "合成会话",
+                "created_at": created_at,
+                "updated_at": rows[-1]["timestamp"] if rows else None,
+            })
+            messages.extend(rows)
+            if len(messages) >= BATCH_SIZE:
+                # 会话必须先于引用它的消息写入
+                _flush(conn, ChatSession, sessions)
+                _flush(conn, Message, messages)
+        _flush(conn, ChatSession, sessions)
+        _flush(conn, Message, messages)
+    return session_ids
+
+
+def session_sizes(rng: random.Random, total_messages: int):
+    """每个会话的消息数：对数正态分布，中位数约8条，长尾可达数千条"""
+    remaining = total_messages
+    while remaining > 0:
+        count = min(remaining, max(2, int(rng.lognormvariate(2.1, 1.0))))
+        remaining -= count
+        yield count
+
+
+def load_background(engine, messages: int, users: int, rng: random.Random):
+    """写入背景数据：messages条消息按长尾分布分给users个用户"""
+    user_ids = [create_user(engine, f"bg{i}") for i in range(users)]
+    # 会话数按 Zipf 分给用户：少数重度用户占据大部分会话
+    weights = [1 / (rank + 1) for rank in range(users)]
+    by_user = {user_id: [] for user_id in user_ids}
+    for count in session_sizes(rng, messages):
+        by_user[rng.choices(user_ids, weights)[0]].append(count)
+    for user_id, counts in by_user.items():
+        if counts:
+            load_sessions(engine, user_id, counts, rng)
+    return user_ids
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="sqlite:///bench_dataset.db")
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    engine = create_bench_engine(args.url)
+    reset_schema(engine)
+    start = time.perf_counter()
+    load_background(engine, args.messages, args.users, random.Random(args.seed))
+    elapsed = time.perf_counter() - start
+    print(f"写入 {args.messages} 条消息 / {args.users} 个用户: {elapsed:.1f}s ({args.messages / elapsed:.0f} 条/秒)")
+
+
+if __name__ == "__main__":
+    main()
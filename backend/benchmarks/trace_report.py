@@ -0,0 +1,114 @@
+"""请求追踪报表
+
+读取抽样写入的追踪文件（TRACE_FILE，含轮转出的 .1 .2 ... 和各工作进程的文件），按路由和时间筛选后输出：
+- 各阶段（span名称）耗时的 p50 / p95 / p99 以及在请求总耗时中的占比（阶段之间可能嵌套，占比之和可超过100%）
+- 最慢的若干个请求及其阶段明细，可按 trace_id 与客户端收到的 timing 事件对应
+
+用法（在 backend 目录下）:
+    python benchmarks/trace_report.py [--file logs/traces.jsonl] [--route /api/chat/stream] [--since 2026-10-19T00:00] [--slowest 5]
+    python benchmarks/trace_report.py --trace-id <id>
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+from collections import defaultdict
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.core.tracing import TRACE_FILE
+
+
+def trace_files(path: str):
+    """当前文件和轮转出的历史文件，旧的在前；多个工作进程时包括各进程的文件（traces.worker1.jsonl ...）"""
+    root, extension = os.path.splitext(path)
+    files = []
+    for base in [path] + sorted(glob.glob(f"{root}.worker*{extension}")):
+        rotated = [name for name in glob.glob(f"{base}.*") if name.rsplit(".", 1)[1].isdigit()]
+        rotated.sort(key=lambda name: -int(name.rsplit(".", 1)[1]))
+        files += rotated + ([base] if os.path.exists(base) else [])
+    return files
+
+
+def load_traces(path: str):
+    for name in trace_files(path):
+        with open(name, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def print_trace(trace):
+    print(f"{trace['trace_id']}  {trace['start']}  {trace.get('method', '')} {trace['route']}  "
+          f"status={trace.get('status', '-')}  {trace['duration_ms']:.1f}ms")
+    for span in trace["spans"]:
+        extra = {k: v for k, v in span.items() if k not in ("name", "start_ms", "duration_ms")}
+        print(f"    +{span['start_ms']:>9.1f}ms  {span['name']:<18}{span['duration_ms']:>9.1f}ms  {extra or ''}")
+    if trace.get("dropped_spans"):
+        print(f"    （另有 {trace['dropped_spans']} 个span未记录）")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--file", default=TRACE_FILE)
+    parser.add_argument("--route", help="只统计此路由")
+    parser.add_argument("--since", help="只统计此时间（ISO格式，UTC）之后的请求")
+    parser.add_argument("--min-ms", type=float, default=0, help="只统计总耗时不少于此值的请求")
+    parser.add_argument("--slowest", type=int, default=5)
+    parser.add_argument("--trace-id", help="只输出指定请求的明细")
+    args = parser.parse_args()
+
+    since = datetime.fromisoformat(args.since).replace(tzinfo=timezone.utc) if args.since else None
+    traces = []
+    for trace in load_traces(args.file):
+        if args.trace_id:
+            if trace["trace_id"] == args.trace_id:
+                print_trace(trace)
+                return
+            continue
+        if args.route and trace["route"] != args.route:
+            continue
+        if since and datetime.fromisoformat(trace["start"]) < since:
+            continue
+        if trace["duration_ms"] < args.min_ms:
+            continue
+        traces.append(trace)
+
+    if args.trace_id:
+        sys.exit(f"未找到 trace_id={args.trace_id}")
+    if not traces:
+        sys.exit("没有符合条件的追踪记录")
+
+    # 同一请求中同名的span（如多条SQL）先合计
+    stages = defaultdict(list)
+    for trace in traces:
+        totals = defaultdict(float)
+        for span in trace["spans"]:
+            totals[span["name"]] += span["duration_ms"]
+        for name, value in totals.items():
+            stages[name].append(value)
+    total_time = sum(trace["duration_ms"] for trace in traces)
+    durations = [trace["duration_ms"] for trace in traces]
+
+    print(f"{len(traces)} 个请求，总耗时 p50 {percentile(durations, 0.5):.1f}ms  p95 {percentile(durations, 0.95):.1f}ms\n")
+    print(f"{'阶段':<20}{'请求数':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'占比':>8}")
+    for name, values in sorted(stages.items(), key=lambda item: -sum(item[1])):
+        print(f"{name:<20}{len(values):>8}{percentile(values, 0.5):>10.1f}{percentile(values, 0.95):>10.1f}"
+              f"{percentile(values, 0.99):>10.1f}{sum(values) / total_time:>8.0%}")
+
+    print(f"\n最慢的 {args.slowest} 个请求:")
+    for trace in sorted(traces, key=lambda t: -t["duration_ms"])[:args.slowest]:
+        print_trace(trace)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""生产模式的 gunicorn 配置：多个 uvicorn 工作进程，预加载应用
+
+用法（在 backend 目录下）:
+    gunicorn main:app -c gunicorn.conf.py
+
+- 工作进程数 WEB_CONCURRENCY，默认为CPU核数（事件循环本身是单线程的，一个核一个进程）
+- 预加载（GUNICORN_PRELOAD）：应用在主进程导入一次，工作进程 fork 后共享已导入的代码（写时复制），
+  启动更快，导入错误在启动时即失败而不是反复重启工作进程
+- 平滑重启：kill -HUP <主进程> 逐个启动新的工作进程、等待旧进程处理完进行中的请求后退出；
+  预加载时 HUP 不重新导入代码，发布新代码需重启主进程（容器）
+- 缓存、read-your-writes 和周期任务通过共享状态（REDIS_URL，见 app/core/shared_state.py）在进程间保持一致；
+  上游并发（QWEN_MAX_CONCURRENCY）按进程数平分。数据库连接池是每个进程各自的，
+  进程数 ×（pool_size + max_overflow）不能超过 MySQL 的 max_connections
+"""
+import itertools
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = f"{os.getenv('HOST', '0.0.0.0')}:{os.getenv('PORT', '8000')}"
+worker_class = "uvicorn_worker.UvicornWorker"
+# 按进程可用的核数（容器或 taskset 限制时少于机器的核数）
+_cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else multiprocessing.cpu_count()
+workers = int(os.getenv("WEB_CONCURRENCY") or _cpus)
+# 应用导入时按工作进程数划分并发预算，须在导入之前设置
+os.environ["WEB_CONCURRENCY"] = str(workers)
+preload_app = os.getenv("GUNICORN_PRELOAD", "True").lower() == "true"
+
+# 重启或关闭时等待进行中请求的时间，须长于流式对话的时限（DEADLINE_CHAT_SECONDS）
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "60"))
+# 工作进程的事件循环超过此时间没有响应即被主进程重启
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", "5"))
+# 处理一定数量的请求后替换工作进程（0 为不替换），随机抖动避免同时重启
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = int(os.getenv("GUNICORN_MAX_REQUESTS_JITTER", str(max_requests // 10)))
+
+# /metrics 汇总所有工作进程：各进程定期把指标写入此目录
+if workers > 1:
+    os.environ.setdefault("METRICS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), "chatbot-metrics"))
+
+
+def on_starting(server):
+    # 清除上次运行留下的指标快照
+    directory = os.getenv("METRICS_MULTIPROC_DIR")
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory, exist_ok=True)
+
+
+def pre_fork(server, worker):
+    # 分配最小的空闲编号：替换退出的进程时沿用其编号，追踪文件和指标快照的数量不随重启增长
+    used = {getattr(existing, "worker_id", None) for existing in server.WORKERS.values()}
+    worker.worker_id = next(number for number in itertools.count(1) if number not in used)
+
+
+def post_fork(server, worker):
+    os.environ["WORKER_ID"] = str(worker.worker_id)
+    if server.cfg.preload_app:
+        # fork 不复制后台线程，也不能与主进程共用连接
+        from app.core.logs import reinit_after_fork
+        from app.db.database import dispose_engines_after_fork
+
+        reinit_after_fork()
+        dispose_engines_after_fork()
+
+
+def child_exit(server, worker):
+    # 退出的进程不再计入 /metrics 的汇总（其计数器随之归零，Prometheus 按重置处理）
+    from app.core.metrics import remove_snapshot
+
+    remove_snapshot(str(worker.worker_id))
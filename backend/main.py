@@ -1,11 +1,32 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import PlainTextResponse
 from contextlib import asynccontextmanager
+import asyncio
 import uvicorn
+import logging
 import os
 
-from app.api import auth, chat, upload
+from app.core.logs import configure_logging
+
+# 先于其他模块配置日志，导入期间的日志也经由异步队列输出
+configure_logging()
+logger = logging.getLogger("app")
+
+from app.api import admin, auth, chat, chat_ws, jobs, upload
+from app.services.image_processing import shutdown_image_executor
+from app.services.qwen_vl import qwen_vl_service
+from app.services.persistence import write_behind
+from app.services.retention import retention_sweeper
+from app.services.archive import archive_mover
+from app.services.jobs import job_service
+from app.services.diagnostics import DIAGNOSTICS_ENABLED
+from app.services.loop_watchdog import loop_watchdog
+from app.db.database import replica_router
+from app.core import metrics
+from app.core.deps import require_internal
+from app.core.shared_state import shared_state
+from app.core.tracing import TracingMiddleware
 # from app.db.database import engine
 # from app.models import Base
 
@@ -15,10 +36,32 @@ from app.api import auth, chat, upload
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # 启动时的操作
-    print("🚀 聊天机器人后端服务启动中...")
+    logger.info("🚀 聊天机器人后端服务启动中...")
+    # 最先启动，启动过程中的阻塞也能被发现
+    await loop_watchdog.start()
+    # 其他服务依赖共享状态（广播、周期任务的租约）
+    await shared_state.start()
+    await metrics.snapshot_writer.start()
+    await replica_router.start()
+    await write_behind.start()
+    await retention_sweeper.start()
+    await archive_mover.start()
+    await job_service.start()
     yield
     # 关闭时的操作
-    print("👋 聊天机器人后端服务关闭中...")
+    logger.info("👋 聊天机器人后端服务关闭中...")
+    await job_service.stop()
+    await archive_mover.stop()
+    await retention_sweeper.stop()
+    # 写完队列中尚未落库的消息
+    await write_behind.stop()
+    await replica_router.stop()
+    await metrics.snapshot_writer.stop()
+    await shared_state.stop()
+    await qwen_vl_service.close()
+    shutdown_image_executor()
+    # 最后停止；严格模式下有超出预算的阻塞时在这里输出汇总
+    await loop_watchdog.stop()
 
 # 创建FastAPI应用
 app = FastAPI(
@@ -35,15 +78,22 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Sync-Token", "Server-Timing"],  # 会话列表的缓存校验和增量同步、各阶段耗时
 )
-
-# 挂载静态文件
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# 最外层：Server-Timing 响应头和抽样的请求追踪
+app.add_middleware(TracingMiddleware)
 
 # 包含路由
 app.include_router(auth.router, prefix="/api/auth", tags=["认证"])
 app.include_router(chat.router, prefix="/api/chat", tags=["聊天"])
+app.include_router(chat_ws.router, prefix="/api/chat", tags=["聊天"])
+app.include_router(jobs.router, prefix="/api/jobs", tags=["图片分析任务"])
 app.include_router(upload.router, prefix="/api/upload", tags=["文件上传"])
+# 上传图片需认证访问，启用X-Accel-Redirect时由nginx发送文件
+app.include_router(upload.files_router, prefix="/uploads", tags=["文件上传"])
+# 运行时诊断（CPU profile、内存快照、运行状态），默认关闭
+if DIAGNOSTICS_ENABLED:
+    app.include_router(admin.router, prefix="/api/admin/diagnostics", tags=["诊断"])
 
 @app.get("/")
 async def root():
@@ -57,7 +107,14 @@ async def root():
 async def health_check():
     return {"status": "healthy", "message": "服务运行正常"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False, dependencies=[Depends(require_internal)])
+async def get_metrics():
+    """Prometheus 格式的运行指标，仅限内部访问（见 require_internal），多个工作进程时为所有进程的汇总"""
+    body = await asyncio.to_thread(metrics.render) if metrics.METRICS_MULTIPROC_DIR else metrics.render()
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
+    # 开发模式：单进程，代码修改后自动重载；生产环境使用 gunicorn -c gunicorn.conf.py（多个工作进程）
     # 从环境变量获取配置
     host = os.getenv("HOST", "0.0.0.0")
     port = int(os.getenv("PORT", "8000"))
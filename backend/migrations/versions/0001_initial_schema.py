@@ -0,0 +1,114 @@
+"""initial schema
+
+建表结构与 mysql/init.sql + mysql/migrations/001_binary_uuid7_keys.sql 之后的状态一致。
+已有数据库（由 init.sql 或 create_all 创建、没有迁移记录）不再建表，而是自动接入迁移链：
+会话和消息主键仍是 VARCHAR 时先按 001 脚本的步骤转换为 BINARY(16)（仅 MySQL），
+已手动执行过 001 脚本的库直接沿用。不需要再手动运行 `alembic stamp`。
+
+Revision ID: 0001_initial_schema
+Revises:
+Create Date: 2026-10-19 10:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001_initial_schema"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def _adopt_legacy_schema(inspector):
+    """接入已有的旧库：主键仍是字符串时转换为 BINARY(16)，与 001_binary_uuid7_keys.sql 相同"""
+    id_type = next(
+        column["type"] for column in inspector.get_columns("chat_sessions") if column["name"] == "id"
+    )
+    if isinstance(id_type, (sa.BINARY, sa.LargeBinary)):
+        return
+    if op.get_bind().dialect.name != "mysql":
+        raise RuntimeError(
+            "旧库的会话主键仍是字符串，只支持在 MySQL 上自动转换；请删除旧表后重新迁移"
+        )
+    foreign_key = next(
+        fk["name"] for fk in inspector.get_foreign_keys("messages")
+        if fk["referred_table"] == "chat_sessions"
+    )
+    op.execute(f"ALTER TABLE messages DROP FOREIGN KEY {foreign_key}")
+    op.execute("ALTER TABLE chat_sessions ADD COLUMN id_bin BINARY(16) NULL FIRST")
+    op.execute("UPDATE chat_sessions SET id_bin = UNHEX(REPLACE(id, '-', ''))")
+    op.execute(
+        "ALTER TABLE chat_sessions DROP PRIMARY KEY, DROP COLUMN id, "
+        "CHANGE id_bin id BINARY(16) NOT NULL, ADD PRIMARY KEY (id)"
+    )
+    op.execute(
+        "ALTER TABLE messages ADD COLUMN id_bin BINARY(16) NULL FIRST, "
+        "ADD COLUMN chat_session_id_bin BINARY(16) NULL AFTER id_bin"
+    )
+    op.execute(
+        "UPDATE messages SET id_bin = UNHEX(REPLACE(id, '-', '')), "
+        "chat_session_id_bin = UNHEX(REPLACE(chat_session_id, '-', ''))"
+    )
+    op.execute(
+        "ALTER TABLE messages DROP PRIMARY KEY, DROP COLUMN id, DROP COLUMN chat_session_id, "
+        "CHANGE id_bin id BINARY(16) NOT NULL, CHANGE chat_session_id_bin chat_session_id BINARY(16) NOT NULL, "
+        "ADD PRIMARY KEY (id)"
+    )
+    op.execute(
+        f"ALTER TABLE messages ADD CONSTRAINT {foreign_key} FOREIGN KEY (chat_session_id) "
+        "REFERENCES chat_sessions(id) ON DELETE CASCADE"
+    )
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    if "chat_sessions" in inspector.get_table_names():
+        _adopt_legacy_schema(inspector)
+        return
+
+    op.create_table(
+        "users",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("username", sa.String(50), nullable=False),
+        sa.Column("email", sa.String(100), nullable=False),
+        sa.Column("hashed_password", sa.String(255), nullable=False),
+        sa.Column("is_active", sa.Boolean(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        mysql_charset="utf8mb4",
+    )
+    op.create_index("ix_users_username", "users", ["username"], unique=True)
+    op.create_index("ix_users_email", "users", ["email"], unique=True)
+
+    op.create_table(
+        "chat_sessions",
+        sa.Column("id", sa.BINARY(16), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        mysql_charset="utf8mb4",
+    )
+
+    op.create_table(
+        "messages",
+        sa.Column("id", sa.BINARY(16), primary_key=True),
+        sa.Column(
+            "chat_session_id", sa.BINARY(16),
+            sa.ForeignKey("chat_sessions.id", ondelete="CASCADE"), nullable=False
+        ),
+        sa.Column("content", sa.Text(), nullable=True),
+        sa.Column("type", sa.Enum("user", "bot", name="messagetype"), nullable=False),
+        sa.Column("image_url", sa.String(500), nullable=True),
+        sa.Column("image_path", sa.String(500), nullable=True),
+        sa.Column("timestamp", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        mysql_charset="utf8mb4",
+    )
+
+
+def downgrade():
+    op.drop_table("messages")
+    op.drop_table("chat_sessions")
+    op.drop_index("ix_users_email", table_name="users")
+    op.drop_index("ix_users_username", table_name="users")
+    op.drop_table("users")
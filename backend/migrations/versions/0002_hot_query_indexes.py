@@ -0,0 +1,52 @@
+"""hot query indexes
+
+为两个高频查询添加复合索引，并清理旧建表方式遗留的冗余索引：
+- 会话历史：messages WHERE chat_session_id = ? ORDER BY timestamp
+- 会话列表：chat_sessions WHERE user_id = ? ORDER BY updated_at DESC
+
+Revision ID: 0002_hot_query_indexes
+Revises: 0001_initial_schema
+Create Date: 2026-10-19 10:10:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0002_hot_query_indexes"
+down_revision = "0001_initial_schema"
+branch_labels = None
+depends_on = None
+
+# init.sql / create_all 可能创建过的冗余索引：主键、唯一约束或新复合索引已覆盖
+LEGACY_INDEXES = {
+    "users": ["idx_users_username", "idx_users_email", "ix_users_id"],
+    "chat_sessions": ["idx_chat_sessions_user_id", "ix_chat_sessions_id"],
+    "messages": ["ix_messages_id"],
+}
+
+
+def _existing_indexes(table):
+    return {index["name"] for index in sa.inspect(op.get_bind()).get_indexes(table)}
+
+
+def upgrade():
+    op.create_index(
+        "ix_messages_chat_session_id_timestamp", "messages", ["chat_session_id", "timestamp"]
+    )
+    op.create_index(
+        "ix_chat_sessions_user_id_updated_at", "chat_sessions", ["user_id", "updated_at"]
+    )
+    # 复合索引以外键列开头，可以替代外键所需的单列索引
+    for table, names in LEGACY_INDEXES.items():
+        existing = _existing_indexes(table)
+        for name in names:
+            if name in existing:
+                op.drop_index(name, table_name=table)
+
+
+def downgrade():
+    # 外键列需要索引，先建单列索引再删除复合索引
+    op.create_index("ix_messages_chat_session_id", "messages", ["chat_session_id"])
+    op.create_index("ix_chat_sessions_user_id", "chat_sessions", ["user_id"])
+    op.drop_index("ix_chat_sessions_user_id_updated_at", table_name="chat_sessions")
+    op.drop_index("ix_messages_chat_session_id_timestamp", table_name="messages")
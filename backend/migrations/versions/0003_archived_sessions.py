@@ -0,0 +1,42 @@
+"""archived sessions
+
+冷存储表：长期不活跃的会话连同消息压缩后移入此表，访问时再恢复到热表。
+
+Revision ID: 0003_archived_sessions
+Revises: 0002_hot_query_indexes
+Create Date: 2026-10-19 11:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+revision = "0003_archived_sessions"
+down_revision = "0002_hot_query_indexes"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "archived_sessions",
+        sa.Column("id", sa.BINARY(16), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("title", sa.String(200), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("archived_at", sa.DateTime(timezone=True), server_default=sa.func.now()),
+        sa.Column("message_count", sa.Integer(), nullable=False),
+        sa.Column("raw_bytes", sa.Integer(), nullable=False),
+        sa.Column("codec", sa.String(10), nullable=False),
+        sa.Column("payload", sa.LargeBinary().with_variant(mysql.LONGBLOB(), "mysql"), nullable=False),
+        sa.Column("image_filenames", sa.Text(), nullable=True),
+        mysql_charset="utf8mb4",
+    )
+    op.create_index(
+        "ix_archived_sessions_user_id_updated_at", "archived_sessions", ["user_id", "updated_at"]
+    )
+
+
+def downgrade():
+    op.drop_table("archived_sessions")
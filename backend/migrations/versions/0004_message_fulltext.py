@@ -0,0 +1,31 @@
+"""message fulltext index
+
+消息搜索使用的 ngram 全文索引，仅 MySQL。大表上建索引耗时较长，
+可在低峰期执行；其他数据库跳过，搜索退回 LIKE。
+
+Revision ID: 0004_message_fulltext
+Revises: 0003_archived_sessions
+Create Date: 2026-10-19 12:00:00
+"""
+from alembic import op
+
+
+revision = "0004_message_fulltext"
+down_revision = "0003_archived_sessions"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    op.create_index(
+        "ft_messages_content", "messages", ["content"],
+        mysql_prefix="FULLTEXT", mysql_with_parser="ngram"
+    )
+
+
+def downgrade():
+    if op.get_bind().dialect.name != "mysql":
+        return
+    op.drop_index("ft_messages_content", table_name="messages")
@@ -0,0 +1,48 @@
+"""session sync
+
+会话列表增量同步：
+- session_tombstones 记录已删除的会话
+- chat_sessions.updated_at 改为微秒精度（MySQL），同一秒内的多次更新也能区分
+
+Revision ID: 0005_session_sync
+Revises: 0004_message_fulltext
+Create Date: 2026-10-19 13:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import mysql
+
+
+revision = "0005_session_sync"
+down_revision = "0004_message_fulltext"
+branch_labels = None
+depends_on = None
+
+PRECISE_DATETIME = sa.DateTime(timezone=True).with_variant(mysql.DATETIME(fsp=6), "mysql")
+
+
+def upgrade():
+    op.create_table(
+        "session_tombstones",
+        sa.Column("session_id", sa.BINARY(16), primary_key=True),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("deleted_at", PRECISE_DATETIME, nullable=False),
+        mysql_charset="utf8mb4",
+    )
+    op.create_index(
+        "ix_session_tombstones_user_id_deleted_at", "session_tombstones", ["user_id", "deleted_at"]
+    )
+    if op.get_bind().dialect.name == "mysql":
+        op.alter_column(
+            "chat_sessions", "updated_at",
+            existing_type=mysql.DATETIME(), type_=mysql.DATETIME(fsp=6), existing_nullable=True
+        )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "mysql":
+        op.alter_column(
+            "chat_sessions", "updated_at",
+            existing_type=mysql.DATETIME(fsp=6), type_=mysql.DATETIME(), existing_nullable=True
+        )
+    op.drop_table("session_tombstones")
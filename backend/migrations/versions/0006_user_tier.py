@@ -0,0 +1,28 @@
+"""user tier
+
+users.tier 记录用户档位（standard / premium），模型路由按档位选择对话使用的模型；
+已有用户默认为 standard。
+
+Revision ID: 0006_user_tier
+Revises: 0005_session_sync
+Create Date: 2026-10-19 15:00:00
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0006_user_tier"
+down_revision = "0005_session_sync"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "users",
+        sa.Column("tier", sa.String(20), nullable=False, server_default="standard"),
+    )
+
+
+def downgrade():
+    op.drop_column("users", "tier")
@@ -0,0 +1,124 @@
+"""upload references
+
+上传文件的引用改为等值查询：
+- messages.upload_filename 记录消息引用的上传文件名（由 image_url 得出），带索引
+- archived_session_uploads 记录归档会话引用的上传文件，主键以文件名开头
+释放文件和访问授权不再用前导通配符的 LIKE 扫描整张消息表。
+
+Revision ID: 0007_upload_references
+Revises: 0006_user_tier
+Create Date: 2026-10-19 17:00:00
+"""
+import os
+import re
+from urllib.parse import urlparse
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0007_upload_references"
+down_revision = "0006_user_tier"
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 1000
+
+# 迁移编写时的图片URL解析规则（app.core.uploads.upload_filename_from_url）的副本，
+# 应用代码之后的改动不影响本迁移
+UPLOAD_URL_PREFIX = "/uploads/"
+LOCAL_UPLOAD_HOSTS = set(
+    os.getenv("UPLOAD_LOCAL_HOSTS", "localhost,localhost:8000,127.0.0.1:8000,backend:8000").split(",")
+)
+SAFE_FILENAME_RE = re.compile(r"^[A-Za-z0-9_-]+(\.[A-Za-z0-9]+)?$")
+
+
+def upload_filename_from_url(image_url):
+    if not image_url:
+        return None
+    parsed = urlparse(image_url)
+    if parsed.netloc and parsed.netloc not in LOCAL_UPLOAD_HOSTS:
+        return None
+    path = parsed.path
+    if not path.startswith(UPLOAD_URL_PREFIX):
+        return None
+    filename = path[len(UPLOAD_URL_PREFIX):]
+    return filename if SAFE_FILENAME_RE.match(filename) else None
+
+
+def _backfill_messages(bind):
+    messages = sa.table(
+        "messages",
+        sa.column("id", sa.BINARY(16)),
+        sa.column("image_url", sa.String(500)),
+        sa.column("upload_filename", sa.String(100)),
+    )
+    last_id = None
+    while True:
+        query = sa.select(messages.c.id, messages.c.image_url).where(messages.c.image_url.is_not(None))
+        if last_id is not None:
+            query = query.where(messages.c.id > last_id)
+        rows = bind.execute(query.order_by(messages.c.id).limit(BATCH_SIZE)).all()
+        if not rows:
+            return
+        updates = [
+            {"message_id": row.id, "filename": filename}
+            for row in rows
+            if (filename := upload_filename_from_url(row.image_url))
+        ]
+        if updates:
+            bind.execute(
+                messages.update()
+                .where(messages.c.id == sa.bindparam("message_id"))
+                .values(upload_filename=sa.bindparam("filename")),
+                updates,
+            )
+        last_id = rows[-1].id
+
+
+def _backfill_archived(bind):
+    archived_sessions = sa.table(
+        "archived_sessions",
+        sa.column("id", sa.BINARY(16)),
+        sa.column("image_filenames", sa.Text()),
+    )
+    uploads = sa.table(
+        "archived_session_uploads",
+        sa.column("filename", sa.String(100)),
+        sa.column("archived_session_id", sa.BINARY(16)),
+    )
+    rows = bind.execute(
+        sa.select(archived_sessions.c.id, archived_sessions.c.image_filenames)
+        .where(archived_sessions.c.image_filenames.is_not(None))
+    )
+    references = [
+        {"filename": filename, "archived_session_id": row.id}
+        for row in rows
+        for filename in set(row.image_filenames.split())
+    ]
+    for start in range(0, len(references), BATCH_SIZE):
+        bind.execute(uploads.insert(), references[start:start + BATCH_SIZE])
+
+
+def upgrade():
+    op.add_column("messages", sa.Column("upload_filename", sa.String(100), nullable=True))
+    op.create_table(
+        "archived_session_uploads",
+        sa.Column("filename", sa.String(100), primary_key=True),
+        sa.Column(
+            "archived_session_id", sa.BINARY(16),
+            sa.ForeignKey("archived_sessions.id", ondelete="CASCADE"), primary_key=True
+        ),
+        mysql_charset="utf8mb4",
+    )
+    bind = op.get_bind()
+    _backfill_messages(bind)
+    _backfill_archived(bind)
+    # 回填后再建索引，避免逐行维护
+    op.create_index("ix_messages_upload_filename", "messages", ["upload_filename"])
+
+
+def downgrade():
+    op.drop_table("archived_session_uploads")
+    op.drop_index("ix_messages_upload_filename", table_name="messages")
+    op.drop_column("messages", "upload_filename")
@@ -0,0 +1,43 @@
+"""运维接口（/metrics、诊断）只允许内部访问：内网直接访问或带 INTERNAL_API_TOKEN"""
+import pytest
+
+pytest.importorskip("httpx")
+
+from fastapi import Depends, FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.core import deps  # noqa: E402
+
+app = FastAPI()
+
+
+@app.get("/metrics", dependencies=[Depends(deps.require_internal)])
+async def metrics():
+    return "ok"
+
+
+def status(host: str, **headers) -> int:
+    with TestClient(app, client=(host, 50000)) as client:
+        return client.get("/metrics", headers=headers).status_code
+
+
+@pytest.mark.parametrize("host", ["127.0.0.1", "10.0.0.5", "172.18.0.3", "::1"])
+def test_internal_addresses_are_allowed(host):
+    assert status(host) == 200
+
+
+@pytest.mark.parametrize("host", ["8.8.8.8", "testclient", ""])
+def test_external_addresses_are_rejected(host):
+    assert status(host) == 403
+
+
+def test_requests_forwarded_by_nginx_are_rejected():
+    # nginx 与后端在同一内网，转发的外部请求带 X-Forwarded-For
+    assert status("172.18.0.3", **{"X-Forwarded-For": "203.0.113.7"}) == 403
+
+
+def test_token_is_required_when_configured(monkeypatch):
+    monkeypatch.setattr(deps, "INTERNAL_API_TOKEN", "secret")
+    assert status("127.0.0.1") == 403
+    assert status("127.0.0.1", **{"X-Internal-Token": "wrong"}) == 403
+    assert status("203.0.113.7", **{"X-Internal-Token": "secret", "X-Forwarded-For": "203.0.113.7"}) == 200
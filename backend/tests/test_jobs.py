@@ -0,0 +1,226 @@
+"""图片分析任务：并发、进度事件、结果写入、取消、租约回收和图片归属
+
+用进程内 broker、SQLite 和假的模型调用运行 JobService；Redis 的租约回收在设置 TEST_REDIS_URL 时运行。
+"""
+import asyncio
+import io
+import os
+import uuid
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("httpx")
+Image = pytest.importorskip("PIL.Image")
+
+from sqlalchemy import create_engine, event, func, insert, select  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.ids import new_id  # noqa: E402
+from app.models import Base, ChatSession, Message, User  # noqa: E402
+from app.models.message import MessageType  # noqa: E402
+from app.services import jobs, preprocess, storage  # noqa: E402
+from app.services.qwen_vl import CompletionResult, QwenAPIError  # noqa: E402
+
+TEST_REDIS_URL = os.getenv("TEST_REDIS_URL", "")
+
+FAILING_URL = "https://example.com/broken.png"
+CONCURRENCY = 3
+
+
+def sample_image() -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), "orange").save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+class FakeUpstream:
+    """记录并发数的假模型调用"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self.calls = 0
+
+    async def fetch_image(self, image_url: str) -> bytes:
+        if image_url == FAILING_URL:
+            raise QwenAPIError(500, "模拟上游错误")
+        return sample_image()
+
+    async def complete(self, request):
+        self.active += 1
+        self.calls += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.latency)
+            return CompletionResult(content="一张橙色的图片")
+        finally:
+            self.active -= 1
+
+
+@pytest.fixture
+def factory(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}")
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(jobs, "SessionLocal", factory)
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def session_id(factory):
+    session_id = new_id()
+    with factory() as db:
+        db.execute(insert(User), {"username": "jobs", "email": "jobs@example.com", "hashed_password": "x"})
+        user_id = db.scalar(select(User.id))
+        db.add(ChatSession(id=session_id, user_id=user_id, title="批量分析"))
+        db.commit()
+    return session_id
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    upstream = FakeUpstream(0.05)
+    monkeypatch.setattr(preprocess, "fetch_image", upstream.fetch_image)
+    monkeypatch.setattr(jobs.qwen_vl_service, "complete", upstream.complete)
+    return upstream
+
+
+async def collect(service, job_id):
+    """订阅进度直到任务结束，返回收到的事件"""
+    events = []
+    async with service.subscribe(job_id) as queue:
+        while True:
+            job = await service.broker.get(job_id)
+            if jobs.job_finished(job):
+                # 状态先于事件更新，取完最后一张图片随后发布的事件
+                try:
+                    while True:
+                        events.append(await asyncio.wait_for(queue.get(), 0.1))
+                except asyncio.TimeoutError:
+                    return events
+            try:
+                events.append(await asyncio.wait_for(queue.get(), 1))
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_job(service, session_id, urls, prompt="描述图片"):
+    await service.start()
+    try:
+        job = await service.submit(1, "jobs", "standard", session_id, prompt, urls)
+        events = await collect(service, job["id"])
+        return await service.get(job["id"], 1), events
+    finally:
+        await service.stop()
+
+
+def test_job_runs_every_image_within_concurrency(factory, session_id, upstream):
+    urls = [f"https://example.com/{i}.png" for i in range(11)] + [FAILING_URL]
+    service = jobs.JobService(jobs.InMemoryBroker(), concurrency=CONCURRENCY)
+    job, events = asyncio.run(run_job(service, session_id, urls))
+
+    assert upstream.peak <= CONCURRENCY
+    assert jobs.job_status(job) == "completed"
+    finished = {event["index"] for event in events if event["status"] in jobs.ITEM_FINISHED}
+    assert finished == set(range(len(urls)))
+    failed = job["items"][-1]
+    assert failed["status"] == jobs.ITEM_FAILED and "500" in failed["error"]
+
+    with factory() as db:
+        count = db.scalar(select(func.count(Message.id)).where(Message.chat_session_id == session_id))
+    # 每张图片一问一答两条消息
+    assert count == 2 * len(urls)
+
+
+def test_cancel_skips_images_not_started(session_id, upstream):
+    urls = [f"https://example.com/{i}.png" for i in range(12)]
+    upstream.latency = 0.5
+    service = jobs.JobService(jobs.InMemoryBroker(), concurrency=CONCURRENCY)
+
+    async def run():
+        await service.start()
+        try:
+            job = await service.submit(1, "jobs", "standard", session_id, None, urls)
+            await asyncio.sleep(0.1)
+            await service.cancel(job["id"])
+            await collect(service, job["id"])
+            return await service.get(job["id"], 1)
+        finally:
+            await service.stop()
+
+    job = asyncio.run(run())
+    cancelled = sum(item["status"] == jobs.ITEM_CANCELLED for item in job["items"])
+    assert jobs.job_status(job) == "cancelled"
+    assert upstream.calls <= CONCURRENCY
+    assert cancelled >= len(urls) - CONCURRENCY
+
+
+def test_signed_media_url_identifies_user():
+    filename = f"{0:064x}.jpg"
+    assert storage.signed_media_user(storage.media_url(filename, 7)) == 7
+    assert storage.signed_media_user(storage.media_url(filename, 7).replace("u=7", "u=8")) is None
+    assert storage.signed_media_user(storage.upload_url(filename)) is None
+    assert storage.signed_media_user("https://example.com/a.png?u=7&sig=x") is None
+
+
+def test_job_rejects_uploads_of_other_users(factory, session_id):
+    pytest.importorskip("fastapi")
+    from fastapi import HTTPException
+
+    from app.api.jobs import _authorize_images
+
+    filename = f"{1:064x}.jpg"
+    with factory() as db:
+        owner = db.get(User, 1)
+        other = User(username="other", email="other@example.com", hashed_password="x")
+        db.add(other)
+        db.commit()
+
+        # 签名的URL与发送过的图片可以使用，提交时去掉签名参数
+        assert _authorize_images([storage.media_url(filename, owner.id)], owner, db) == [storage.upload_url(filename)]
+        db.add(Message(id=new_id(), chat_session_id=session_id, content="图", type=MessageType.user,
+                       image_url=storage.upload_url(filename)))
+        db.commit()
+        assert _authorize_images([storage.upload_url(filename)], owner, db) == [storage.upload_url(filename)]
+        # 外部图片不检查
+        assert _authorize_images(["https://example.com/a.png"], other, db) == ["https://example.com/a.png"]
+
+        for url in (storage.upload_url(filename), storage.media_url(filename, owner.id)):
+            with pytest.raises(HTTPException) as error:
+                _authorize_images([url], other, db)
+            assert error.value.status_code == 403
+
+
+@pytest.mark.skipif(not TEST_REDIS_URL, reason="未设置 TEST_REDIS_URL")
+def test_redis_broker_requeues_expired_leases():
+    pytest.importorskip("redis")
+
+    async def run():
+        broker = jobs.RedisBroker(TEST_REDIS_URL, lease=0.2)
+        broker.QUEUE_KEY = f"test:jobs:queue:{uuid.uuid4().hex}"
+        broker.PROCESSING_KEY = f"test:jobs:processing:{uuid.uuid4().hex}"
+        try:
+            await broker.redis.lpush(broker.QUEUE_KEY, "crashed:0", "acked:0")
+            assert await broker.dequeue() == ("crashed", 0)
+            assert await broker.dequeue() == ("acked", 0)
+            await broker.ack("acked", 0)
+
+            # 持有者不再续期：租约过期后连续两次检查都没有租约才放回队列
+            await asyncio.sleep(0.3)
+            assert await broker.reap() == 0
+            assert await broker.reap() == 1
+            assert await broker.redis.lrange(broker.PROCESSING_KEY, 0, -1) == []
+            assert await broker.dequeue() == ("crashed", 0)
+        finally:
+            await broker.redis.delete(broker.QUEUE_KEY, broker.PROCESSING_KEY, broker._lease_key("crashed:0"))
+            await broker.redis.aclose()
+
+    asyncio.run(run())
@@ -0,0 +1,106 @@
+"""事件循环阻塞监测
+
+以严格模式运行监测，模拟若干请求处理函数依次执行：
+- 在协程中直接调用同步阻塞代码（time.sleep、CPU密集计算）被发现，定位到该任务和所属请求
+- 同样的工作放到线程池（asyncio.to_thread）或使用异步等待时不被报告
+- 超出预算的阻塞由 assert_no_blocking() 报告，stop() 本身不抛出异常
+"""
+import asyncio
+import hashlib
+import time
+
+import pytest
+
+from app.core.tracing import Trace, trace_scope
+from app.services.loop_watchdog import LoopWatchdog
+
+BLOCK_SECONDS = 0.3
+INTERVAL = 0.05
+
+
+def hash_password(seconds: float):
+    """模拟 bcrypt：持续占用CPU一段时间"""
+    end = time.perf_counter() + seconds
+    digest = b""
+    while time.perf_counter() < end:
+        digest = hashlib.sha256(digest).digest()
+
+
+async def blocking_sleep(seconds: float):
+    time.sleep(seconds)
+
+
+async def blocking_hash(seconds: float):
+    hash_password(seconds)
+
+
+async def threaded_hash(seconds: float):
+    await asyncio.to_thread(hash_password, seconds)
+
+
+async def async_sleep(seconds: float):
+    await asyncio.sleep(seconds)
+
+
+HANDLERS = {
+    "/api/blocking-sleep": (blocking_sleep, True),
+    "/api/blocking-hash": (blocking_hash, True),
+    "/api/threaded-hash": (threaded_hash, False),
+    "/api/async-sleep": (async_sleep, False),
+}
+
+
+async def request(route: str):
+    handler, _ = HANDLERS[route]
+    with trace_scope(Trace(route=route)):
+        await handler(BLOCK_SECONDS)
+
+
+async def run_requests(watchdog: LoopWatchdog):
+    await watchdog.start()
+    try:
+        # 依次发出请求，间隔足够让监测线程区分每次阻塞
+        for route in HANDLERS:
+            await asyncio.create_task(request(route), name=route)
+            await asyncio.sleep(INTERVAL * 3)
+    finally:
+        await watchdog.stop()
+
+
+@pytest.fixture(scope="module")
+def watchdog():
+    watchdog = LoopWatchdog(interval=INTERVAL, threshold=INTERVAL, strict=True, budget=0.1)
+    asyncio.run(run_requests(watchdog))
+    return watchdog
+
+
+def test_blocking_handlers_are_attributed_to_task_and_route(watchdog):
+    flagged = {event.task.split()[0] for event in watchdog.violations if event.task}
+    expected = {route for route, (_, blocking) in HANDLERS.items() if blocking}
+    assert flagged == expected
+    # 请求的路由由任务登记时的上下文得到，不依赖 Task.get_context()（Python 3.12+）
+    assert {event.route for event in watchdog.violations} == expected
+
+
+def test_blocking_location_points_at_application_frame(watchdog):
+    locations = {event.location.rsplit(":", 1)[-1] for event in watchdog.violations}
+    # 阻塞位置是最内层的帧（blocking_hash 内调用的 hash_password）
+    assert locations == {"blocking_sleep", "hash_password"}
+
+
+def test_strict_mode_reports_through_assert_no_blocking(watchdog):
+    # stop() 已正常返回；由测试决定是否失败
+    with pytest.raises(AssertionError, match="2 次事件循环阻塞超出预算"):
+        watchdog.assert_no_blocking()
+
+
+def test_stop_restores_task_factory():
+    async def run():
+        loop = asyncio.get_running_loop()
+        watchdog = LoopWatchdog(interval=INTERVAL, threshold=INTERVAL)
+        await watchdog.start()
+        assert loop.get_task_factory() is not None
+        await watchdog.stop()
+        return loop.get_task_factory()
+
+    assert asyncio.run(run()) is None
@@ -0,0 +1,140 @@
+"""带签名的上传文件访问URL：签名和到期时间、归属检查、协商缓存和 X-Accel-Redirect；
+聊天请求中的图片同样须属于当前用户"""
+import asyncio
+import time
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+pytest.importorskip("httpx")
+pytest.importorskip("PIL")
+
+from fastapi import FastAPI, HTTPException  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+from sqlalchemy.pool import StaticPool  # noqa: E402
+
+from app.api import upload  # noqa: E402
+from app.api.chat import _authorize_request, chat_events  # noqa: E402
+from app.core.ids import new_id  # noqa: E402
+from app.db.database import get_db  # noqa: E402
+from app.models import Base, ChatSession, Message, User  # noqa: E402
+from app.models.message import MessageType  # noqa: E402
+from app.schemas.chat import ChatRequest  # noqa: E402
+from app.services import storage  # noqa: E402
+
+FILENAME = f"{0:064x}.png"
+OWNER, OTHER = 1, 2
+
+
+@pytest.fixture
+def factory(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    (tmp_path / FILENAME).write_bytes(b"\x89PNG\r\n\x1a\n")
+
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add_all([
+            User(id=OWNER, username="owner", email="owner@example.com", hashed_password="x"),
+            User(id=OTHER, username="other", email="other@example.com", hashed_password="x"),
+        ])
+        session_id = new_id()
+        db.add(ChatSession(id=session_id, user_id=OWNER, title="图片"))
+        db.add(Message(id=new_id(), chat_session_id=session_id, content="图", type=MessageType.user,
+                       image_url=storage.upload_url(FILENAME)))
+        db.commit()
+    yield factory
+    engine.dispose()
+
+
+@pytest.fixture
+def client(factory):
+    def override_get_db():
+        with factory() as db:
+            yield db
+
+    app = FastAPI()
+    app.include_router(upload.files_router, prefix="/uploads")
+    app.dependency_overrides[get_db] = override_get_db
+    with TestClient(app) as client:
+        yield client
+
+
+def test_owner_can_fetch_with_signed_url(client):
+    response = client.get(storage.media_url(FILENAME, OWNER))
+    assert response.status_code == 200
+    assert response.headers["etag"] == f'"{0:064x}"'
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_missing_or_invalid_signature_is_rejected(client):
+    assert client.get(storage.upload_url(FILENAME)).status_code == 401
+    signed = storage.media_url(FILENAME, OWNER)
+    assert client.get(signed[:-4] + "0000").status_code == 403
+    # 签名绑定用户：改成其他用户ID后无效
+    assert client.get(signed.replace(f"u={OWNER}", f"u={OTHER}")).status_code == 403
+
+
+def test_expired_signature_is_rejected(client):
+    expires = int(time.time()) - 1
+    assert client.get(storage.media_url(FILENAME, OWNER, expires=expires)).status_code == 403
+    assert storage.signed_media_user(storage.media_url(FILENAME, OWNER, expires=expires)) is None
+
+
+def test_other_users_cannot_fetch(client):
+    # 签名有效，但该用户没有发送过这张图片
+    assert client.get(storage.media_url(FILENAME, OTHER)).status_code == 404
+
+
+def test_if_none_match_returns_304(client):
+    url = storage.media_url(FILENAME, OWNER)
+    etag = client.get(url).headers["etag"]
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+
+
+def test_x_accel_redirect_hands_file_to_nginx(client, monkeypatch):
+    monkeypatch.setattr(storage, "X_ACCEL_ENABLED", True)
+    response = client.get(storage.media_url(FILENAME, OWNER))
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == f"{storage.X_ACCEL_PREFIX}{FILENAME}"
+    assert response.content == b""
+
+
+def test_expiry_is_rounded_so_urls_stay_stable():
+    step = storage.MEDIA_URL_TTL_STEP_SECONDS
+    start = 1_700_000_000 // step * step + 1
+    assert storage.media_expiry(start) == storage.media_expiry(start + step - 2)
+    assert storage.media_expiry(start) >= start + storage.MEDIA_URL_TTL_SECONDS
+
+
+def test_chat_only_accepts_own_uploads(factory):
+    with factory() as db:
+        owner, other = db.get(User, OWNER), db.get(User, OTHER)
+        # 签名的URL与发送过的图片可以使用，保存时去掉签名参数
+        for url in (storage.media_url(FILENAME, OWNER), storage.upload_url(FILENAME)):
+            request = ChatRequest(message="描述图片", image_url=url)
+            assert _authorize_request(request, owner, db).image_url == storage.upload_url(FILENAME)
+        external = ChatRequest(message="描述图片", image_url="https://example.com/a.png")
+        assert _authorize_request(external, other, db).image_url == "https://example.com/a.png"
+
+        for url in (storage.upload_url(FILENAME), storage.media_url(FILENAME, OWNER)):
+            with pytest.raises(HTTPException) as error:
+                _authorize_request(ChatRequest(message="描述图片", image_url=url), other, db)
+            assert error.value.status_code == 403
+
+
+def test_chat_stream_rejects_other_users_upload_before_saving(factory):
+    async def run(db, user):
+        request = ChatRequest(message="描述图片", image_url=storage.upload_url(FILENAME))
+        return [event async for event in chat_events(request, user, db)]
+
+    with factory() as db:
+        messages = db.query(Message).count()
+        events = asyncio.run(run(db, db.get(User, OTHER)))
+        assert events == [{"error": "无权使用该图片"}]
+        assert db.query(Message).count() == messages
@@ -0,0 +1,148 @@
+"""模型路由：按规则选择档位、滚动p95超出SLO时降级、降级期间探测原档位并自动恢复
+
+用按模型设定首字延迟的假上游驱动 ModelRouter，时钟由测试控制；
+另用 httpx.MockTransport 检查 stream_completion 报告的首字延迟不含排队时间。
+"""
+import asyncio
+import json
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.services import model_router as router_module
+from app.services.model_router import DEFAULT_RULES, DEFAULT_TIERS, ModelRouter
+
+WINDOW = 60.0
+MIN_SAMPLES = 10
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+class FakeUpstream:
+    """按模型返回固定首字延迟的假上游"""
+
+    def __init__(self, **latency: float):
+        self.latency = latency
+
+    def serve(self, router: ModelRouter, prompt: str = "你好", has_image: bool = False, user_tier: str = "standard"):
+        decision = router.route(prompt, has_image, user_tier)
+        router.observe(decision.tier, self.latency[decision.tier.model])
+        return decision
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(router_module, "time", SimpleNamespace(monotonic=clock.monotonic))
+    return clock
+
+
+def make_router(probe_rate: float = 0.0) -> ModelRouter:
+    return ModelRouter(
+        DEFAULT_TIERS, DEFAULT_RULES, window=WINDOW, min_samples=MIN_SAMPLES,
+        probe_rate=probe_rate, rng=random.Random(0),
+    )
+
+
+def test_rules_select_tier(clock):
+    router = make_router()
+    assert router.route("你好", False).tier.model == "qwen-plus"
+    assert router.route("描述图片", True).tier.model == "qwen-vl-plus"
+    assert router.route("你好", False, "premium").tier.model == "qwen-max"
+    assert router.route("描述图片", True, "premium").tier.model == "qwen-vl-max"
+    assert router.route("你好", False).reason == "rule"
+
+
+def test_slow_tier_is_degraded_to_fallback(clock):
+    router = make_router()
+    upstream = FakeUpstream(**{"qwen-plus": 3.0, "qwen-turbo": 0.5})
+
+    # 样本不足时不降级
+    for _ in range(MIN_SAMPLES - 1):
+        assert upstream.serve(router).reason == "rule"
+    upstream.serve(router)
+
+    decision = upstream.serve(router)
+    assert (decision.tier.model, decision.requested, decision.reason) == ("qwen-turbo", "text-plus", "degraded")
+    assert router.status()["text-plus"]["breaching"]
+
+
+def test_degraded_tier_is_probed(clock):
+    router = make_router(probe_rate=0.2)
+    upstream = FakeUpstream(**{"qwen-plus": 3.0, "qwen-turbo": 0.5})
+    for _ in range(MIN_SAMPLES):
+        upstream.serve(router)
+
+    reasons = [upstream.serve(router).reason for _ in range(200)]
+    assert set(reasons) == {"degraded", "probe"}
+    assert 0.1 < reasons.count("probe") / len(reasons) < 0.3
+
+
+def test_probes_bring_recovered_tier_back(clock):
+    router = make_router(probe_rate=0.2)
+    upstream = FakeUpstream(**{"qwen-plus": 3.0, "qwen-turbo": 0.5})
+    for _ in range(MIN_SAMPLES):
+        upstream.serve(router)
+    assert upstream.serve(router).reason == "degraded"
+
+    # 原档位恢复正常：时钟不动，只靠探测请求的样本把p95拉回SLO以内
+    upstream.latency["qwen-plus"] = 0.5
+    for _ in range(2000):
+        if upstream.serve(router).reason == "rule":
+            break
+    else:
+        pytest.fail("降级的档位没有恢复")
+    assert not router.status()["text-plus"]["breaching"]
+
+
+def test_expired_samples_end_degradation(clock):
+    router = make_router()
+    for _ in range(MIN_SAMPLES):
+        router.observe(router.tiers["text-plus"], 3.0)
+    assert router.route("你好", False).reason == "degraded"
+
+    clock.now += WINDOW + 1
+    assert router.route("你好", False).reason == "rule"
+
+
+def test_stream_completion_reports_upstream_ttft_without_queue_wait():
+    httpx = pytest.importorskip("httpx")
+    from app.services import qwen_vl
+
+    queue_wait = 0.3
+    upstream_ttft = 0.05
+
+    async def handler(request):
+        await asyncio.sleep(upstream_ttft)
+        chunk = {"choices": [{"delta": {"content": "你好"}}]}
+        return httpx.Response(200, content=f"data: {json.dumps(chunk)}\n\ndata: [DONE]\n\n".encode())
+
+    async def run():
+        service = qwen_vl.QwenVLService()
+        service.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        service._slots = asyncio.Semaphore(1)
+        observed = []
+
+        async def hold_slot():
+            async with service._slots:
+                await asyncio.sleep(queue_wait)
+
+        holder = asyncio.create_task(hold_slot())
+        await asyncio.sleep(0)
+        request = qwen_vl.CompletionRequest(model="qwen-plus", messages=[{"role": "user", "content": "你好"}])
+        chunks = [chunk.content async for chunk in service.stream_completion(request, on_ttft=observed.append)]
+        await holder
+        await service.client.aclose()
+        return chunks, observed
+
+    chunks, observed = asyncio.run(run())
+    assert chunks == ["你好"]
+    assert len(observed) == 1
+    assert upstream_ttft <= observed[0] < queue_wait
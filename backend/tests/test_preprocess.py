@@ -0,0 +1,107 @@
+"""上传时的预处理：发送消息时复用同一上传的结果，配置共享状态时其他工作进程也能复用"""
+import asyncio
+import io
+
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.core.shared_state import SharedState  # noqa: E402
+from app.services import preprocess, storage  # noqa: E402
+
+MODEL = "qwen-vl-plus"
+
+
+class FakeSharedStore:
+    """模拟 Redis：多个 SharedState 共用同一份数据"""
+
+    shared = True
+
+    def __init__(self):
+        self.values = {}
+
+    async def get(self, key):
+        return self.values.get(key)
+
+    async def set(self, key, value, ttl):
+        self.values[key] = value
+
+    async def close(self):
+        pass
+
+
+@pytest.fixture
+def upload(tmp_path, monkeypatch):
+    """一张已上传的图片，返回 (文件名, 内容)"""
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(preprocess, "PREPROCESS_WARM_UPSTREAM", False)
+    buffer = io.BytesIO()
+    Image.new("RGB", (256, 256), "orange").save(buffer, "PNG")
+    filename = f"{0:064x}.png"
+    (tmp_path / filename).write_bytes(buffer.getvalue())
+    return filename, buffer.getvalue()
+
+
+@pytest.fixture
+def prepare_calls(monkeypatch):
+    calls = []
+    prepare_image = preprocess.prepare_image
+
+    async def counting_prepare(image_data, model):
+        calls.append(model)
+        return await prepare_image(image_data, model)
+
+    async def no_fetch(image_url):
+        raise AssertionError("预处理过的图片不应重新下载")
+
+    monkeypatch.setattr(preprocess, "prepare_image", counting_prepare)
+    monkeypatch.setattr(preprocess, "fetch_image", no_fetch)
+    return calls
+
+
+def test_second_request_reuses_prepared_image(upload, prepare_calls, monkeypatch):
+    filename, content = upload
+    preprocessor = preprocess.SpeculativePreprocessor()
+    monkeypatch.setattr(preprocess, "speculative_preprocessor", preprocessor)
+
+    async def run():
+        preprocessor.schedule(filename, content, MODEL)
+        # 预处理进行中和完成后的请求都复用同一个结果
+        first = await preprocess.load_image(storage.upload_url(filename), MODEL)
+        second = await preprocess.load_image(storage.upload_url(filename), MODEL)
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert prepare_calls == [MODEL]
+
+
+def test_other_worker_reuses_prepared_image(upload, prepare_calls):
+    filename, content = upload
+    store = FakeSharedStore()
+    uploader = preprocess.SpeculativePreprocessor(state=SharedState(store))
+    sender = preprocess.SpeculativePreprocessor(state=SharedState(store))
+
+    async def run():
+        uploader.schedule(filename, content, MODEL)
+        prepared = await uploader.get(storage.upload_url(filename), MODEL)
+        await asyncio.gather(*uploader._tasks)
+        assert await sender.has(storage.upload_url(filename), MODEL)
+        return prepared, await sender.get(storage.upload_url(filename), MODEL)
+
+    prepared, reused = asyncio.run(run())
+    assert reused == prepared
+    assert prepare_calls == [MODEL]
+
+
+def test_without_shared_state_other_workers_miss(upload, prepare_calls):
+    filename, content = upload
+    uploader = preprocess.SpeculativePreprocessor()
+    sender = preprocess.SpeculativePreprocessor()
+
+    async def run():
+        uploader.schedule(filename, content, MODEL)
+        await uploader.get(storage.upload_url(filename), MODEL)
+        return await sender.get(storage.upload_url(filename), MODEL)
+
+    assert asyncio.run(run()) is None
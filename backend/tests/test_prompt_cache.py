@@ -0,0 +1,46 @@
+from app.services.prompt_cache import PromptCache, same_entities
+
+
+def make_cache(**options) -> PromptCache:
+    cache = PromptCache(enabled=True, **options)
+    cache.store("北京今天天气怎么样？", "北京晴")
+    return cache
+
+
+def test_exact_match_after_normalization():
+    cache = make_cache()
+    hit = cache.lookup("北京今天天气怎么样啊")
+    assert hit is not None and hit.answer == "北京晴"
+    assert cache.lookup("  北京今天天气怎么样 ") is not None
+
+
+def test_entity_swapped_prompts_miss():
+    cache = make_cache()
+    assert cache.lookup("南京今天天气怎么样？") is None
+    assert cache.lookup("上海今天天气怎么样？") is None
+
+
+def test_entity_swapped_prompts_miss_with_fuzzy_matching():
+    cache = make_cache(threshold=0.7)
+    assert cache.lookup("南京今天天气怎么样？") is None
+    assert cache.lookup("上海今天天气怎么样？") is None
+
+
+def test_number_changes_miss_with_fuzzy_matching():
+    cache = PromptCache(enabled=True, threshold=0.7)
+    cache.store("1加1等于几", "2")
+    assert cache.lookup("1加2等于几") is None
+    assert cache.lookup("11加1等于几") is None
+
+
+def test_fuzzy_matching_allows_function_word_differences():
+    cache = PromptCache(enabled=True, threshold=0.7)
+    cache.store("介绍一下你自己", "我是助手")
+    hit = cache.lookup("请介绍一下你自己")
+    assert hit is not None and hit.answer == "我是助手"
+
+
+def test_same_entities():
+    assert same_entities("今天天气怎么样", "今天的天气怎么样")
+    assert not same_entities("北京今天天气怎么样", "南京今天天气怎么样")
+    assert not same_entities("python怎么读取文件", "python怎么写入文件")
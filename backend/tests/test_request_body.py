@@ -0,0 +1,79 @@
+"""流式JSON请求体与一次性序列化的结果一致"""
+import asyncio
+import base64
+import json
+import os
+
+import pytest
+
+from app.services.image_processing import EncodedImage
+from app.services.model_router import ModelTier
+from app.services.qwen_vl import build_image_request
+from app.services.request_body import CHUNK_SIZE, StreamingJSONBody, new_placeholder
+
+PLACEHOLDER = new_placeholder()
+PAYLOAD = {"model": "qwen-vl", "messages": [{"role": "user", "content": [
+    {"type": "text", "text": "描述图片"},
+    {"type": "image_url", "image_url": {"url": PLACEHOLDER}},
+]}]}
+
+
+async def collect(body: StreamingJSONBody) -> bytes:
+    return b"".join([chunk async for chunk in body])
+
+
+def expected_body(image: bytes) -> bytes:
+    url = f"data:image/jpeg;base64,{base64.b64encode(image).decode()}"
+    return json.dumps(PAYLOAD, ensure_ascii=False).replace(PLACEHOLDER, url).encode("utf-8")
+
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE - 1, CHUNK_SIZE, 2 * CHUNK_SIZE + 5])
+def test_streamed_body_matches_serialized_json(tmp_path, size):
+    image = os.urandom(size)
+    path = tmp_path / "image.jpg"
+    path.write_bytes(image)
+    for source in (memoryview(image), str(path)):
+        body = StreamingJSONBody(PAYLOAD, source, "image/jpeg", PLACEHOLDER)
+        data = asyncio.run(collect(body))
+        assert data == expected_body(image)
+        assert body.content_length == len(data)
+
+
+def test_file_reads_run_off_the_event_loop(tmp_path, monkeypatch):
+    path = tmp_path / "image.jpg"
+    path.write_bytes(os.urandom(3 * CHUNK_SIZE))
+    offloaded = []
+    to_thread = asyncio.to_thread
+
+    async def record(func, *args):
+        offloaded.append(getattr(func, "__name__", func))
+        return await to_thread(func, *args)
+
+    monkeypatch.setattr(asyncio, "to_thread", record)
+    asyncio.run(collect(StreamingJSONBody(PAYLOAD, str(path), "image/jpeg", PLACEHOLDER)))
+    # 打开文件，3 次读取和 1 次读到文件末尾
+    assert offloaded == ["open"] + ["_read_encoded"] * 4
+
+
+def test_prompt_cannot_collide_with_placeholder():
+    image = EncodedImage(data=os.urandom(100), mime_type="image/jpeg", width=10, height=10, original_bytes=100)
+    tier = ModelTier("vl-plus", "qwen-vl-plus", vision=True)
+    # 用户输入旧的固定占位符或上一个请求的占位符都只是普通文本
+    previous = build_image_request(image, "描述图片", tier).image_placeholder
+    prompt = f"__QWEN_IMAGE_DATA_URL__ {previous}"
+    request = build_image_request(image, prompt, tier)
+    assert request.image_placeholder != previous
+
+    body = StreamingJSONBody(request.payload(True), image.data, image.mime_type, request.image_placeholder)
+    sent = json.loads(asyncio.run(collect(body)))
+    content = sent["messages"][-1]["content"]
+    assert content[0]["text"] == prompt
+    assert content[1]["image_url"]["url"] == f"data:image/jpeg;base64,{base64.b64encode(image.data).decode()}"
+
+
+def test_placeholder_must_appear_exactly_once():
+    payload = {"messages": [PLACEHOLDER, PLACEHOLDER]}
+    with pytest.raises(ValueError):
+        StreamingJSONBody(payload, b"", "image/jpeg", PLACEHOLDER)
+    with pytest.raises(ValueError):
+        StreamingJSONBody({"messages": []}, b"", "image/jpeg", PLACEHOLDER)
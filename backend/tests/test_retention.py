@@ -0,0 +1,72 @@
+"""过期会话清理：只删除删除时仍然过期的会话，只为实际删除的会话记录删除记录"""
+from datetime import datetime, timedelta
+
+import pytest
+
+pytest.importorskip("sqlalchemy")
+
+from sqlalchemy import create_engine, event, select, update  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from app.core.ids import new_id  # noqa: E402
+from app.models import Base, ChatSession, User  # noqa: E402
+from app.models.session_tombstone import SessionTombstone  # noqa: E402
+from app.services import retention  # noqa: E402
+
+RETENTION_DAYS = 30
+
+
+@pytest.fixture
+def factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'retention.db'}")
+
+    @event.listens_for(engine, "connect")
+    def enable_foreign_keys(dbapi_connection, _):
+        dbapi_connection.execute("PRAGMA foreign_keys=ON")
+
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def add_sessions(factory, *ages_in_days):
+    now = datetime.utcnow()
+    ids = [new_id() for _ in ages_in_days]
+    with factory() as db:
+        db.add(User(id=1, username="retention", email="retention@example.com", hashed_password="x"))
+        for session_id, age in zip(ids, ages_in_days):
+            db.add(ChatSession(id=session_id, user_id=1, title="会话", created_at=now - timedelta(days=age)))
+        db.commit()
+    return ids
+
+
+def state(factory):
+    with factory() as db:
+        return set(db.scalars(select(ChatSession.id))), set(db.scalars(select(SessionTombstone.session_id)))
+
+
+def test_sweep_deletes_only_expired_sessions(factory):
+    expired, recent = add_sessions(factory, RETENTION_DAYS + 1, 1)
+    sweeper = retention.RetentionSweeper(factory, retention_days=RETENTION_DAYS, batch_pause=0)
+    cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+
+    assert sweeper._purge_batch(cutoff) == (1, set())
+    assert state(factory) == ({recent}, {expired})
+
+
+def test_session_updated_after_selection_is_kept(factory, monkeypatch):
+    expired, written = add_sessions(factory, RETENTION_DAYS + 1, RETENTION_DAYS + 1)
+    select_filenames = retention.session_upload_filenames
+
+    def write_during_purge(db, session_ids):
+        # 选出过期会话之后、删除之前，用户又在其中一个会话发了消息
+        db.execute(update(ChatSession).where(ChatSession.id == written).values(updated_at=datetime.utcnow()))
+        return select_filenames(db, session_ids)
+
+    monkeypatch.setattr(retention, "session_upload_filenames", write_during_purge)
+    sweeper = retention.RetentionSweeper(factory, retention_days=RETENTION_DAYS, batch_pause=0)
+    cutoff = datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+
+    purged, _ = sweeper._purge_batch(cutoff)
+    assert purged == 1
+    assert state(factory) == ({written}, {expired})
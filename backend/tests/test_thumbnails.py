@@ -0,0 +1,48 @@
+"""缩略图按宽度生成且不放大，srcset 的 w 描述符即实际宽度"""
+import pytest
+
+Image = pytest.importorskip("PIL.Image")
+
+from app.services import storage, thumbnails  # noqa: E402
+from app.services.image_processing import (  # noqa: E402
+    VARIANT_WIDTHS, WEBP_MAX_DIMENSION, render_variant, variant_size
+)
+
+
+def render(tmp_path, size, width):
+    source = tmp_path / "source.png"
+    Image.new("RGB", size, "orange").save(source)
+    dest = tmp_path / f"source_w{width}.webp"
+    render_variant(str(source), str(dest), width)
+    with Image.open(dest) as variant:
+        return variant.size
+
+
+@pytest.mark.parametrize("size", [(2000, 3000), (3000, 800)], ids=["portrait", "landscape"])
+def test_variants_have_the_advertised_width(tmp_path, size):
+    for width in VARIANT_WIDTHS:
+        variant_width, variant_height = render(tmp_path, size, width)
+        assert variant_width == width
+        assert abs(variant_height - size[1] * width / size[0]) <= 1
+
+
+def test_small_images_are_not_upscaled(tmp_path):
+    assert render(tmp_path, (300, 200), 1024) == (300, 200)
+
+
+def test_tall_images_stay_within_webp_limit(tmp_path):
+    width, height = render(tmp_path, (100, 3000), 1024)
+    assert (width, height) == (100, 3000)
+    # 宽度缩放后高度超出 WebP 上限时按上限缩小
+    assert variant_size(1024, 40000, 1024) == (419, WEBP_MAX_DIMENSION)
+
+
+def test_variant_widths_only_list_widths_up_to_the_original(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "UPLOAD_DIR", str(tmp_path))
+    thumbnails._available_widths.cache_clear()
+    Image.new("RGB", (600, 400), "orange").save(tmp_path / f"{0:064x}.png")
+
+    assert thumbnails.variant_widths(storage.upload_url(f"{0:064x}.png")) == (128, 512)
+    assert thumbnails.variant_widths("https://example.com/a.png") == ()
+    assert thumbnails.variant_widths(storage.upload_url(f"{1:064x}.png")) == ()
+    thumbnails._available_widths.cache_clear()
@@ -7,7 +7,9 @@ export interface Message {
   type: 'user' | 'bot'
   timestamp: Date
   imageUrl?: string
+  imageSrc?: string // 带签名的图片访问URL
   imageFile?: File
+  imageVariants?: Record<string, string> // 缩略图尺寸 -> URL
 }
 
 export interface ChatSession {
@@ -18,6 +20,21 @@ export interface ChatSession {
   updatedAt: Date
 }
 
+export interface SearchResult {
+  messageId: string
+  sessionId: string
+  sessionTitle: string
+  type: 'user' | 'bot'
+  snippet: string // 已转义的HTML，关键词用<mark>标出
+  timestamp: Date
+  score: number
+}
+
+export interface SearchPage {
+  results: SearchResult[]
+  hasMore: boolean
+}
+
 export const useChatStore = defineStore('chat', () => {
   const currentSession = ref<ChatSession | null>(null)
   const sessions = ref<ChatSession[]>([])
@@ -114,42 +131,60 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  // 会话列表的ETag和增量同步令牌
+  const sessionsEtag = ref<string | null>(null)
+  const syncToken = ref<string | null>(null)
+
+  const mapSession = (session: any): ChatSession => ({
+    ...session,
+    createdAt: new Date(session.created_at),
+    updatedAt: new Date(session.updated_at || session.created_at),
+    messages: session.messages.map((msg: any) => {
+      const mappedMsg = {
+        ...msg,
+        timestamp: new Date(msg.timestamp),
+        // 字段名映射：后端使用下划线，前端使用驼峰
+        imageUrl: msg.image_url,
+        imageSrc: msg.image_src,
+        imageVariants: msg.image_variants,
+        imageFile: undefined, // 历史记录中没有File对象
+      }
+      // 调试信息：检查图片URL映射
+      if (msg.image_url) {
+        console.log(`消息 ${msg.id} 的图片URL映射:`, {
+          original: msg.image_url,
+          mapped: mappedMsg.imageUrl,
+        })
+      }
+      return mappedMsg
+    }),
+  })
+
   const loadSessions = async () => {
     try {
       console.log('正在加载用户会话...')
-      const response = await fetch('/api/chat/sessions', {
-        headers: {
-          Authorization: `Bearer ${localStorage.getItem('token')}`,
-        },
-      })
+      const headers: Record<string, string> = {
+        Authorization: `Bearer ${localStorage.getItem('token')}`,
+      }
+      if (sessionsEtag.value && sessions.value.length > 0) {
+        headers['If-None-Match'] = sessionsEtag.value
+      }
+      const response = await fetch('/api/chat/sessions', { headers })
+
+      if (response.status === 304) {
+        // 列表没有变化，沿用本地数据
+        syncToken.value = response.headers.get('X-Sync-Token') || syncToken.value
+        return
+      }
 
       if (response.ok) {
         const data = await response.json()
         console.log('加载到的会话数据:', data)
 
         // 后端直接返回会话数组，不是包装在sessions字段中
-        sessions.value = data.map((session: any) => ({
-          ...session,
-          createdAt: new Date(session.created_at),
-          updatedAt: new Date(session.updated_at),
-          messages: session.messages.map((msg: any) => {
-            const mappedMsg = {
-              ...msg,
-              timestamp: new Date(msg.timestamp),
-              // 字段名映射：后端使用下划线，前端使用驼峰
-              imageUrl: msg.image_url,
-              imageFile: undefined, // 历史记录中没有File对象
-            }
-            // 调试信息：检查图片URL映射
-            if (msg.image_url) {
-              console.log(`消息 ${msg.id} 的图片URL映射:`, {
-                original: msg.image_url,
-                mapped: mappedMsg.imageUrl,
-              })
-            }
-            return mappedMsg
-          }),
-        }))
+        sessions.value = data.map(mapSession)
+        sessionsEtag.value = response.headers.get('ETag')
+        syncToken.value = response.headers.get('X-Sync-Token')
 
         console.log('处理后的会话数据:', sessions.value)
       } else {
@@ -160,6 +195,55 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  // 增量刷新会话列表：只获取上次同步后新建、更新或删除的会话
+  const refreshSessions = async () => {
+    if (!syncToken.value || sessions.value.length === 0) {
+      return loadSessions()
+    }
+    try {
+      const params = new URLSearchParams({ since: syncToken.value })
+      const response = await fetch(`/api/chat/sessions/changes?${params}`, {
+        headers: {
+          Authorization: `Bearer ${localStorage.getItem('token')}`,
+        },
+      })
+      if (response.status === 400 || response.status === 410) {
+        // 令牌无效或已过期，改为全量加载
+        syncToken.value = null
+        sessionsEtag.value = null
+        return loadSessions()
+      }
+      if (!response.ok) {
+        console.error('同步会话失败:', response.status, response.statusText)
+        return
+      }
+
+      const data = await response.json()
+      const deleted = new Set<string>(data.deleted)
+      const changed = new Map<string, ChatSession>(
+        data.sessions.map((session: any) => [session.id, mapSession(session)]),
+      )
+      const merged = sessions.value
+        .filter((s) => !s.id || (!deleted.has(s.id) && !changed.has(s.id)))
+        .concat([...changed.values()].filter((s) => !deleted.has(s.id)))
+      merged.sort((a, b) => b.updatedAt.getTime() - a.updatedAt.getTime())
+      sessions.value = merged
+      syncToken.value = data.token
+      // 本地列表已与服务端一致，下次全量请求需重新校验
+      sessionsEtag.value = null
+
+      if (currentSession.value?.id) {
+        if (deleted.has(currentSession.value.id)) {
+          currentSession.value = null
+        } else if (changed.has(currentSession.value.id)) {
+          currentSession.value = changed.get(currentSession.value.id)!
+        }
+      }
+    } catch (error) {
+      console.error('同步会话失败:', error)
+    }
+  }
+
   const saveSession = async (session: ChatSession) => {
     try {
       // TODO: 保存会话到后端
@@ -195,9 +279,36 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  const searchMessages = async (query: string, page = 1): Promise<SearchPage> => {
+    const params = new URLSearchParams({ q: query, page: String(page) })
+    const response = await fetch(`/api/chat/search?${params}`, {
+      headers: {
+        Authorization: `Bearer ${localStorage.getItem('token')}`,
+      },
+    })
+    if (!response.ok) {
+      throw new Error(`搜索失败: ${response.status}`)
+    }
+    const data = await response.json()
+    return {
+      hasMore: data.has_more,
+      results: data.results.map((item: any) => ({
+        messageId: item.message_id,
+        sessionId: item.session_id,
+        sessionTitle: item.session_title,
+        type: item.type,
+        snippet: item.snippet,
+        timestamp: new Date(item.timestamp),
+        score: item.score,
+      })),
+    }
+  }
+
   const clearAllData = () => {
     currentSession.value = null
     sessions.value = []
+    sessionsEtag.value = null
+    syncToken.value = null
     isLoading.value = false
   }
 
@@ -211,8 +322,10 @@ export const useChatStore = defineStore('chat', () => {
     updateStreamingMessage,
     updateLastMessage,
     loadSessions,
+    refreshSessions,
     saveSession,
     deleteSession,
+    searchMessages,
     clearAllData,
   }
 })
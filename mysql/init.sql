@@ -1,45 +1,5 @@
 -- 创建数据库（如果不存在）
 CREATE DATABASE IF NOT EXISTS chatbot_db CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 
--- 使用数据库
-USE chatbot_db;
-
--- 创建用户表
-CREATE TABLE IF NOT EXISTS users (
-    id INT AUTO_INCREMENT PRIMARY KEY,
-    username VARCHAR(50) UNIQUE NOT NULL,
-    email VARCHAR(100) UNIQUE NOT NULL,
-    hashed_password VARCHAR(255) NOT NULL,
-    is_active BOOLEAN DEFAULT TRUE,
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
-);
-
--- 创建聊天会话表
-CREATE TABLE IF NOT EXISTS chat_sessions (
-    id VARCHAR(50) PRIMARY KEY,
-    user_id INT NOT NULL,
-    title VARCHAR(255) DEFAULT '新对话',
-    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-);
-
--- 创建消息表
-CREATE TABLE IF NOT EXISTS messages (
-    id VARCHAR(50) PRIMARY KEY,
-    chat_session_id VARCHAR(50) NOT NULL,
-    content TEXT,
-    type ENUM('user', 'bot') NOT NULL,
-    image_url VARCHAR(500),
-    image_path VARCHAR(500),
-    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    FOREIGN KEY (chat_session_id) REFERENCES chat_sessions(id) ON DELETE CASCADE
-);
-
--- 创建索引
-CREATE INDEX idx_users_username ON users(username);
-CREATE INDEX idx_users_email ON users(email);
-CREATE INDEX idx_chat_sessions_user_id ON chat_sessions(user_id);
-CREATE INDEX idx_messages_session_id ON messages(session_id);
-CREATE INDEX idx_messages_created_at ON messages(created_at);
+-- 表结构和索引由 backend/migrations 中的 Alembic 迁移维护（alembic upgrade head），
+-- 以 SQLAlchemy 模型为唯一来源，这里只负责创建数据库
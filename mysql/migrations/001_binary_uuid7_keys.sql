@@ -0,0 +1,39 @@
+-- 会话和消息主键从 VARCHAR(50) 迁移为 BINARY(16)
+-- 旧的UUIDv4原样转换为16字节（仍是合法UUID），新ID由应用按UUIDv7生成
+-- 接口层仍然收发标准UUID字符串，客户端无感知
+-- `alembic upgrade head`（docker-compose 启动时执行）会在没有迁移记录的旧库上自动完成同样的转换，
+-- 此脚本只用于需要单独执行转换的场合
+
+USE chatbot_db;
+
+-- 1. 解除外键，准备替换被引用的主键
+ALTER TABLE messages DROP FOREIGN KEY messages_ibfk_1;
+
+-- 2. 会话表：新增二进制列并回填
+ALTER TABLE chat_sessions ADD COLUMN id_bin BINARY(16) NULL FIRST;
+UPDATE chat_sessions SET id_bin = UNHEX(REPLACE(id, '-', ''));
+ALTER TABLE chat_sessions
+    DROP PRIMARY KEY,
+    DROP COLUMN id,
+    CHANGE id_bin id BINARY(16) NOT NULL,
+    ADD PRIMARY KEY (id);
+
+-- 3. 消息表：主键和外键列同样替换
+ALTER TABLE messages
+    ADD COLUMN id_bin BINARY(16) NULL FIRST,
+    ADD COLUMN chat_session_id_bin BINARY(16) NULL AFTER id_bin;
+UPDATE messages SET
+    id_bin = UNHEX(REPLACE(id, '-', '')),
+    chat_session_id_bin = UNHEX(REPLACE(chat_session_id, '-', ''));
+ALTER TABLE messages
+    DROP PRIMARY KEY,
+    DROP COLUMN id,
+    DROP COLUMN chat_session_id,
+    CHANGE id_bin id BINARY(16) NOT NULL,
+    CHANGE chat_session_id_bin chat_session_id BINARY(16) NOT NULL,
+    ADD PRIMARY KEY (id);
+
+-- 4. 恢复外键
+ALTER TABLE messages
+    ADD CONSTRAINT messages_ibfk_1 FOREIGN KEY (chat_session_id)
+    REFERENCES chat_sessions(id) ON DELETE CASCADE;
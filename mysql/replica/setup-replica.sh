@@ -0,0 +1,28 @@
+#!/bin/bash
+# 只读副本初始化（docker-compose.replica.yml 使用，仅用于本地测试）：
+# 从主库导出全部数据，再以GTID自动定位开始复制
+set -e
+
+until mysqladmin ping -h mysql -uroot -p"$MYSQL_ROOT_PASSWORD" --silent; do
+  echo "等待主库就绪..."
+  sleep 2
+done
+
+mysqldump -h mysql -uroot -p"$MYSQL_ROOT_PASSWORD" \
+  --all-databases --single-transaction --set-gtid-purged=ON \
+  --triggers --routines --events > /tmp/primary.sql
+
+mysql -uroot -p"$MYSQL_ROOT_PASSWORD" -e "RESET MASTER"
+mysql -uroot -p"$MYSQL_ROOT_PASSWORD" < /tmp/primary.sql
+rm -f /tmp/primary.sql
+
+mysql -uroot -p"$MYSQL_ROOT_PASSWORD" <<SQL
+CHANGE REPLICATION SOURCE TO
+  SOURCE_HOST='mysql',
+  SOURCE_PORT=3306,
+  SOURCE_USER='root',
+  SOURCE_PASSWORD='${MYSQL_ROOT_PASSWORD}',
+  SOURCE_AUTO_POSITION=1,
+  GET_SOURCE_PUBLIC_KEY=1;
+START REPLICA;
+SQL